@@ -2,6 +2,10 @@
 ASGI config for rest project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn rest.asgi:application``) so the
+``/api/events`` stream holds connections without tying up a thread each, and
+the async login/register views wait on the password hashing pool
+(``restaurant.hashing``) instead of blocking the threads sync views run on.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +16,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rest.settings')
+# Read by rest.settings: no persistent database connections under ASGI
+os.environ.setdefault('RESTAURANT_ASGI', '1')
 
 application = get_asgi_application()
+
+# Keep the ETA model warm off the request path (restaurant.eta)
+from restaurant import eta  # noqa: E402
+
+eta.model.start_warmer()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,10 +43,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'restaurant.sessions.RoleSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'restaurant.roles.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,14 +75,66 @@ WSGI_APPLICATION = 'rest.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuned for concurrent order writes: WAL so reads never wait for the
+# writer, IMMEDIATE transactions queued on an in-process writer gate
+# (restaurant/sqlite/base.py), a 20 s busy timeout for writers from other
+# processes, and persistent connections under WSGI so the pragmas run once
+# per connection rather than once per request. Under ASGI each request runs
+# in its own context and never reuses a kept connection, so they would only
+# pile up: rest/asgi.py sets RESTAURANT_ASGI and connections close after
+# every request there.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'restaurant.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 0 if os.environ.get('RESTAURANT_ASGI') else 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Version counters for the in-process menu, BOM, voucher and catalog caches
+# live here. LocMemCache is per process: a bump made in one worker never
+# reaches the others. Those workers only pick up the change when their own
+# copies age out:
+# - menu snapshot and BOM: 30 s (MENU_SNAPSHOT_MAX_AGE, BOM_MAX_AGE)
+# - voucher lookups, the code filter and the catalog: 60 s
+# With several worker processes, use a shared backend (Redis, Memcached) so
+# that a change invalidates every worker at once.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+# Cache-first sessions that write django_session only when the data changes,
+# and signed-cookie sessions (no database access) for these roles; see
+# restaurant.sessions. A signed cookie cannot be revoked at logout, so roles
+# that may move any order (staff, admin) stay server-side. Run
+# `manage.py purge_sessions` from cron.
+
+SESSION_ENGINE = 'restaurant.sessions'
+RESTAURANT_COOKIE_SESSION_ROLES = ('customer', 'rider', 'chef')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -99,6 +153,9 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Email, phone or username login with indexed lookups (restaurant.backends)
+AUTHENTICATION_BACKENDS = ['restaurant.backends.IdentifierBackend']
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -121,3 +178,15 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Restaurant
+# Delivery fee charged by the server-side pricing engine (restaurant.pricing)
+RESTAURANT_DELIVERY_FEE = '30.00'
+# Kitchen (lat, lng): where multi-drop delivery routes start (restaurant.batching)
+RESTAURANT_LOCATION = (13.7563, 100.5018)
+# Password hashing pool for the async login/register views (restaurant.hashing):
+# worker threads (one per core leaves the others' requests a fair share of CPU),
+# and how many hashes may queue before logins get a 503
+RESTAURANT_HASH_WORKERS = min(4, os.cpu_count() or 1)
+RESTAURANT_HASH_QUEUE = 8
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rest.settings')
 
 application = get_wsgi_application()
+
+# Keep the ETA model warm off the request path (restaurant.eta)
+from restaurant import eta  # noqa: E402
+
+eta.model.start_warmer()
@@ -26,8 +26,8 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(models.MenuItem)
 class MenuItemAdmin(admin.ModelAdmin):
-	list_display = ("name", "category", "price", "available", "featured")
-	list_filter = ("available", "featured", "category")
+	list_display = ("name", "category", "price", "available", "in_stock", "featured")
+	list_filter = ("available", "in_stock", "featured", "category")
 	search_fields = ("name", "description")
 
 
@@ -39,8 +39,8 @@ class IngredientUsageAdmin(admin.ModelAdmin):
 
 @admin.register(models.FoodSet)
 class FoodSetAdmin(admin.ModelAdmin):
-	list_display = ("name", "price", "active")
-	list_filter = ("active",)
+	list_display = ("name", "price", "active", "in_stock")
+	list_filter = ("active", "in_stock")
 	search_fields = ("name",)
 
 
@@ -52,11 +52,18 @@ class SetItemAdmin(admin.ModelAdmin):
 
 @admin.register(models.Voucher)
 class VoucherAdmin(admin.ModelAdmin):
-	list_display = ("code", "discount_type", "amount", "min_spend", "max_discount", "active", "used_count", "usage_limit")
-	list_filter = ("discount_type", "active")
+	list_display = ("code", "discount_type", "amount", "min_spend", "max_discount", "active", "is_public", "used_count", "usage_limit")
+	list_filter = ("discount_type", "active", "is_public")
 	search_fields = ("code",)
 
 
+@admin.register(models.VoucherRedemption)
+class VoucherRedemptionAdmin(admin.ModelAdmin):
+	list_display = ("voucher", "user", "order", "discount_amount", "created_at")
+	list_filter = ("voucher",)
+	search_fields = ("voucher__code", "user__username", "order__id")
+
+
 @admin.register(models.Address)
 class AddressAdmin(admin.ModelAdmin):
 	list_display = ("user", "line1", "city", "postcode", "is_default")
@@ -103,6 +110,46 @@ class InventoryTransactionAdmin(admin.ModelAdmin):
 	search_fields = ("ingredient__name",)
 
 
+@admin.register(models.StockCheckpoint)
+class StockCheckpointAdmin(admin.ModelAdmin):
+	list_display = ("ingredient", "taken_at", "stock_quantity")
+	list_filter = ("ingredient",)
+	date_hierarchy = "taken_at"
+
+
+@admin.register(models.RiderLocation)
+class RiderLocationAdmin(admin.ModelAdmin):
+	list_display = ("order", "rider", "lat", "lng", "recorded_at")
+	list_filter = ("rider",)
+	date_hierarchy = "recorded_at"
+
+
+@admin.register(models.OrderStatusEvent)
+class OrderStatusEventAdmin(admin.ModelAdmin):
+	list_display = ("order", "from_status", "to_status", "order_type", "duration_seconds", "created_at")
+	list_filter = ("to_status", "order_type")
+	date_hierarchy = "created_at"
+
+	# The log is append-only
+	def has_change_permission(self, request, obj=None):
+		return False
+
+	def has_delete_permission(self, request, obj=None):
+		return False
+
+
+@admin.register(models.SyncChange)
+class SyncChangeAdmin(admin.ModelAdmin):
+	list_display = ("id", "entity", "object_id", "op", "scope", "owner", "created_at")
+	list_filter = ("entity", "op", "scope")
+
+
+@admin.register(models.RowCounter)
+class RowCounterAdmin(admin.ModelAdmin):
+	list_display = ("key", "value", "synced_at")
+	search_fields = ("key",)
+
+
 # Attach Profile inline to Django's built-in User admin for full CRUD from one place
 class ProfileInline(admin.StackedInline):
 	model = models.Profile
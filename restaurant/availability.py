@@ -0,0 +1,93 @@
+"""
+Stock-derived menu availability.
+
+``MenuItem.in_stock`` is true while every ingredient the item uses is active
+and has at least one portion's worth of stock; ``FoodSet.in_stock`` is true
+while every component item is in stock. The flags are maintained
+incrementally: a stock movement re-evaluates only the items that use the
+touched ingredients (via the reverse index on the bill of materials) and the
+sets containing those items, and writes only the flags that actually flip.
+A flip bumps the menu and catalog versions so pricing, ``/api/menu/availability``
+and ``/api/catalog`` see it.
+
+The manual ``MenuItem.available`` / ``FoodSet.active`` switches are left
+alone; a row is sellable when both its manual switch and ``in_stock`` are on.
+"""
+from . import changelog
+from .catalog import bump_catalog_version
+from .inventory import get_bom
+from .models import FoodSet, Ingredient, MenuItem
+from .pricing import bump_menu_version, get_snapshot
+
+
+def _apply_flags(model, desired):
+	"""Write ``{pk: in_stock}`` for rows whose flag differs; returns flipped pks."""
+	if not desired:
+		return set()
+	current = dict(model.objects.filter(pk__in=desired).values_list('id', 'in_stock'))
+	turn_on = [pk for pk, ok in desired.items() if pk in current and ok and not current[pk]]
+	turn_off = [pk for pk, ok in desired.items() if pk in current and not ok and current[pk]]
+	if turn_on:
+		model.objects.filter(pk__in=turn_on).update(in_stock=True)
+	if turn_off:
+		model.objects.filter(pk__in=turn_off).update(in_stock=False)
+	flipped = set(turn_on) | set(turn_off)
+	changelog.record(changelog.synced_models()[model], sorted(flipped))
+	return flipped
+
+
+def refresh_availability(ingredient_ids=(), menu_item_ids=(), food_set_ids=()):
+	"""
+	Re-evaluate the rows that depend on the given ingredients, items or sets.
+
+	Returns ``(flipped_menu_item_ids, flipped_food_set_ids)``.
+	"""
+	bom = get_bom()
+	items = set(menu_item_ids)
+	for ingredient_id in ingredient_ids:
+		items |= bom.ingredient_items.get(ingredient_id, set())
+
+	flipped_items = set()
+	if items:
+		needed = set()
+		for menu_item_id in items:
+			needed |= bom.items.get(menu_item_id, {}).keys()
+		stock = {
+			pk: (qty if active else 0.0)
+			for pk, qty, active in Ingredient.objects.filter(pk__in=needed).values_list('id', 'stock_quantity', 'active')
+		}
+		desired = {
+			menu_item_id: all(stock.get(ing, 0.0) >= per_unit for ing, per_unit in bom.items.get(menu_item_id, {}).items())
+			for menu_item_id in items
+		}
+		flipped_items = _apply_flags(MenuItem, desired)
+
+	sets = set(food_set_ids)
+	for menu_item_id in flipped_items:
+		sets |= bom.item_sets.get(menu_item_id, set())
+	flipped_sets = set()
+	if sets:
+		components = set()
+		for set_id in sets:
+			components.update(bom.set_items.get(set_id, ()))
+		in_stock = dict(MenuItem.objects.filter(pk__in=components).values_list('id', 'in_stock'))
+		desired = {
+			set_id: all(in_stock.get(mid, False) for mid in bom.set_items.get(set_id, ()))
+			for set_id in sets
+		}
+		flipped_sets = _apply_flags(FoodSet, desired)
+
+	if flipped_items or flipped_sets:
+		bump_menu_version()
+		bump_catalog_version()
+	return flipped_items, flipped_sets
+
+
+def sellable_menu():
+	"""Current sellable item and set ids, straight from the menu snapshot."""
+	snap = get_snapshot()
+	return {
+		'version': snap.version,
+		'items': sorted(pk for pk, entry in snap.items.items() if entry.available),
+		'sets': sorted(pk for pk, entry in snap.sets.items() if entry.available),
+	}
@@ -0,0 +1,104 @@
+"""
+Login by email, phone or username.
+
+``IdentifierBackend`` resolves the identifier and loads the user together
+with its profile in one query, then checks the password. Each identifier
+kind hits an index:
+
+* email (contains ``@``): ``LOWER(auth_user.email)``, a functional index
+  added by migration 0017;
+* phone (all digits): ``restaurant_profile.phone``;
+* anything else: ``LOWER(auth_user.username)``, also from migration 0017.
+
+Usernames may themselves contain ``@`` or be all digits, so an email or
+phone lookup that finds nobody falls back to the username index.
+
+Lookups compare ``LOWER(column)`` with the lower-cased identifier so the
+planner can use those indexes; ``__iexact`` cannot. Unknown identifiers
+still run the password hasher once so response time does not reveal
+whether an account exists.
+
+``aauthenticate`` (used by the async login view) runs the password check on
+the hashing pool (``restaurant.hashing``) instead of the calling thread and
+lets ``hashing.Overloaded`` propagate so the view can shed the request.
+
+``get_user`` also joins the profile, so ``request.user.profile`` costs no
+extra query on authenticated requests.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+from . import hashing
+
+BACKEND = 'restaurant.backends.IdentifierBackend'
+
+
+def identifier_filter(identifier: str) -> dict:
+	"""Filter kwargs for a ``User`` queryset aliased with ``email_lower``/``username_lower``."""
+	if '@' in identifier:
+		return {'email_lower': identifier.lower()}
+	if identifier.isdigit():
+		return {'profile__phone': identifier}
+	return {'username_lower': identifier.lower()}
+
+
+def resolve_user(identifier: str):
+	"""The user (profile joined) for an email, phone or username, or ``None``."""
+	identifier = (identifier or '').strip()
+	if not identifier:
+		return None
+	users = (
+		get_user_model()._default_manager
+		.select_related('profile')
+		.alias(email_lower=Lower('email'), username_lower=Lower('username'))
+		.order_by('pk')
+	)
+	lookup = identifier_filter(identifier)
+	# Emails are not unique; the oldest account wins, as with a plain .first()
+	user = next(iter(users.filter(**lookup)[:1]), None)
+	if user is None and 'username_lower' not in lookup:
+		user = next(iter(users.filter(username_lower=identifier.lower())[:1]), None)
+	return user
+
+
+class IdentifierBackend(ModelBackend):
+	def authenticate(self, request, username=None, password=None, **kwargs):
+		if username is None:
+			username = kwargs.get(get_user_model().USERNAME_FIELD)
+		if username is None or password is None:
+			return None
+		user = resolve_user(username)
+		if user is None:
+			# Same hashing cost as a real check (see ModelBackend.authenticate)
+			get_user_model()().set_password(password)
+			return None
+		if user.check_password(password) and self.user_can_authenticate(user):
+			return user
+		return None
+
+	async def aauthenticate(self, request, username=None, password=None, **kwargs):
+		if username is None:
+			username = kwargs.get(get_user_model().USERNAME_FIELD)
+		if username is None or password is None:
+			return None
+		user = await sync_to_async(resolve_user)(username)
+		if user is None:
+			await hashing.pool.run(hashing.hash_password, password)
+			return None
+		matches, rehash = await hashing.pool.run(hashing.verify, password, user.password)
+		if not matches or not self.user_can_authenticate(user):
+			return None
+		if rehash:
+			# Hasher settings moved on (e.g. more PBKDF2 iterations); best effort
+			try:
+				user.password = await hashing.pool.run(hashing.hash_password, password)
+			except hashing.Overloaded:
+				return user
+			await get_user_model()._default_manager.filter(pk=user.pk).aupdate(password=user.password)
+		return user
+
+	def get_user(self, user_id):
+		user = get_user_model()._default_manager.select_related('profile').filter(pk=user_id).first()
+		return user if user is not None and self.user_can_authenticate(user) else None
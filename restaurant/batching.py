@@ -0,0 +1,139 @@
+"""
+Multi-drop delivery batching.
+
+Ready delivery orders are grouped into runs a rider can take in one trip:
+starting from the order that has waited longest, a batch takes the nearest
+other orders within ``BATCH_RADIUS_KM`` of it that became ready within
+``BATCH_READY_WINDOW`` of it, up to ``BATCH_MAX_STOPS``. Neighbours are
+found through the same grid cells as ``restaurant.geo`` (bucketed in memory
+here), so grouping stays close to linear in the number of orders.
+
+Each batch's stops are ordered from the kitchen with nearest-neighbour and
+then improved with 2-opt; the route is open-ended since the rider does not
+have to come back. Batches are recomputed on request from the current open
+jobs; accepting one claims all of its orders atomically
+(``dispatch.claim_batch``).
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+
+from . import geo
+from .dispatch import open_jobs
+from .models import Order
+
+BATCH_RADIUS_KM = 2.0
+BATCH_READY_WINDOW = timedelta(minutes=10)
+BATCH_MAX_STOPS = 4
+
+
+@dataclass
+class Stop:
+	order_id: int
+	lat: float
+	lng: float
+	ready_at: object
+
+
+@dataclass
+class Batch:
+	stops: list
+	distance_km: float
+
+	@property
+	def order_ids(self):
+		return [s.order_id for s in self.stops]
+
+	@property
+	def key(self) -> str:
+		"""Stable id for the set of orders, whatever the route order."""
+		raw = ','.join(str(pk) for pk in sorted(self.order_ids))
+		return hashlib.blake2b(raw.encode('ascii'), digest_size=8).hexdigest()
+
+
+def kitchen_location():
+	return tuple(settings.RESTAURANT_LOCATION)
+
+
+def route_length(origin, stops) -> float:
+	total, here = 0.0, origin
+	for stop in stops:
+		total += geo.haversine_km(here[0], here[1], stop.lat, stop.lng)
+		here = (stop.lat, stop.lng)
+	return total
+
+
+def order_route(origin, stops):
+	"""Nearest-neighbour tour from ``origin`` through ``stops``, then 2-opt until no move helps."""
+	points = [origin] + [(s.lat, s.lng) for s in stops]
+	n = len(points)
+	dist = [[geo.haversine_km(a[0], a[1], b[0], b[1]) for b in points] for a in points]
+
+	tour, left = [0], set(range(1, n))
+	while left:
+		here = tour[-1]
+		nearest = min(left, key=lambda j: dist[here][j])
+		tour.append(nearest)
+		left.discard(nearest)
+
+	improved = True
+	while improved:
+		improved = False
+		for i in range(1, n - 1):
+			for j in range(i + 1, n):
+				# Reverse tour[i..j]; the tour is open, so past the end costs nothing
+				a, b = tour[i - 1], tour[i]
+				c = tour[j]
+				d = tour[j + 1] if j + 1 < n else None
+				before = dist[a][b] + (dist[c][d] if d is not None else 0.0)
+				after = dist[a][c] + (dist[b][d] if d is not None else 0.0)
+				if after < before - 1e-9:
+					tour[i:j + 1] = reversed(tour[i:j + 1])
+					improved = True
+	ordered = [stops[k - 1] for k in tour[1:]]
+	return ordered, sum(dist[tour[k]][tour[k + 1]] for k in range(n - 1))
+
+
+def build_batches(stops, origin=None, radius_km=BATCH_RADIUS_KM, window=BATCH_READY_WINDOW, max_stops=BATCH_MAX_STOPS):
+	"""Group ``stops`` into batches, longest-waiting first; every stop lands in exactly one batch."""
+	origin = origin or kitchen_location()
+	grid = {}
+	for stop in stops:
+		grid.setdefault(geo.grid_position(stop.lat, stop.lng), []).append(stop)
+
+	taken = set()
+	batches = []
+	for seed in sorted(stops, key=lambda s: (s.ready_at, s.order_id)):
+		if seed.order_id in taken:
+			continue
+		taken.add(seed.order_id)
+		row, col = geo.grid_position(seed.lat, seed.lng)
+		reach_rows, reach_cols = geo.cells_spanned(seed.lat, radius_km)
+		nearby = []
+		for r in range(row - reach_rows, row + reach_rows + 1):
+			for c in range(col - reach_cols, col + reach_cols + 1):
+				for other in grid.get((r, c), ()):
+					if other.order_id in taken or abs(other.ready_at - seed.ready_at) > window:
+						continue
+					distance = geo.haversine_km(seed.lat, seed.lng, other.lat, other.lng)
+					if distance <= radius_km:
+						nearby.append((distance, other.order_id, other))
+		nearby.sort(key=lambda item: item[:2])
+		members = [seed] + [other for _, _, other in nearby[:max_stops - 1]]
+		taken.update(s.order_id for s in members)
+		route, distance = order_route(origin, members)
+		batches.append(Batch(stops=route, distance_km=distance))
+	return batches
+
+
+def open_stops():
+	"""Unclaimed ready delivery orders with a location, as ``Stop``s."""
+	rows = (
+		open_jobs()
+		.filter(order_type=Order.TYPE_DELIVERY, lat__isnull=False, lng__isnull=False)
+		.values_list('id', 'lat', 'lng', 'updated_at')
+	)
+	# updated_at is when the order last changed status, i.e. when it became ready
+	return [Stop(order_id=pk, lat=lat, lng=lng, ready_at=ready_at) for pk, lat, lng, ready_at in rows]
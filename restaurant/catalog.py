@@ -0,0 +1,168 @@
+"""
+Menu catalog for clients.
+
+``GET /api/catalog`` returns categories, sellable menu items, active food
+sets with their compositions and the public vouchers in one document. The
+document is serialized once per catalog version and kept in process memory
+as JSON bytes plus a gzip copy, with a strong ETag taken from a hash of the
+bytes, so a repeat load is answered 304 and a fresh one is a memory copy.
+
+The version lives in the Django cache (see ``versioning``) and is bumped by
+signals whenever ``MenuCategory``, ``MenuItem``, ``FoodSet``, ``SetItem`` or
+``Voucher`` rows change. Code that changes catalog rows without signals
+(``QuerySet.update``, raw SQL) must call ``bump_catalog_version()`` itself.
+Public vouchers also start, end and run out without any row being saved, so
+a built catalog is rebuilt at the next ``start_at``/``end_at`` boundary and
+at least every ``CATALOG_TTL`` seconds; an unchanged rebuild keeps its ETag.
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
+
+from .models import FoodSet, MenuCategory, MenuItem, SetItem, Voucher
+from .versioning import bump_version, get_version
+
+CATALOG_VERSION_KEY = 'restaurant:catalog_version'
+CATALOG_TTL = 60
+GZIP_LEVEL = 6
+
+
+def catalog_version() -> int:
+	return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+	"""Drop the serialized catalog in every process."""
+	bump_version(CATALOG_VERSION_KEY)
+
+
+@dataclass(frozen=True)
+class Catalog:
+	version: int
+	body: bytes
+	gzipped: bytes
+	etag: str
+	expires: float
+	boundary: object = None
+
+
+def item_data(item):
+	return {
+		'id': item.pk,
+		'name': item.name,
+		'category_id': item.category_id,
+		'price': item.price,
+		'description': item.description,
+		'image_url': item.image_url,
+		'featured': item.featured,
+		'available': item.available and item.in_stock,
+	}
+
+
+def set_data(food_set):
+	"""Needs ``items`` prefetched with their ``menu_item``."""
+	return {
+		'id': food_set.pk,
+		'name': food_set.name,
+		'price': food_set.price,
+		'active': food_set.active,
+		'available': food_set.in_stock,
+		'items': [
+			{'menu_item_id': si.menu_item_id, 'name': si.menu_item.name, 'quantity': si.quantity}
+			for si in food_set.items.all()
+		],
+	}
+
+
+def voucher_data(voucher):
+	return {
+		'id': voucher.pk,
+		'code': voucher.code,
+		'discount_type': voucher.discount_type,
+		'amount': voucher.amount,
+		'min_spend': voucher.min_spend,
+		'max_discount': voucher.max_discount,
+		'start_at': voucher.start_at,
+		'end_at': voucher.end_at,
+	}
+
+
+def set_components():
+	return Prefetch('items', queryset=SetItem.objects.select_related('menu_item').order_by('id'))
+
+
+def _vouchers(now):
+	"""Public vouchers usable now, and the next time that set changes on its own."""
+	qs = (
+		Voucher.objects
+		.filter(is_public=True, active=True)
+		.filter(Q(end_at__isnull=True) | Q(end_at__gt=now))
+		.filter(Q(usage_limit=0) | Q(used_count__lt=F('usage_limit')))
+		.order_by('min_spend', 'id')
+	)
+	vouchers, next_boundary = [], None
+	for voucher in qs:
+		if voucher.start_at and voucher.start_at > now:
+			boundary = voucher.start_at
+		else:
+			boundary = voucher.end_at
+			vouchers.append(voucher_data(voucher))
+		if boundary and (next_boundary is None or boundary < next_boundary):
+			next_boundary = boundary
+	return vouchers, next_boundary
+
+
+def build_catalog(version: int) -> Catalog:
+	"""Serialize the catalog: four queries whatever its size."""
+	now = timezone.now()
+	items = MenuItem.objects.filter(available=True, in_stock=True).order_by('category_id', 'name', 'id')
+	sets = FoodSet.objects.filter(active=True).prefetch_related(set_components()).order_by('name', 'id')
+	vouchers, boundary = _vouchers(now)
+	document = {
+		'categories': [{'id': pk, 'name': name} for pk, name in MenuCategory.objects.order_by('name').values_list('id', 'name')],
+		'items': [item_data(item) for item in items],
+		'sets': [set_data(food_set) for food_set in sets],
+		'vouchers': vouchers,
+	}
+	body = json.dumps(document, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+	return Catalog(
+		version=version,
+		body=body,
+		gzipped=gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+		# Tagged by content, so a rebuild that changed nothing keeps its tag
+		etag=hashlib.sha256(body).hexdigest()[:32],
+		expires=time.monotonic() + CATALOG_TTL,
+		boundary=boundary,
+	)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def _fresh(catalog, version):
+	return (
+		catalog is not None
+		and catalog.version == version
+		and catalog.expires > time.monotonic()
+		and (catalog.boundary is None or catalog.boundary > timezone.now())
+	)
+
+
+def get_catalog() -> Catalog:
+	global _catalog
+	version = catalog_version()
+	catalog = _catalog
+	if _fresh(catalog, version):
+		return catalog
+	with _catalog_lock:
+		if not _fresh(_catalog, version):
+			_catalog = build_catalog(version)
+		return _catalog
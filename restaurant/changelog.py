@@ -0,0 +1,105 @@
+"""
+Change log for incremental client sync.
+
+Every insert, update or delete of a synced row appends a ``SyncChange``:
+``(seq, entity, object_id, op)`` plus who may see it. Signals cover
+``save()``/``delete()``; code that writes synced rows with
+``QuerySet.update``, ``bulk_create`` or raw SQL calls ``record`` itself, once
+per batch (one ``bulk_create``). The log carries no payloads: ``/api/sync``
+(``restaurant.sync``) loads the current rows when it serves the changes.
+
+Only the newest change per object matters to a client, so ``compact`` deletes
+every row that a later row for the same object supersedes; a client behind
+the compacted range still ends up with the latest state of everything.
+Run ``python manage.py compact_changelog`` from cron.
+
+Sequence numbers are the table's primary key. That is gap-free in commit
+order on SQLite, where writers are serialized; on a database with concurrent
+writers a transaction can commit a lower seq after a client has read past it.
+"""
+import functools
+
+from django.db.models import Max
+
+from .models import FoodSet, Ingredient, MenuCategory, MenuItem, Order, SyncChange, Voucher
+
+ENTITY_CATEGORY = 'category'
+ENTITY_MENU_ITEM = 'menu_item'
+ENTITY_FOOD_SET = 'food_set'
+ENTITY_VOUCHER = 'voucher'
+ENTITY_INGREDIENT = 'ingredient'
+ENTITY_ORDER = 'order'
+
+STAFF_ENTITIES = (ENTITY_INGREDIENT,)
+
+
+@functools.cache
+def synced_models():
+	"""Models whose own ``save()``/``delete()`` are logged, with their entity name."""
+	return {
+		MenuCategory: ENTITY_CATEGORY,
+		MenuItem: ENTITY_MENU_ITEM,
+		FoodSet: ENTITY_FOOD_SET,
+		Voucher: ENTITY_VOUCHER,
+		Ingredient: ENTITY_INGREDIENT,
+		Order: ENTITY_ORDER,
+	}
+
+
+def _scope(entity, owner_id):
+	if entity == ENTITY_ORDER:
+		return (SyncChange.SCOPE_USER, owner_id) if owner_id else (SyncChange.SCOPE_STAFF, None)
+	if entity in STAFF_ENTITIES:
+		return SyncChange.SCOPE_STAFF, None
+	return SyncChange.SCOPE_PUBLIC, None
+
+
+def record(entity, object_ids, op=SyncChange.OP_UPSERT, owners=None):
+	"""
+	Append one change per id. ``owners`` maps order id -> customer id for
+	``order`` changes so each customer only syncs their own orders.
+	"""
+	rows = []
+	for object_id in dict.fromkeys(object_ids):
+		scope, owner_id = _scope(entity, (owners or {}).get(object_id))
+		rows.append(SyncChange(entity=entity, object_id=object_id, op=op, scope=scope, owner_id=owner_id))
+	if rows:
+		SyncChange.objects.bulk_create(rows)
+	return rows
+
+
+def record_orders(orders):
+	record(ENTITY_ORDER, [o.pk for o in orders], owners={o.pk: o.user_id for o in orders})
+
+
+def voucher_live(voucher) -> bool:
+	"""Whether clients should hold the voucher: public, switched on and not used up."""
+	exhausted = voucher.usage_limit and voucher.used_count >= voucher.usage_limit
+	return voucher.is_public and voucher.active and not exhausted
+
+
+def row_saved(sender, instance, raw=False, **kwargs):
+	if raw:
+		return
+	op = SyncChange.OP_UPSERT
+	# A voucher taken private, switched off or used up drops out of every client
+	if sender is Voucher and not voucher_live(instance):
+		op = SyncChange.OP_DELETE
+	record(synced_models()[sender], [instance.pk], op, owners={instance.pk: getattr(instance, 'user_id', None)})
+
+
+def row_deleted(sender, instance, **kwargs):
+	record(synced_models()[sender], [instance.pk], SyncChange.OP_DELETE, owners={instance.pk: getattr(instance, 'user_id', None)})
+
+
+def set_item_changed(sender, instance, raw=False, **kwargs):
+	"""A set's composition is part of the set."""
+	if not raw:
+		record(ENTITY_FOOD_SET, [instance.food_set_id])
+
+
+def compact() -> int:
+	"""Delete every change superseded by a later one for the same object; returns rows removed."""
+	latest = SyncChange.objects.values('entity', 'object_id').annotate(last=Max('id')).values('last')
+	removed, _ = SyncChange.objects.exclude(id__in=latest).delete()
+	return removed
@@ -0,0 +1,197 @@
+"""
+Maintained row counts for the admin dashboard.
+
+``RowCounter`` holds one row per counted table (plus one per profile role).
+Counts move incrementally: model signals add or subtract one per saved or
+deleted row, and bulk writers that skip signals (the order pipeline, stock
+deduction, voucher generation, rider job backfills) call ``add()``
+themselves. Deltas are applied in the caller's transaction, so a
+rolled-back order never counts.
+``sync_counters`` recounts everything exactly and should run periodically to
+absorb drift from raw SQL or crashed writers.
+"""
+import functools
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import (
+	Address,
+	FoodSet,
+	Ingredient,
+	InventoryTransaction,
+	MenuCategory,
+	MenuItem,
+	Order,
+	OrderItem,
+	Payment,
+	Profile,
+	RiderAssignment,
+	RowCounter,
+	SetItem,
+	Voucher,
+)
+
+ROLE_PREFIX = 'profiles_role:'
+READ_CACHE_KEY = 'restaurant:row_counters'
+# Dashboard polls inside this window are answered without touching the database
+READ_CACHE_TTL = 5
+
+
+def counted_models():
+	"""``{counter key: model}`` for every table tracked by the dashboard."""
+	return {
+		'users': get_user_model(),
+		'profiles': Profile,
+		'categories': MenuCategory,
+		'menu_items': MenuItem,
+		'ingredients': Ingredient,
+		'food_sets': FoodSet,
+		'set_items': SetItem,
+		'vouchers': Voucher,
+		'addresses': Address,
+		'orders': Order,
+		'order_items': OrderItem,
+		'payments': Payment,
+		'rider_assignments': RiderAssignment,
+		'inventory_transactions': InventoryTransaction,
+	}
+
+
+def role_key(role: str) -> str:
+	return f'{ROLE_PREFIX}{role}'
+
+
+def add(deltas: dict):
+	"""Apply ``{key: delta}`` with a single UPDATE; unknown keys wait for the next sync."""
+	deltas = {k: v for k, v in deltas.items() if v}
+	if not deltas:
+		return
+	if len(deltas) == 1:
+		(key, delta), = deltas.items()
+		RowCounter.objects.filter(key=key).update(value=F('value') + delta)
+		return
+	RowCounter.objects.filter(key__in=deltas).update(value=F('value') + Case(
+		*[When(key=key, then=Value(delta)) for key, delta in deltas.items()],
+		default=Value(0),
+		output_field=IntegerField(),
+	))
+
+
+def resync():
+	"""Recount every table exactly and store the results."""
+	now = timezone.now()
+	exact = {key: model.objects.count() for key, model in counted_models().items()}
+	by_role = dict(Profile.objects.values('role').annotate(c=Count('id')).values_list('role', 'c'))
+	for role, _ in Profile.ROLE_CHOICES:
+		exact[role_key(role)] = by_role.pop(role, 0)
+	# Roles written outside ROLE_CHOICES still get counted
+	for role, count in by_role.items():
+		exact[role_key(role)] = count
+	with transaction.atomic():
+		RowCounter.objects.exclude(key__in=exact).delete()
+		existing = set(RowCounter.objects.values_list('key', flat=True))
+		for key, value in exact.items():
+			if key in existing:
+				RowCounter.objects.filter(key=key).update(value=value, synced_at=now)
+		RowCounter.objects.bulk_create([
+			RowCounter(key=key, value=value, synced_at=now) for key, value in exact.items() if key not in existing
+		])
+	cache.delete(READ_CACHE_KEY)
+	return exact
+
+
+def read():
+	"""
+	Return ``(counts, profiles_by_role, meta)`` from one query.
+
+	``meta`` carries staleness information: when the oldest counter was last
+	synced exactly and how many seconds ago that was.
+	"""
+	rows = list(RowCounter.objects.values_list('key', 'value', 'synced_at'))
+	keys = {key for key, _, _ in rows}
+	if not set(counted_models()) <= keys:
+		resync()
+		rows = list(RowCounter.objects.values_list('key', 'value', 'synced_at'))
+	counts, by_role, synced = {}, {}, []
+	for key, value, synced_at in rows:
+		if key.startswith(ROLE_PREFIX):
+			if value:
+				by_role[key[len(ROLE_PREFIX):]] = value
+		else:
+			counts[key] = value
+		if synced_at:
+			synced.append(synced_at)
+	oldest = min(synced) if synced else None
+	meta = {
+		'source': 'counters',
+		'read_at': timezone.now().isoformat(),
+		'synced_at': oldest.isoformat() if oldest else None,
+		'age_seconds': int((timezone.now() - oldest).total_seconds()) if oldest else None,
+	}
+	return counts, by_role, meta
+
+
+def cached_read():
+	"""``read()`` memoised for ``READ_CACHE_TTL`` seconds; ``meta['source']`` says which."""
+	hit = cache.get(READ_CACHE_KEY)
+	if hit is not None:
+		counts, by_role, meta = hit
+		return counts, by_role, {**meta, 'source': 'cache'}
+	result = read()
+	cache.set(READ_CACHE_KEY, result, READ_CACHE_TTL)
+	return result
+
+
+# -------------------------
+# Signal handlers
+# -------------------------
+
+# Data migrations can run before the counter table exists; ``sync_counters``
+# picks up whatever they wrote.
+_paused = False
+
+
+def pause(**kwargs):
+	global _paused
+	_paused = True
+
+
+def resume(**kwargs):
+	global _paused
+	_paused = False
+
+
+def row_created(sender, instance, created, raw=False, **kwargs):
+	if _paused:
+		return
+	if created:
+		key = _keys_by_model().get(sender)
+		deltas = {key: 1} if key else {}
+		if sender is Profile:
+			deltas[role_key(instance.role)] = 1
+		add(deltas)
+	elif sender is Profile:
+		old = getattr(instance, '_loaded_role', None)
+		if old is not None and old != instance.role:
+			add({role_key(old): -1, role_key(instance.role): 1})
+	if sender is Profile:
+		instance._loaded_role = instance.role
+
+
+def row_deleted(sender, instance, **kwargs):
+	if _paused:
+		return
+	key = _keys_by_model().get(sender)
+	deltas = {key: -1} if key else {}
+	if sender is Profile:
+		deltas[role_key(getattr(instance, '_loaded_role', None) or instance.role)] = -1
+	add(deltas)
+
+
+@functools.cache
+def _keys_by_model():
+	return {model: key for key, model in counted_models().items()}
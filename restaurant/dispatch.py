@@ -0,0 +1,236 @@
+"""
+Rider job claiming and delivery transitions.
+
+Each step is one conditional UPDATE whose WHERE clause is the precondition,
+so the database decides the race: of N riders claiming the same job exactly
+one UPDATE matches a row and every other rider is told the job is taken,
+with no row locks held in Python and no retry loop. ``picked`` and
+``complete`` are guarded the same way on the assignment's current status and
+rider.
+
+The UPDATEs bypass ``post_save``, so the winners publish their events
+(``events.assignment_changed`` / ``events.order_status_changed``) themselves.
+
+Staff may still move an order past the rider steps themselves;
+``transitions`` then calls ``follow_orders`` so the assignment is not left
+behind at ``available`` or ``accepted``.
+"""
+import heapq
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import changelog, counters, events, geo, history, tracking
+from .events import JOB_ORDER_TYPES
+from .models import Order, RiderAssignment
+
+# Orders a rider may claim
+CLAIMABLE_STATUSES = (Order.STATUS_READY,)
+# First search radius for nearby jobs; doubled until enough jobs are found
+NEARBY_START_KM = 1.0
+
+ASSIGNMENT_AVAILABLE = 'available'
+ASSIGNMENT_ACCEPTED = 'accepted'
+ASSIGNMENT_DELIVERING = 'delivering'
+ASSIGNMENT_COMPLETED = 'completed'
+
+# Assignment step an order move made outside dispatch implies:
+# order status -> (assignment status, timestamp field, assignment statuses still behind it)
+ORDER_ASSIGNMENT_STEPS = {
+	Order.STATUS_DELIVERING: (ASSIGNMENT_DELIVERING, 'picked_at', (ASSIGNMENT_AVAILABLE, ASSIGNMENT_ACCEPTED)),
+	Order.STATUS_COMPLETED: (
+		ASSIGNMENT_COMPLETED, 'delivered_at', (ASSIGNMENT_AVAILABLE, ASSIGNMENT_ACCEPTED, ASSIGNMENT_DELIVERING),
+	),
+}
+
+# Outcomes
+CLAIMED = 'claimed'
+ALREADY_YOURS = 'already_yours'
+TAKEN = 'taken'
+NOT_CLAIMABLE = 'not_claimable'
+NOT_FOUND = 'not_found'
+NOT_YOURS = 'not_yours'
+OUT_OF_ORDER = 'out_of_order'
+OK = 'ok'
+
+
+def _claimable(order_ids):
+	return RiderAssignment.objects.filter(
+		order_id__in=order_ids,
+		rider__isnull=True,
+		order__status__in=CLAIMABLE_STATUSES,
+		order__order_type__in=JOB_ORDER_TYPES,
+	)
+
+
+def claim_job(order_id: int, rider) -> str:
+	"""Try to make ``rider`` the rider of ``order_id``; returns an outcome constant."""
+	now = timezone.now()
+	with transaction.atomic():
+		won = _claimable([order_id]).update(rider=rider, status=ASSIGNMENT_ACCEPTED, accepted_at=now)
+		if not won and not RiderAssignment.objects.filter(order_id=order_id).exists():
+			# Orders from before assignments were created with the order
+			if Order.objects.filter(pk=order_id, order_type__in=JOB_ORDER_TYPES).exists():
+				RiderAssignment.objects.bulk_create([RiderAssignment(order_id=order_id)], ignore_conflicts=True)
+				# bulk_create skips post_save, which keeps the row counter in step
+				counters.add({'rider_assignments': 1})
+				won = _claimable([order_id]).update(rider=rider, status=ASSIGNMENT_ACCEPTED, accepted_at=now)
+		if won:
+			assignment = RiderAssignment.objects.select_related('order').get(order_id=order_id)
+			events.assignment_changed(assignment)
+			tracking.store.forget_rider(rider.pk)
+			return CLAIMED
+	# Lost or invalid: one read to say why
+	row = Order.objects.filter(pk=order_id).values_list('pk', 'rider_assignment__rider_id').first()
+	if row is None:
+		return NOT_FOUND
+	rider_id = row[1]
+	if rider_id == rider.pk:
+		return ALREADY_YOURS
+	if rider_id is not None:
+		return TAKEN
+	return NOT_CLAIMABLE
+
+
+def claim_batch(order_ids, rider) -> str:
+	"""
+	Claim every order in ``order_ids`` for ``rider``, or none of them.
+
+	One conditional UPDATE covers the whole batch; if it matched fewer rows
+	than there are orders, some order was taken or is no longer ready, and
+	the claim is rolled back.
+	"""
+	order_ids = sorted(set(order_ids))
+	if not order_ids:
+		return NOT_FOUND
+	now = timezone.now()
+	with transaction.atomic():
+		have = set(RiderAssignment.objects.filter(order_id__in=order_ids).values_list('order_id', flat=True))
+		missing = [pk for pk in order_ids if pk not in have]
+		if missing:
+			RiderAssignment.objects.bulk_create([RiderAssignment(order_id=pk) for pk in missing], ignore_conflicts=True)
+			counters.add({'rider_assignments': len(missing)})
+		won = _claimable(order_ids).update(rider=rider, status=ASSIGNMENT_ACCEPTED, accepted_at=now)
+		if won == len(order_ids):
+			for assignment in RiderAssignment.objects.select_related('order').filter(order_id__in=order_ids):
+				events.assignment_changed(assignment)
+			tracking.store.forget_rider(rider.pk)
+			return CLAIMED
+		transaction.set_rollback(True)
+	riders = dict(RiderAssignment.objects.filter(order_id__in=order_ids).values_list('order_id', 'rider_id'))
+	if any(rider_id not in (None, rider.pk) for rider_id in riders.values()):
+		return TAKEN
+	return NOT_CLAIMABLE
+
+
+def _advance(order_id, rider, from_status, to_status, stamp_field, order_from, order_to):
+	"""Move the rider's assignment and its order forward together, or not at all."""
+	now = timezone.now()
+	with transaction.atomic():
+		moved = RiderAssignment.objects.filter(order_id=order_id, rider=rider, status=from_status).update(
+			status=to_status, **{stamp_field: now}
+		)
+		if not moved:
+			if not Order.objects.filter(pk=order_id).exists():
+				return NOT_FOUND
+			if not RiderAssignment.objects.filter(order_id=order_id, rider=rider).exists():
+				return NOT_YOURS
+			# Repeating the step that already happened is harmless
+			if RiderAssignment.objects.filter(order_id=order_id, rider=rider, status=to_status).exists():
+				return OK
+			return OUT_OF_ORDER
+		order_moved = Order.objects.filter(pk=order_id, status__in=order_from).update(status=order_to, updated_at=now)
+		assignment = RiderAssignment.objects.select_related('order').get(order_id=order_id)
+		events.assignment_changed(assignment)
+		if order_moved:
+			events.order_status_changed(assignment.order, order_from[0])
+			history.record([(assignment.order, order_from[0], order_to)], at=now)
+			changelog.record_orders([assignment.order])
+	tracking.store.forget_rider(rider.pk)
+	if to_status == ASSIGNMENT_COMPLETED:
+		tracking.store.close(order_id)
+	return OK
+
+
+def follow_orders(order_ids, order_status, now):
+	"""
+	Bring the assignments of ``order_ids`` up to ``order_status`` after staff
+	moved the orders themselves (e.g. ready -> completed at the counter);
+	run inside that move's transaction. Returns how many assignments moved.
+	"""
+	step = ORDER_ASSIGNMENT_STEPS.get(order_status)
+	if step is None or not order_ids:
+		return 0
+	status, stamp_field, behind = step
+	ids = list(RiderAssignment.objects.filter(order_id__in=order_ids, status__in=behind).values_list('pk', flat=True))
+	if not ids:
+		return 0
+	RiderAssignment.objects.filter(pk__in=ids).update(status=status, **{stamp_field: now})
+	for assignment in RiderAssignment.objects.select_related('order').filter(pk__in=ids):
+		events.assignment_changed(assignment)
+		if assignment.rider_id is not None:
+			tracking.store.forget_rider(assignment.rider_id)
+	return len(ids)
+
+
+def pick_up(order_id: int, rider) -> str:
+	"""Rider collected the food: accepted -> delivering."""
+	return _advance(
+		order_id, rider, ASSIGNMENT_ACCEPTED, ASSIGNMENT_DELIVERING, 'picked_at',
+		order_from=(Order.STATUS_READY,), order_to=Order.STATUS_DELIVERING,
+	)
+
+
+def complete(order_id: int, rider) -> str:
+	"""Rider handed the order over: delivering -> completed."""
+	return _advance(
+		order_id, rider, ASSIGNMENT_DELIVERING, ASSIGNMENT_COMPLETED, 'delivered_at',
+		order_from=(Order.STATUS_DELIVERING,), order_to=Order.STATUS_COMPLETED,
+	)
+
+
+# -------------------------
+# Nearby jobs
+# -------------------------
+
+def open_jobs():
+	"""Claimable jobs that no rider has taken yet."""
+	return Order.objects.filter(
+		status__in=CLAIMABLE_STATUSES,
+		order_type__in=JOB_ORDER_TYPES,
+		rider_assignment__rider__isnull=True,
+	)
+
+
+def _within(lat, lng, radius_km):
+	q = Q()
+	for first, last in geo.cell_ranges(lat, lng, radius_km):
+		q |= Q(geo_cell__range=(first, last))
+	return q
+
+
+def nearby_jobs(lat: float, lng: float, radius_km: float, limit: int):
+	"""
+	The ``limit`` open jobs nearest to ``(lat, lng)`` within ``radius_km``, nearest first.
+
+	Reads only the grid cells around the point, starting at
+	``NEARBY_START_KM`` and doubling the box until the ``limit``-th job is
+	closer than the box edge (so nothing outside it could beat it) or the
+	box reaches ``radius_km``. Returns ``[(distance_km, row), ...]`` with
+	rows from ``values()``.
+	"""
+	reach = min(radius_km, NEARBY_START_KM)
+	while True:
+		rows = open_jobs().filter(_within(lat, lng, reach)).values(
+			'id', 'order_type', 'total', 'address_text', 'lat', 'lng',
+		)
+		scored = []
+		for row in rows:
+			distance = geo.haversine_km(lat, lng, row['lat'], row['lng'])
+			if distance <= radius_km:
+				scored.append((distance, row['id'], row))
+		best = heapq.nsmallest(limit, scored)
+		if reach >= radius_km or (len(best) == limit and best[-1][0] <= reach):
+			return [(distance, row) for distance, _, row in best]
+		reach = min(radius_km, reach * 2)
@@ -0,0 +1,162 @@
+"""
+Order ETA from rolling per-stage statistics.
+
+A stage is the time an order spends in one status before moving on. For
+every ``(stage, order type, hour of day)`` the model keeps a running mean
+that starts as a plain average and settles into an exponentially weighted
+one (weight ``ALPHA``), so it follows the kitchen's current pace; a coarser
+``(stage, order type)`` mean and ``DEFAULT_SECONDS`` back it up while data
+is thin. Stats are fed incrementally from new ``OrderStatusEvent`` rows as
+they commit, and the model also remembers each open order's status and
+since-when, so an ETA is a handful of dict lookups with no query.
+
+The model is per process and only sees events written by its own process,
+so a background thread (``start_warmer``, started by ``rest/wsgi.py`` and
+``rest/asgi.py``) rebuilds it from the last ``WARM_DAYS`` of history at start
+and every ``REWARM_SECONDS``. ``eta`` itself never queries: until the first
+warm finishes it only knows orders whose events this process wrote.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Order, OrderStatusEvent
+
+logger = logging.getLogger(__name__)
+
+ALPHA = 0.1
+WARM_DAYS = 14
+WARM_MAX_ROWS = 100000
+REWARM_SECONDS = 600
+# Fewer observations than this and the hour-of-day mean is not trusted yet
+MIN_SAMPLES = 5
+
+# Statuses an order passes through before it is done, per order type
+PATHS = {
+	Order.TYPE_DELIVERY: (Order.STATUS_PENDING, Order.STATUS_PREPARING, Order.STATUS_READY, Order.STATUS_DELIVERING),
+	Order.TYPE_TAKEAWAY: (Order.STATUS_PENDING, Order.STATUS_PREPARING, Order.STATUS_READY),
+	Order.TYPE_DINEIN: (Order.STATUS_PENDING, Order.STATUS_PREPARING),
+}
+DEFAULT_SECONDS = {
+	Order.STATUS_PENDING: 120.0,
+	Order.STATUS_PREPARING: 900.0,
+	Order.STATUS_READY: 300.0,
+	Order.STATUS_DELIVERING: 1200.0,
+}
+DONE_STATUSES = (Order.STATUS_COMPLETED, Order.STATUS_CANCELLED)
+
+
+class RunningMean:
+	__slots__ = ('mean', 'count')
+
+	def __init__(self):
+		self.mean = 0.0
+		self.count = 0
+
+	def add(self, value: float):
+		self.count += 1
+		self.mean += (value - self.mean) * max(ALPHA, 1.0 / self.count)
+
+
+class EtaModel:
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._by_hour = {}
+		self._by_type = {}
+		# order_id -> (status, entered_at, order_type)
+		self._open = {}
+		self._warmer = None
+
+	def _observe(self, stage, order_type, entered_at, seconds):
+		hour = timezone.localtime(entered_at).hour
+		self._by_hour.setdefault((stage, order_type, hour), RunningMean()).add(seconds)
+		self._by_type.setdefault((stage, order_type), RunningMean()).add(seconds)
+
+	def _track(self, event):
+		if event.to_status in DONE_STATUSES:
+			self._open.pop(event.order_id, None)
+		else:
+			self._open[event.order_id] = (event.to_status, event.created_at, event.order_type)
+
+	def apply(self, events):
+		"""Fold newly committed ``OrderStatusEvent`` rows (oldest first) into the model."""
+		with self._lock:
+			for event in events:
+				if event.from_status and event.duration_seconds is not None and event.duration_seconds >= 0:
+					entered = event.created_at - timedelta(seconds=event.duration_seconds)
+					self._observe(event.from_status, event.order_type, entered, event.duration_seconds)
+				self._track(event)
+
+	def warm(self, now=None):
+		"""Rebuild from recent history: one query over the event time index."""
+		now = now or timezone.now()
+		rows = (
+			OrderStatusEvent.objects.filter(created_at__gte=now - timedelta(days=WARM_DAYS))
+			.order_by('-created_at')
+			.only('order_id', 'from_status', 'to_status', 'order_type', 'duration_seconds', 'created_at')
+		)
+		events = list(rows[:WARM_MAX_ROWS])
+		events.reverse()
+		fresh = EtaModel()
+		fresh.apply(events)
+		with self._lock:
+			self._by_hour, self._by_type, self._open = fresh._by_hour, fresh._by_type, fresh._open
+
+	def start_warmer(self, interval: float = REWARM_SECONDS):
+		"""Warm now and every ``interval`` seconds on a daemon thread; later calls do nothing."""
+		with self._lock:
+			if self._warmer is not None:
+				return
+			self._warmer = threading.Thread(target=self._warm_forever, args=(interval,), name='eta-warmer', daemon=True)
+		self._warmer.start()
+
+	def _warm_forever(self, interval):
+		while True:
+			try:
+				self.warm()
+			except Exception:
+				logger.exception('ETA warm failed')
+			finally:
+				connection.close()
+			time.sleep(interval)
+
+	def expected(self, stage, order_type, hour):
+		"""Expected seconds in ``stage``; falls back from hour-of-day to type to the default."""
+		stat = self._by_hour.get((stage, order_type, hour))
+		if stat is not None and stat.count >= MIN_SAMPLES:
+			return stat.mean
+		stat = self._by_type.get((stage, order_type))
+		if stat is not None and stat.count:
+			return stat.mean
+		return DEFAULT_SECONDS.get(stage, 0.0)
+
+	def eta(self, order_id, now=None):
+		"""
+		``(seconds_remaining, status)`` for an open order, or ``None`` when it is done or unknown.
+
+		Remaining time is the expected time of the current stage minus what has
+		already elapsed in it (never below zero), plus every later stage on the
+		order type's path. Reads memory only.
+		"""
+		state = self._open.get(order_id)
+		if state is None:
+			return None
+		status, entered_at, order_type = state
+		path = PATHS.get(order_type, ())
+		if status not in path:
+			return 0.0, status
+		now = now or timezone.now()
+		hour = timezone.localtime(now).hour
+		elapsed = (now - entered_at).total_seconds()
+		index = path.index(status)
+		remaining = max(0.0, self.expected(status, order_type, hour) - elapsed)
+		for stage in path[index + 1:]:
+			remaining += self.expected(stage, order_type, hour)
+		return remaining, status
+
+
+model = EtaModel()
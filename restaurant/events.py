@@ -0,0 +1,260 @@
+"""
+In-process pub/sub for order and rider events, streamed to clients as SSE.
+
+Write paths publish after their transaction commits: ``post_save`` on
+``Order`` and ``RiderAssignment`` covers ``save()`` callers, and the order
+pipeline publishes its bulk inserts itself. ``EventHub`` fans each event out
+to the subscribers whose topics it is addressed to:
+
+* ``user:<id>`` - the customer who placed the order and the assigned rider
+* ``riders`` - job board changes (a job became ready or was taken)
+* ``staff`` - every order and assignment change, for the back office
+
+Every event gets a monotonically increasing id and is kept in a bounded
+replay buffer so a reconnecting ``EventSource`` can resume from
+``Last-Event-ID``; when the requested id has already fallen out of the
+buffer the stream starts with a ``reset`` event telling the client to
+refetch. Ids start from the hub's boot time in milliseconds, so ids issued
+before a restart are always older than the new buffer.
+
+The hub lives in one process: run a single ASGI worker, or put a shared
+broker behind ``EventHub.publish`` when scaling out.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .models import Order
+
+REPLAY_SIZE = 1000
+# Events a slow subscriber may fall behind before it is disconnected; it then
+# reconnects and catches up from the replay buffer.
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+
+TOPIC_RIDERS = 'riders'
+TOPIC_STAFF = 'staff'
+
+JOB_ORDER_TYPES = (Order.TYPE_DELIVERY, Order.TYPE_TAKEAWAY)
+
+
+def user_topic(user_id) -> str:
+	return f'user:{user_id}'
+
+
+def topics_for(user_id, role: str):
+	"""Topics a signed-in user may subscribe to."""
+	topics = {user_topic(user_id)}
+	if role == 'rider':
+		topics.add(TOPIC_RIDERS)
+	elif role in ('staff', 'chef', 'admin'):
+		topics.add(TOPIC_STAFF)
+	return topics
+
+
+@dataclass
+class Event:
+	id: int
+	type: str
+	data: dict
+	topics: frozenset
+	order_id: int = None
+	encoded: bytes = field(default=b'', repr=False)
+
+	def __post_init__(self):
+		# Serialized once, however many subscribers receive it
+		payload = json.dumps(self.data, separators=(',', ':'), ensure_ascii=False)
+		self.encoded = f'id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n'.encode('utf-8')
+
+
+class Subscriber:
+	def __init__(self, topics, order_ids=None):
+		self.topics = frozenset(topics)
+		self.order_ids = frozenset(order_ids) if order_ids else None
+		self.loop = asyncio.get_running_loop()
+		self.queue = asyncio.Queue()
+
+	def accepts(self, event: Event) -> bool:
+		if self.topics.isdisjoint(event.topics):
+			return False
+		return self.order_ids is None or event.order_id in self.order_ids
+
+	def _offer(self, event):
+		# Runs on the subscriber's loop
+		if self.queue.qsize() >= SUBSCRIBER_QUEUE_SIZE:
+			while not self.queue.empty():
+				self.queue.get_nowait()
+			self.queue.put_nowait(None)
+			return
+		self.queue.put_nowait(event)
+
+
+class EventHub:
+	def __init__(self, replay_size: int = REPLAY_SIZE):
+		self._lock = threading.Lock()
+		start = int(time.time() * 1000)
+		self._ids = itertools.count(start)
+		self._last_id = start - 1
+		self._buffer = deque(maxlen=replay_size)
+		self._subscribers = set()
+
+	def publish(self, type: str, data: dict, topics, order_id=None) -> Event:
+		with self._lock:
+			event = Event(id=next(self._ids), type=type, data=data, topics=frozenset(topics), order_id=order_id)
+			self._buffer.append(event)
+			self._last_id = event.id
+			targets = [sub for sub in self._subscribers if sub.accepts(event)]
+		for sub in targets:
+			try:
+				sub.loop.call_soon_threadsafe(sub._offer, event)
+			except RuntimeError:
+				# Loop already closed; the stream's finally block will unsubscribe
+				pass
+		return event
+
+	def subscribe(self, topics, order_ids=None) -> Subscriber:
+		sub = Subscriber(topics, order_ids)
+		with self._lock:
+			self._subscribers.add(sub)
+		return sub
+
+	def unsubscribe(self, sub: Subscriber):
+		with self._lock:
+			self._subscribers.discard(sub)
+
+	def replay(self, sub: Subscriber, last_id: int):
+		"""
+		Buffered events after ``last_id`` for ``sub``.
+
+		Returns ``None`` when events after ``last_id`` may have been missed:
+		they fell out of the buffer or were issued before a restart.
+		"""
+		with self._lock:
+			buffered = list(self._buffer)
+			newest = self._last_id
+		oldest = buffered[0].id if buffered else newest + 1
+		if last_id < oldest - 1 or last_id > newest:
+			return None
+		return [ev for ev in buffered if ev.id > last_id and sub.accepts(ev)]
+
+	def subscriber_count(self) -> int:
+		with self._lock:
+			return len(self._subscribers)
+
+
+hub = EventHub()
+
+
+def _publish_on_commit(type, data, topics, order_id):
+	transaction.on_commit(lambda: hub.publish(type, data, topics, order_id))
+
+
+async def stream(topics, order_ids=None, last_id=None, heartbeat: float = HEARTBEAT_SECONDS):
+	"""
+	SSE body: replay after ``last_id``, then live events and heartbeats.
+
+	The subscription is taken when the body starts streaming and dropped when
+	the client goes away, so an abandoned response never leaks a subscriber.
+	"""
+	sub = hub.subscribe(topics, order_ids)
+	try:
+		yield f'retry: {RETRY_MS}\n\n'.encode('ascii')
+		sent = -1
+		if last_id is not None:
+			backlog = hub.replay(sub, last_id)
+			if backlog is None:
+				yield b'event: reset\ndata: {}\n\n'
+			else:
+				for event in backlog:
+					sent = event.id
+					yield event.encoded
+		while True:
+			try:
+				event = await asyncio.wait_for(sub.queue.get(), heartbeat)
+			except asyncio.TimeoutError:
+				yield b': ping\n\n'
+				continue
+			if event is None:
+				# Fell too far behind: close and let the client resume
+				return
+			# Skip live events the replay already delivered
+			if event.id > sent:
+				sent = event.id
+				yield event.encoded
+	finally:
+		hub.unsubscribe(sub)
+
+
+# -------------------------
+# Publishers
+# -------------------------
+
+def _order_topics(order):
+	topics = {TOPIC_STAFF}
+	if order.user_id:
+		topics.add(user_topic(order.user_id))
+	return topics
+
+
+def order_created(order):
+	_publish_on_commit('order.created', {
+		'id': order.pk,
+		'order_type': order.order_type,
+		'status': order.status,
+		'total': str(order.total),
+	}, _order_topics(order), order.pk)
+
+
+def order_status_changed(order, old_status=None):
+	_publish_on_commit('order.status', {
+		'id': order.pk,
+		'status': order.status,
+		'previous': old_status,
+	}, _order_topics(order), order.pk)
+	if order.order_type not in JOB_ORDER_TYPES:
+		return
+	if order.status == Order.STATUS_READY:
+		_publish_on_commit('job.ready', {
+			'id': order.pk,
+			'order_type': order.order_type,
+			'total': str(order.total),
+			'address': order.address_text,
+		}, {TOPIC_RIDERS}, order.pk)
+	elif old_status == Order.STATUS_READY:
+		_publish_on_commit('job.closed', {'id': order.pk, 'status': order.status}, {TOPIC_RIDERS}, order.pk)
+
+
+def assignment_changed(assignment, order=None):
+	order = order or assignment.order
+	topics = _order_topics(order)
+	if assignment.rider_id:
+		topics.add(user_topic(assignment.rider_id))
+	_publish_on_commit('assignment', {
+		'order_id': order.pk,
+		'rider_id': assignment.rider_id,
+		'status': assignment.status,
+	}, topics, order.pk)
+	if assignment.rider_id and assignment.status == 'accepted':
+		_publish_on_commit('job.taken', {'id': order.pk, 'rider_id': assignment.rider_id}, {TOPIC_RIDERS}, order.pk)
+
+
+# -------------------------
+# Signal handlers
+# -------------------------
+
+def assignment_saved(sender, instance, created, raw=False, **kwargs):
+	if raw:
+		return
+	old = getattr(instance, '_loaded_state', None)
+	state = (instance.rider_id, instance.status)
+	# A fresh 'available' assignment is part of order creation, not news
+	if old != state and not (created and instance.rider_id is None):
+		assignment_changed(instance)
+	instance._loaded_state = state
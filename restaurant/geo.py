@@ -0,0 +1,73 @@
+"""
+Fixed-size lat/lng grid for proximity lookups.
+
+The globe is cut into ``CELL_DEGREES`` squares (about 1.1 km at 0.01°) and
+each cell gets a single integer id, row-major by latitude, so the cells of
+one latitude row form a contiguous id range. A bounding box therefore maps
+to one ``BETWEEN`` per row on an indexed column instead of a list of cells.
+Longitude wrap-around at the antimeridian is not handled.
+"""
+import math
+
+CELL_DEGREES = 0.01
+# Cells per latitude row (longitude -180..180 inclusive)
+ROW_WIDTH = int(round(360 / CELL_DEGREES)) + 1
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def valid_point(lat, lng) -> bool:
+	return (
+		isinstance(lat, (int, float)) and isinstance(lng, (int, float))
+		and -90 <= lat <= 90 and -180 <= lng <= 180
+	)
+
+
+def _row(lat):
+	return int(math.floor((lat + 90) / CELL_DEGREES))
+
+
+def _col(lng):
+	return int(math.floor((lng + 180) / CELL_DEGREES))
+
+
+def grid_position(lat, lng):
+	"""``(row, column)`` of the cell holding a point."""
+	return _row(lat), _col(lng)
+
+
+def cells_spanned(lat: float, radius_km: float):
+	"""How many cells ``(rows, columns)`` either side of a point cover ``radius_km``."""
+	dlat = radius_km / KM_PER_DEGREE_LAT
+	poleward = min(90.0, abs(lat) + dlat)
+	dlng = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(poleward)), 0.01))
+	return int(dlat / CELL_DEGREES) + 1, int(dlng / CELL_DEGREES) + 1
+
+
+def cell_for(lat, lng):
+	"""Grid cell id for a point, or ``None`` when the point is missing or invalid."""
+	if not valid_point(lat, lng):
+		return None
+	return _row(lat) * ROW_WIDTH + _col(lng)
+
+
+def cell_ranges(lat: float, lng: float, radius_km: float):
+	"""``[(first_cell, last_cell), ...]`` per grid row covering ``radius_km`` around a point."""
+	dlat = radius_km / KM_PER_DEGREE_LAT
+	# Longitude degrees shrink towards the poles: size the box at its poleward edge
+	poleward = min(90.0, abs(lat) + dlat)
+	dlng = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(poleward)), 0.01))
+	lo_col = _col(max(-180.0, lng - dlng))
+	hi_col = _col(min(180.0, lng + dlng))
+	return [
+		(row * ROW_WIDTH + lo_col, row * ROW_WIDTH + hi_col)
+		for row in range(_row(max(-90.0, lat - dlat)), _row(min(90.0, lat + dlat)) + 1)
+	]
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> float:
+	p1, p2 = math.radians(lat1), math.radians(lat2)
+	dp = p2 - p1
+	dl = math.radians(lng2 - lng1)
+	a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+	return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,109 @@
+"""
+Password hashing off the request threads.
+
+PBKDF2 costs hundreds of milliseconds of CPU per call. The async login and
+register views (``login_page``, ``register``) hand every hash to ``pool``: a
+``ThreadPoolExecutor`` of ``RESTAURANT_HASH_WORKERS`` threads (hashlib
+releases the GIL while it hashes, so threads run in parallel) in front of a
+queue at most ``RESTAURANT_HASH_QUEUE`` deep. When the queue is full ``run``
+raises ``Overloaded`` straight away and the view answers 503, so a login
+rush sheds load instead of stalling the workers that serve every other API.
+
+``pool.stats()`` reports queue depth, shed count and how long hashes waited
+for a worker; ``/api/admin/health`` includes it.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+WAIT_SAMPLES = 1024
+
+
+class Overloaded(Exception):
+	"""The hash queue is full; retry shortly."""
+
+
+def _percentile(ordered, pct):
+	if not ordered:
+		return 0.0
+	return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class HashPool:
+	def __init__(self, workers: int, queue_depth: int):
+		self.workers = workers
+		self.queue_depth = queue_depth
+		self._executor = None
+		self._lock = threading.Lock()
+		self._pending = 0
+		self._completed = 0
+		self._shed = 0
+		self._waits = deque(maxlen=WAIT_SAMPLES)
+
+	def _get_executor(self):
+		if self._executor is None:
+			self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hash')
+		return self._executor
+
+	def _call(self, queued_at, fn, args):
+		self._waits.append(time.perf_counter() - queued_at)
+		try:
+			return fn(*args)
+		finally:
+			with self._lock:
+				self._pending -= 1
+				self._completed += 1
+
+	async def run(self, fn, *args):
+		"""Run ``fn(*args)`` on a hash worker; ``Overloaded`` if workers and queue are full."""
+		with self._lock:
+			if self._pending >= self.workers + self.queue_depth:
+				self._shed += 1
+				raise Overloaded()
+			self._pending += 1
+			executor = self._get_executor()
+		try:
+			future = executor.submit(self._call, time.perf_counter(), fn, args)
+		except BaseException:
+			with self._lock:
+				self._pending -= 1
+			raise
+		return await asyncio.wrap_future(future)
+
+	def stats(self) -> dict:
+		waits = sorted(self._waits)
+		return {
+			'workers': self.workers,
+			'queue_limit': self.queue_depth,
+			'in_flight': self._pending,
+			'completed': self._completed,
+			'shed': self._shed,
+			'wait_ms_p50': round(_percentile(waits, 50) * 1000, 2),
+			'wait_ms_p95': round(_percentile(waits, 95) * 1000, 2),
+			'wait_ms_max': round((waits[-1] if waits else 0.0) * 1000, 2),
+		}
+
+
+def verify(password: str, encoded: str):
+	"""``(matches, needs_rehash)``; pure CPU, safe to run on a hash worker."""
+	if not check_password(password, encoded):
+		return False, False
+	try:
+		return True, identify_hasher(encoded).must_update(encoded)
+	except ValueError:
+		return True, False
+
+
+def hash_password(password: str) -> str:
+	return make_password(password)
+
+
+pool = HashPool(
+	workers=getattr(settings, 'RESTAURANT_HASH_WORKERS', 4),
+	queue_depth=getattr(settings, 'RESTAURANT_HASH_QUEUE', 8),
+)
@@ -0,0 +1,55 @@
+"""
+Order status history.
+
+Every status change is appended to ``OrderStatusEvent``: the ``post_save``
+handler covers ``save()`` callers, and the bulk paths (order pipeline,
+``dispatch``, ``transitions``) call ``record`` for their whole batch, which
+costs one grouped read for the previous event times plus one
+``bulk_create``. Once the transaction commits the new rows are fed to the
+in-memory ETA model (``restaurant.eta``).
+"""
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import eta
+from .models import OrderStatusEvent
+
+
+def record(changes, at=None):
+	"""
+	Append one event per ``(order, from_status, to_status)``.
+
+	``from_status`` is ``''`` for a newly created order.
+	"""
+	if not changes:
+		return []
+	at = at or timezone.now()
+	moved = [order.pk for order, source, _ in changes if source]
+	previous = {}
+	if moved:
+		previous = dict(
+			OrderStatusEvent.objects.filter(order_id__in=moved)
+			.values('order_id')
+			.annotate(last=Max('created_at'))
+			.values_list('order_id', 'last')
+		)
+	rows = []
+	for order, source, target in changes:
+		since = previous.get(order.pk)
+		rows.append(OrderStatusEvent(
+			order_id=order.pk,
+			from_status=source or '',
+			to_status=target,
+			order_type=order.order_type,
+			duration_seconds=(at - since).total_seconds() if since else None,
+			created_at=at,
+		))
+	OrderStatusEvent.objects.bulk_create(rows)
+	transaction.on_commit(lambda: eta.model.apply(rows))
+	return rows
+
+
+def timeline(order_id):
+	"""The order's status changes, oldest first."""
+	return list(OrderStatusEvent.objects.filter(order_id=order_id).order_by('created_at', 'id'))
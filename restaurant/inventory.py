@@ -0,0 +1,325 @@
+"""
+Stock deduction for orders.
+
+Every sellable thing is compiled once into a bill of materials: a menu item
+maps to its ``IngredientUsage`` rows, a food set to the sum of its
+``SetItem`` components' usages. The compiled ``BillOfMaterials`` is cached in
+process memory under the ``bom_version`` counter (bumped by signals on
+``MenuItem``, ``FoodSet``, ``SetItem`` and ``IngredientUsage``) and at most
+``BOM_MAX_AGE`` seconds, so a recipe edited in another worker is picked up
+even when the cache backend is per process. Exploding an order into
+ingredient quantities runs no queries.
+
+Applying a deduction costs one ``F()`` UPDATE per distinct ingredient plus a
+single ``bulk_create`` of ``InventoryTransaction`` rows, whatever the number
+of order lines. ``change_qty`` on those rows is a signed delta (negative for
+stock going out) so the ledger sums to the stock level. Cancelling an order
+writes the mirror-image ``in`` rows (``return_stock``).
+
+``StockCheckpoint`` rows snapshot each ingredient's stock periodically, so the
+stock at any instant is one checkpoint plus a short ledger tail instead of a
+sum over the whole ledger.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.db.models import Case, F, FloatField, Max, Sum, When
+from django.db.models.functions import Abs
+from django.utils import timezone
+
+from . import changelog, counters
+from .models import FoodSet, Ingredient, IngredientUsage, InventoryTransaction, SetItem, StockCheckpoint
+from .versioning import bump_version, get_version
+
+BOM_VERSION_KEY = 'restaurant:bom_version'
+# Seconds a compiled BOM is used without a version bump reaching this process
+BOM_MAX_AGE = 30
+
+
+@dataclass
+class BillOfMaterials:
+	version: int
+	# menu_item_id -> {ingredient_id: quantity per unit}
+	items: dict
+	# food_set_id -> {ingredient_id: quantity per set}
+	sets: dict
+	# food_set_id -> (menu_item_id, ...)
+	set_items: dict
+	# Reverse indexes: ingredient_id -> {menu_item_id}, menu_item_id -> {food_set_id}
+	ingredient_items: dict
+	item_sets: dict
+	built_at: float = field(default_factory=time.monotonic)
+
+	def explode(self, lines):
+		"""
+		Aggregate ingredient quantities for ``(menu_item_id, food_set_id, quantity)`` lines.
+		"""
+		totals = {}
+		for menu_item_id, food_set_id, qty in lines:
+			if food_set_id is not None:
+				usage = self.sets.get(food_set_id)
+			else:
+				usage = self.items.get(menu_item_id)
+			if not usage:
+				continue
+			for ingredient_id, per_unit in usage.items():
+				totals[ingredient_id] = totals.get(ingredient_id, 0.0) + per_unit * qty
+		return totals
+
+
+def bom_version() -> int:
+	return get_version(BOM_VERSION_KEY)
+
+
+def bump_bom_version():
+	bump_version(BOM_VERSION_KEY)
+
+
+def build_bom(version: int) -> BillOfMaterials:
+	items = {}
+	for menu_item_id, ingredient_id, qty in IngredientUsage.objects.values_list('menu_item_id', 'ingredient_id', 'quantity_per_unit'):
+		if qty:
+			items.setdefault(menu_item_id, {})[ingredient_id] = qty
+	sets = {set_id: {} for set_id in FoodSet.objects.values_list('id', flat=True)}
+	set_items, item_sets = {}, {}
+	for set_id, menu_item_id, count in SetItem.objects.values_list('food_set_id', 'menu_item_id', 'quantity'):
+		usage = sets.setdefault(set_id, {})
+		for ingredient_id, per_unit in items.get(menu_item_id, {}).items():
+			usage[ingredient_id] = usage.get(ingredient_id, 0.0) + per_unit * count
+		set_items.setdefault(set_id, []).append(menu_item_id)
+		item_sets.setdefault(menu_item_id, set()).add(set_id)
+	ingredient_items = {}
+	for menu_item_id, usage in items.items():
+		for ingredient_id in usage:
+			ingredient_items.setdefault(ingredient_id, set()).add(menu_item_id)
+	return BillOfMaterials(
+		version=version,
+		items=items,
+		sets=sets,
+		set_items={k: tuple(v) for k, v in set_items.items()},
+		ingredient_items=ingredient_items,
+		item_sets=item_sets,
+	)
+
+
+_bom = None
+_bom_lock = threading.Lock()
+
+
+def _fresh(bom, version) -> bool:
+	return bom is not None and bom.version == version and time.monotonic() - bom.built_at < BOM_MAX_AGE
+
+
+def get_bom() -> BillOfMaterials:
+	global _bom
+	version = bom_version()
+	bom = _bom
+	if _fresh(bom, version):
+		return bom
+	with _bom_lock:
+		bom = _bom
+		if not _fresh(bom, version):
+			bom = build_bom(version)
+			_bom = bom
+	return bom
+
+
+def order_lines(items):
+	return [(it.menu_item_id, it.food_set_id, it.quantity) for it in items]
+
+
+def deduct_stock(orders_with_items, reason='order'):
+	"""
+	Take stock out for ``[(order, order_items), ...]``; run inside the order's transaction.
+
+	Returns ``{ingredient_id: quantity}`` that was deducted in total.
+	"""
+	bom = get_bom()
+	totals, ledger = {}, []
+	for order, items in orders_with_items:
+		for ingredient_id, qty in bom.explode(order_lines(items)).items():
+			totals[ingredient_id] = totals.get(ingredient_id, 0.0) + qty
+			ledger.append(InventoryTransaction(
+				ingredient_id=ingredient_id,
+				order=order,
+				change_qty=-qty,
+				type=InventoryTransaction.TYPE_OUT,
+				reason=f'{reason} #{order.pk}',
+			))
+	# Fixed order keeps concurrent writers from locking rows in different orders
+	for ingredient_id in sorted(totals):
+		Ingredient.objects.filter(pk=ingredient_id).update(stock_quantity=F('stock_quantity') - totals[ingredient_id])
+	changelog.record(changelog.ENTITY_INGREDIENT, sorted(totals))
+	if ledger:
+		InventoryTransaction.objects.bulk_create(ledger)
+		counters.add({'inventory_transactions': len(ledger)})
+	return totals
+
+
+def return_stock(order_ids, reason='cancel'):
+	"""
+	Put back what the ledger took out for ``order_ids``; run inside the cancelling transaction.
+
+	The reversal comes from the orders' own ledger rows rather than today's
+	recipes, and orders whose rows already net to zero get nothing back.
+	Returns ``{ingredient_id: quantity}`` that was returned in total.
+	"""
+	net = (
+		InventoryTransaction.objects
+		.filter(order_id__in=order_ids)
+		.values('order_id', 'ingredient_id')
+		.annotate(total=Sum(SIGNED_CHANGE))
+		.values_list('order_id', 'ingredient_id', 'total')
+	)
+	totals, ledger = {}, []
+	for order_id, ingredient_id, total in net:
+		if total >= 0:
+			continue
+		totals[ingredient_id] = totals.get(ingredient_id, 0.0) - total
+		ledger.append(InventoryTransaction(
+			ingredient_id=ingredient_id,
+			order_id=order_id,
+			change_qty=-total,
+			type=InventoryTransaction.TYPE_IN,
+			reason=f'{reason} #{order_id}',
+		))
+	for ingredient_id in sorted(totals):
+		Ingredient.objects.filter(pk=ingredient_id).update(stock_quantity=F('stock_quantity') + totals[ingredient_id])
+	if ledger:
+		changelog.record(changelog.ENTITY_INGREDIENT, sorted(totals))
+		InventoryTransaction.objects.bulk_create(ledger)
+		counters.add({'inventory_transactions': len(ledger)})
+	return totals
+
+
+# -------------------------
+# Ledger queries
+# -------------------------
+
+# ``out`` rows count as negative even if entered unsigned by hand
+SIGNED_CHANGE = Case(
+	When(type=InventoryTransaction.TYPE_OUT, then=-Abs(F('change_qty'))),
+	default=F('change_qty'),
+	output_field=FloatField(),
+)
+
+
+def ledger_totals(ingredient_ids, after=None, until=None):
+	"""``{ingredient_id: signed change}`` for ledger rows in ``(after, until]``."""
+	qs = InventoryTransaction.objects.filter(ingredient_id__in=ingredient_ids)
+	if after is not None:
+		qs = qs.filter(created_at__gt=after)
+	if until is not None:
+		qs = qs.filter(created_at__lte=until)
+	return dict(qs.values('ingredient_id').annotate(total=Sum(SIGNED_CHANGE)).values_list('ingredient_id', 'total'))
+
+
+def latest_checkpoints(ingredient_ids, at):
+	"""``{ingredient_id: StockCheckpoint}`` for the newest checkpoint at or before ``at``."""
+	latest = (
+		StockCheckpoint.objects
+		.filter(ingredient_id__in=ingredient_ids, taken_at__lte=at)
+		.values('ingredient_id')
+		.annotate(last=Max('taken_at'))
+		.values_list('ingredient_id', 'last')
+	)
+	by_time = {}
+	for ingredient_id, taken_at in latest:
+		by_time.setdefault(taken_at, []).append(ingredient_id)
+	found = {}
+	# Checkpoints are taken for every ingredient at the same instant, so this
+	# is normally a single query
+	for taken_at, ids in by_time.items():
+		for cp in StockCheckpoint.objects.filter(taken_at=taken_at, ingredient_id__in=ids):
+			found[cp.ingredient_id] = cp
+	return found
+
+
+def stock_at(ingredient_id: int, at):
+	"""
+	Stock of one ingredient at ``at``: the nearest checkpoint plus a bounded ledger tail.
+
+	With no checkpoint at or before ``at`` the nearest later checkpoint (or the
+	current ``stock_quantity``) is walked backwards instead.
+	"""
+	cp = latest_checkpoints([ingredient_id], at).get(ingredient_id)
+	if cp is not None:
+		return cp.stock_quantity + ledger_totals([ingredient_id], cp.taken_at, at).get(ingredient_id, 0.0)
+	later = StockCheckpoint.objects.filter(ingredient_id=ingredient_id, taken_at__gt=at).order_by('taken_at').first()
+	if later is not None:
+		return later.stock_quantity - ledger_totals([ingredient_id], at, later.taken_at).get(ingredient_id, 0.0)
+	current = Ingredient.objects.filter(pk=ingredient_id).values_list('stock_quantity', flat=True).first() or 0.0
+	return current - ledger_totals([ingredient_id], at).get(ingredient_id, 0.0)
+
+
+def _chunks(ids, size):
+	for start in range(0, len(ids), size):
+		yield ids[start:start + size]
+
+
+def take_checkpoints(at, chunk_size: int = 500):
+	"""
+	Record a checkpoint for every ingredient at ``at``; returns how many were written.
+
+	Each ingredient rolls its previous checkpoint forward by the ledger rows in
+	between. An ingredient's first checkpoint is derived backwards from its
+	current ``stock_quantity``.
+	"""
+	ids = list(Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+	written = 0
+	for chunk in _chunks(ids, chunk_size):
+		done = set(StockCheckpoint.objects.filter(ingredient_id__in=chunk, taken_at=at).values_list('ingredient_id', flat=True))
+		todo = [pk for pk in chunk if pk not in done]
+		if not todo:
+			continue
+		previous = latest_checkpoints(todo, at)
+		rows = []
+		by_time = {}
+		for pk in todo:
+			if pk in previous:
+				by_time.setdefault(previous[pk].taken_at, []).append(pk)
+		for taken_at, group in by_time.items():
+			tail = ledger_totals(group, taken_at, at)
+			for pk in group:
+				rows.append(StockCheckpoint(ingredient_id=pk, taken_at=at, stock_quantity=previous[pk].stock_quantity + tail.get(pk, 0.0)))
+		first = [pk for pk in todo if pk not in previous]
+		if first:
+			current = dict(Ingredient.objects.filter(pk__in=first).values_list('pk', 'stock_quantity'))
+			since = ledger_totals(first, at)
+			for pk in first:
+				rows.append(StockCheckpoint(ingredient_id=pk, taken_at=at, stock_quantity=current.get(pk, 0.0) - since.get(pk, 0.0)))
+		StockCheckpoint.objects.bulk_create(rows, ignore_conflicts=True)
+		written += len(rows)
+	return written
+
+
+def reconcile_stock(chunk_size: int = 500, tolerance: float = 1e-6):
+	"""
+	Yield ``(ingredient_id, stock_quantity, ledger_quantity)`` for every drifted ingredient.
+
+	Ingredients are streamed in primary-key chunks; per chunk the expected
+	stock is the latest checkpoint plus the ledger tail since it. Ingredients
+	without any checkpoint are skipped since the ledger alone has no opening
+	balance for them.
+	"""
+	now = timezone.now()
+	last_pk = 0
+	while True:
+		chunk = list(
+			Ingredient.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'stock_quantity')[:chunk_size]
+		)
+		if not chunk:
+			return
+		last_pk = chunk[-1][0]
+		stock = dict(chunk)
+		checkpoints = latest_checkpoints(list(stock), now)
+		by_time = {}
+		for pk, cp in checkpoints.items():
+			by_time.setdefault(cp.taken_at, []).append(pk)
+		for taken_at, group in by_time.items():
+			tail = ledger_totals(group, taken_at)
+			for pk in group:
+				expected = checkpoints[pk].stock_quantity + tail.get(pk, 0.0)
+				if abs(expected - stock[pk]) > tolerance:
+					yield pk, stock[pk], expected
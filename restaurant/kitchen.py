@@ -0,0 +1,66 @@
+"""
+Kitchen display queue.
+
+The queue is every pending or preparing order, oldest first. Alongside it
+the kitchen gets a cook list: how many of each dish to make across the whole
+queue, with food sets broken down into their component items. The cook list
+is one grouped query: ``OrderItem`` LEFT JOINs ``SetItem`` through its food
+set, so a plain item contributes one row and a set one row per component,
+and ``Coalesce`` picks whichever menu item applies.
+
+Displays refresh cheaply: ``queue_fingerprint`` is a single aggregate over
+the ``(status, created_at)`` index that changes whenever an order enters,
+leaves or changes inside the queue, so an unchanged queue answers 304; and
+``queue_orders(since=...)`` returns only orders updated after the client's
+last refresh. Push updates are on the ``staff`` topic of ``/api/events``.
+"""
+from django.db.models import Count, F, Max, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Order, OrderItem
+
+QUEUE_STATUSES = (Order.STATUS_PENDING, Order.STATUS_PREPARING)
+QUEUE_MAX = 500
+
+
+def queue():
+	return Order.objects.filter(status__in=QUEUE_STATUSES)
+
+
+def queue_fingerprint() -> str:
+	state = queue().aggregate(n=Count('id'), ids=Sum('id'), last=Max('updated_at'))
+	last = state['last'].isoformat() if state['last'] else ''
+	return f"{state['n']}-{state['ids'] or 0}-{last}"
+
+
+def queue_orders(since=None):
+	"""Queued orders with their items (two queries); only those updated after ``since`` if given."""
+	qs = queue().order_by('created_at', 'id')
+	if since is not None:
+		qs = qs.filter(updated_at__gt=since)
+	items = OrderItem.objects.select_related('menu_item', 'food_set').order_by('id')
+	return list(qs.prefetch_related(Prefetch('items', queryset=items))[:QUEUE_MAX])
+
+
+def queue_ids():
+	return list(queue().order_by('created_at', 'id').values_list('id', flat=True)[:QUEUE_MAX])
+
+
+def cook_list():
+	"""``[{'menu_item_id', 'name', 'quantity', 'orders'}, ...]`` to cook, largest first."""
+	rows = (
+		OrderItem.objects.filter(order__status__in=QUEUE_STATUSES)
+		.annotate(
+			dish_id=Coalesce('food_set__items__menu_item_id', 'menu_item_id'),
+			dish=Coalesce('food_set__items__menu_item__name', 'menu_item__name'),
+			portions=F('quantity') * Coalesce('food_set__items__quantity', Value(1)),
+		)
+		.filter(dish_id__isnull=False)
+		.values('dish_id', 'dish')
+		.annotate(quantity=Sum('portions'), orders=Count('order_id', distinct=True))
+		.order_by('-quantity', 'dish')
+	)
+	return [
+		{'menu_item_id': r['dish_id'], 'name': r['dish'], 'quantity': r['quantity'], 'orders': r['orders']}
+		for r in rows
+	]
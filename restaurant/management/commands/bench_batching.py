@@ -0,0 +1,62 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from restaurant.batching import Stop, build_batches, kitchen_location, route_length
+
+from .bench_voucher_redeem import percentile
+
+
+class Command(BaseCommand):
+    help = "Time batch recomputes over synthetic open delivery orders around the kitchen."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=500, help="Open delivery orders per recompute.")
+        parser.add_argument("--runs", type=int, default=50, help="Recomputes to time.")
+        parser.add_argument("--spread", type=float, default=0.08, help="Orders spread +/- degrees around the kitchen.")
+        parser.add_argument("--budget-ms", type=float, default=100.0, help="Fail if p95 exceeds this.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(7)
+        lat0, lng0 = kitchen_location()
+        spread = options["spread"]
+        now = timezone.now()
+        timings, sizes, saved = [], [], []
+        for _ in range(options["runs"]):
+            stops = [
+                Stop(
+                    order_id=i,
+                    lat=lat0 + rng.uniform(-spread, spread),
+                    lng=lng0 + rng.uniform(-spread, spread),
+                    ready_at=now - timedelta(seconds=rng.uniform(0, 1800)),
+                )
+                for i in range(options["orders"])
+            ]
+            started = time.perf_counter()
+            batches = build_batches(stops)
+            timings.append(time.perf_counter() - started)
+            sizes.extend(len(b.stops) for b in batches)
+            # Route length against visiting the stops in ready order
+            for b in batches:
+                naive = route_length((lat0, lng0), sorted(b.stops, key=lambda s: s.ready_at))
+                if naive:
+                    saved.append(1 - b.distance_km / naive)
+
+        p95 = percentile(timings, 95) * 1000
+        self.stdout.write(f"orders={options['orders']} runs={options['runs']}")
+        self.stdout.write(
+            "recompute ms: p50={:.1f} p95={:.1f} max={:.1f}".format(
+                percentile(timings, 50) * 1000, p95, max(timings) * 1000
+            )
+        )
+        multi = [n for n in sizes if n > 1]
+        self.stdout.write(
+            f"batches/run={len(sizes) / options['runs']:.0f} multi-drop={len(multi)} "
+            f"avg_stops={sum(sizes) / len(sizes):.2f} route_saving_vs_ready_order={100 * sum(saved) / max(1, len(saved)):.1f}%"
+        )
+        if p95 > options["budget_ms"]:
+            raise CommandError(f"p95 {p95:.1f}ms is over the {options['budget_ms']:.0f}ms budget")
+        self.stdout.write(self.style.SUCCESS("Within budget."))
@@ -0,0 +1,121 @@
+import random
+import time
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from restaurant import counters
+from restaurant.backends import resolve_user
+from restaurant.models import Profile
+
+from .bench_voucher_redeem import percentile
+
+PASSWORD = "bench-pass-123"
+
+
+def legacy_resolve(identifier):
+    """The lookups login_page used before IdentifierBackend (iexact, no functional index)."""
+    if "@" in identifier:
+        return User.objects.filter(email__iexact=identifier).first()
+    if identifier.isdigit():
+        profile = Profile.objects.select_related("user").filter(phone=identifier).first()
+        return profile.user if profile else None
+    return User.objects.filter(username__iexact=identifier).first()
+
+
+class Command(BaseCommand):
+    help = "Load many users and time login identifier lookups (indexed backend vs the old iexact lookups)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000000, help="Users (with profiles) to create.")
+        parser.add_argument("--lookups", type=int, default=2000, help="Indexed lookups to time per identifier kind.")
+        parser.add_argument("--legacy-lookups", type=int, default=20, help="Old-style lookups to time per kind.")
+        parser.add_argument("--logins", type=int, default=5, help="Full authenticate() calls (includes hashing).")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        total = options["users"]
+        tag = f"bl{int(time.time())}"
+        # One hash for everyone: hashing a million passwords would dominate the load
+        password = make_password(PASSWORD)
+
+        started = time.perf_counter()
+        batch_size = options["batch_size"]
+        for start in range(0, total, batch_size):
+            stop = min(start + batch_size, total)
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f"{tag}_{i}", email=f"{tag}.{i}@Bench.Example", password=password)
+                    for i in range(start, stop)
+                ])
+                Profile.objects.bulk_create([
+                    Profile(user_id=u.pk, phone=f"9{i:09d}") for i, u in zip(range(start, stop), users)
+                ])
+        counters.add({"users": total, "profiles": total})
+        self.stdout.write(f"loaded {total} users in {time.perf_counter() - started:.1f}s")
+
+        def identifiers(kind, n):
+            picks = [rng.randrange(total) for _ in range(n)]
+            if kind == "email":
+                return [f"{tag}.{i}@bench.example".upper() if i % 2 else f"{tag}.{i}@bench.example" for i in picks]
+            if kind == "phone":
+                return [f"9{i:09d}" for i in picks]
+            return [f"{tag.upper()}_{i}" for i in picks]
+
+        failures = 0
+        for kind in ("email", "phone", "username"):
+            for label, resolve, n in (
+                ("indexed", resolve_user, options["lookups"]),
+                ("legacy", legacy_resolve, options["legacy_lookups"]),
+            ):
+                samples = []
+                for identifier in identifiers(kind, n):
+                    t0 = time.perf_counter()
+                    user = resolve(identifier)
+                    samples.append(time.perf_counter() - t0)
+                    failures += user is None
+                self.stdout.write(
+                    "{:<8} {:<8} ms: p50={:.3f} p95={:.3f} p99={:.3f} max={:.3f} (n={})".format(
+                        kind,
+                        label,
+                        percentile(samples, 50) * 1000,
+                        percentile(samples, 95) * 1000,
+                        percentile(samples, 99) * 1000,
+                        max(samples or [0]) * 1000,
+                        n,
+                    )
+                )
+
+        samples = []
+        for identifier in identifiers("email", options["logins"]):
+            t0 = time.perf_counter()
+            user = authenticate(username=identifier, password=PASSWORD)
+            samples.append(time.perf_counter() - t0)
+            failures += user is None
+        self.stdout.write(
+            "authenticate() ms (password hashing included): p50={:.1f} max={:.1f}".format(
+                percentile(samples, 50) * 1000, max(samples or [0]) * 1000
+            )
+        )
+
+        if not options["keep"]:
+            # Raw deletes: a million collector-driven deletes would take far longer than the run
+            qn = connection.ops.quote_name
+            user_table = qn(User._meta.db_table)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {qn(Profile._meta.db_table)} WHERE user_id IN "
+                    f"(SELECT id FROM {user_table} WHERE username LIKE %s)",
+                    [f"{tag}_%"],
+                )
+                cursor.execute(f"DELETE FROM {user_table} WHERE username LIKE %s", [f"{tag}_%"])
+            counters.resync()
+
+        if failures:
+            raise CommandError(f"{failures} lookups did not find their user.")
+        self.stdout.write(self.style.SUCCESS("Every identifier resolved."))
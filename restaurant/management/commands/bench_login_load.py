@@ -0,0 +1,113 @@
+import asyncio
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from restaurant import hashing
+from restaurant.models import Profile
+
+from .bench_voucher_redeem import percentile
+
+PASSWORD = "bench-pass-123"
+
+
+class Command(BaseCommand):
+    help = (
+        "Storm the login page while timing an unrelated API call, with password checks on the hashing "
+        "pool (async login) or inline on the shared sync thread (the old login path)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=("pool", "inline", "both"), default="both")
+        parser.add_argument("--concurrency", type=int, default=32, help="Concurrent login loops.")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per mode.")
+        parser.add_argument("--probe-interval", type=float, default=0.05, help="Seconds between API probes.")
+        parser.add_argument("--users", type=int, default=50, help="Accounts to log in as.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        tag = f"bll{int(time.time())}"
+        password = make_password(PASSWORD)
+        users = User.objects.bulk_create([
+            User(username=f"{tag}_{i}", email=f"{tag}.{i}@bench.example", password=password)
+            for i in range(options["users"])
+        ])
+        Profile.objects.bulk_create([Profile(user_id=u.pk, role="staff") for u in users])
+        names = [u.username for u in users]
+
+        modes = ("inline", "pool") if options["mode"] == "both" else (options["mode"],)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                for mode in modes:
+                    self._report(mode, asyncio.run(self._storm(mode, names, options)))
+        finally:
+            if not options["keep"]:
+                User.objects.filter(username__startswith=f"{tag}_").delete()
+
+    async def _storm(self, mode, names, options):
+        rng = random.Random(7)
+        stop = time.perf_counter() + options["duration"]
+        outcome = {"ok": 0, "shed": 0, "failed": 0, "probe": []}
+        login_url = reverse("login")
+
+        async def login_loop():
+            client = AsyncClient()
+            while time.perf_counter() < stop:
+                username = rng.choice(names)
+                if mode == "pool":
+                    resp = await client.post(login_url, {"loginEmail": username, "loginPassword": PASSWORD})
+                    key = {302: "ok", 503: "shed"}.get(resp.status_code, "failed")
+                    if key == "shed":
+                        # Honour Retry-After like a browser retry would
+                        await asyncio.sleep(float(resp["Retry-After"]))
+                else:
+                    # Old login path: hashing on the thread every sync view shares
+                    user = await sync_to_async(authenticate)(username=username, password=PASSWORD)
+                    key = "ok" if user is not None else "failed"
+                outcome[key] += 1
+
+        async def probe():
+            client = AsyncClient()
+            url = reverse("api_menu_availability")
+            while time.perf_counter() < stop:
+                t0 = time.perf_counter()
+                await client.get(url)
+                outcome["probe"].append(time.perf_counter() - t0)
+                await asyncio.sleep(options["probe_interval"])
+
+        started = time.perf_counter()
+        await asyncio.gather(probe(), *(login_loop() for _ in range(options["concurrency"])))
+        outcome["elapsed"] = time.perf_counter() - started
+        return outcome
+
+    def _report(self, mode, outcome):
+        probe = outcome["probe"]
+        self.stdout.write(
+            "{:<6} logins/s={:.1f} ok={} shed={} failed={} | api ms: p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f} (n={})".format(
+                mode,
+                outcome["ok"] / outcome["elapsed"],
+                outcome["ok"],
+                outcome["shed"],
+                outcome["failed"],
+                percentile(probe, 50) * 1000,
+                percentile(probe, 95) * 1000,
+                percentile(probe, 99) * 1000,
+                max(probe or [0]) * 1000,
+                len(probe),
+            )
+        )
+        if mode == "pool":
+            stats = hashing.pool.stats()
+            self.stdout.write(
+                "       hash queue wait ms: p50={wait_ms_p50} p95={wait_ms_p95} max={wait_ms_max} "
+                "(workers={workers}, queue={queue_limit}, shed total={shed})".format(**stats)
+            )
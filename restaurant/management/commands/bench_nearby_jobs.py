@@ -0,0 +1,85 @@
+import heapq
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import dispatch, geo
+from restaurant.models import Order
+
+from .bench_voucher_redeem import percentile
+
+
+class Command(BaseCommand):
+    help = "Load open delivery orders around a city and time nearest-job lookups against a full scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=50000, help="Open orders to create.")
+        parser.add_argument("--queries", type=int, default=200, help="Lookups to time.")
+        parser.add_argument("--radius", type=float, default=5.0, help="Search radius in km.")
+        parser.add_argument("--limit", type=int, default=20, help="Jobs per lookup.")
+        parser.add_argument("--spread", type=float, default=0.3, help="Orders spread +/- degrees around the centre.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        centre_lat, centre_lng = 13.7563, 100.5018
+        spread = options["spread"]
+        radius, limit = options["radius"], options["limit"]
+        tag = f"bench_{int(time.time())}"
+
+        user, _ = User.objects.get_or_create(username=tag)
+        started = time.perf_counter()
+        batch = []
+        for _ in range(options["orders"]):
+            lat = centre_lat + rng.uniform(-spread, spread)
+            lng = centre_lng + rng.uniform(-spread, spread)
+            batch.append(Order(
+                user=user, order_type=Order.TYPE_DELIVERY, status=Order.STATUS_READY,
+                lat=lat, lng=lng, geo_cell=geo.cell_for(lat, lng), address_text=tag,
+            ))
+            if len(batch) == 2000:
+                Order.objects.bulk_create(batch)
+                batch = []
+        Order.objects.bulk_create(batch)
+        self.stdout.write(f"loaded {options['orders']} open orders in {time.perf_counter() - started:.1f}s")
+
+        points = [
+            (centre_lat + rng.uniform(-spread, spread), centre_lng + rng.uniform(-spread, spread))
+            for _ in range(options["queries"])
+        ]
+        indexed, scanned, mismatches = [], [], 0
+        for lat, lng in points:
+            t0 = time.perf_counter()
+            found = dispatch.nearby_jobs(lat, lng, radius, limit)
+            indexed.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            rows = dispatch.open_jobs().filter(lat__isnull=False, lng__isnull=False).values_list("id", "lat", "lng")
+            scored = ((geo.haversine_km(lat, lng, a, b), pk) for pk, a, b in rows)
+            best = heapq.nsmallest(limit, (s for s in scored if s[0] <= radius))
+            scanned.append(time.perf_counter() - t0)
+
+            if [pk for _, pk in best] != [row["id"] for _, row in found]:
+                mismatches += 1
+
+        for label, samples in (("grid index", indexed), ("full scan", scanned)):
+            self.stdout.write(
+                "{:<10} ms: p50={:.2f} p95={:.2f} p99={:.2f} max={:.2f}".format(
+                    label,
+                    percentile(samples, 50) * 1000,
+                    percentile(samples, 95) * 1000,
+                    percentile(samples, 99) * 1000,
+                    max(samples or [0]) * 1000,
+                )
+            )
+        self.stdout.write(f"radius={radius}km limit={limit} mismatched_results={mismatches}")
+
+        if not options["keep"]:
+            Order.objects.filter(user=user).delete()
+            user.delete()
+
+        if mismatches:
+            raise CommandError("Indexed lookup disagreed with the full scan.")
+        self.stdout.write(self.style.SUCCESS("Indexed lookups match the full scan."))
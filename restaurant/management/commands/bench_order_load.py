@@ -0,0 +1,174 @@
+import copy
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+
+from restaurant.models import MenuItem, Order
+from restaurant.orders import build_order, persist_order
+from restaurant.transitions import transition_orders
+
+from .bench_voucher_redeem import percentile
+
+# The settings the project used before the production profile: rollback journal,
+# deferred transactions, Python's 5 s busy timeout, a connection per request
+STOCK_PROFILE = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "CONN_MAX_AGE": 0,
+    "CONN_HEALTH_CHECKS": False,
+    "OPTIONS": {"init_command": "PRAGMA journal_mode=DELETE"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Create orders at a fixed rate while the kitchen advances them and readers poll, and fail on any "
+        "'database is locked' error under the configured database profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profile", choices=("production", "stock", "both"), default="production")
+        parser.add_argument("--rate", type=float, default=50.0, help="Target orders per second.")
+        parser.add_argument("--duration", type=float, default=20.0, help="Seconds per profile.")
+        parser.add_argument("--writers", type=int, default=16, help="Threads creating orders.")
+        parser.add_argument("--kitchen", type=int, default=2, help="Threads advancing order statuses.")
+        parser.add_argument("--readers", type=int, default=4, help="Threads polling recent orders.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        tag = f"OL{int(time.time())}"
+        user = User.objects.create(username=f"bench_{tag.lower()}")
+        staff = User.objects.create(username=f"bench_{tag.lower()}_staff")
+        item = MenuItem.objects.create(name=f"{tag} Noodles", price=Decimal("55.00"))
+        payload = {"type": "takeaway", "items": [{"menuItemId": item.pk, "quantity": 2}]}
+
+        configured = copy.deepcopy(connections.settings["default"])
+        profiles = ("stock", "production") if options["profile"] == "both" else (options["profile"],)
+        locked = {}
+        try:
+            for profile in profiles:
+                self._use(STOCK_PROFILE if profile == "stock" else configured)
+                outcome = self._run(user, staff, payload, options)
+                locked[profile] = outcome["locked"]
+                self._report(profile, outcome, options)
+        finally:
+            self._use(configured)
+            if not options["keep"]:
+                Order.objects.filter(user=user).delete()
+                item.delete()
+                staff.delete()
+                user.delete()
+
+        if locked.get("production"):
+            raise CommandError(f"{locked['production']} 'database is locked' errors under the production profile.")
+        if "production" in locked:
+            self.stdout.write(self.style.SUCCESS("No 'database is locked' errors under the production profile."))
+
+    def _use(self, profile):
+        """Point new connections at ``profile``; the journal mode sticks to the file, so set it now."""
+        connection.close()
+        settings_dict = connections.settings["default"]
+        settings_dict.update(copy.deepcopy({k: v for k, v in profile.items() if k != "NAME"}))
+        with connections["default"].cursor():
+            pass
+        connection.close()
+
+    def _run(self, user, staff, payload, options):
+        lock = threading.Lock()
+        outcome = {"latencies": [], "lag": [], "errors": [], "locked": 0, "moved": 0, "reads": 0}
+        rate = options["rate"]
+        started = time.perf_counter()
+        stop = started + options["duration"]
+        slots = iter(range(10**9))
+
+        def failed(exc):
+            with lock:
+                outcome["errors"].append(str(exc))
+                outcome["locked"] += "locked" in str(exc)
+
+        def writer():
+            try:
+                while True:
+                    with lock:
+                        due = started + next(slots) / rate
+                    if due >= stop:
+                        return
+                    time.sleep(max(0.0, due - time.perf_counter()))
+                    draft = build_order(user, payload)
+                    t0 = time.perf_counter()
+                    try:
+                        persist_order(draft)
+                    except DatabaseError as exc:
+                        failed(exc)
+                        continue
+                    with lock:
+                        outcome["latencies"].append(time.perf_counter() - t0)
+                        outcome["lag"].append(t0 - due)
+            finally:
+                connection.close()
+
+        def kitchen():
+            try:
+                while time.perf_counter() < stop:
+                    try:
+                        for source, target in ((Order.STATUS_PREPARING, Order.STATUS_READY), (Order.STATUS_PENDING, Order.STATUS_PREPARING)):
+                            ids = list(Order.objects.filter(user=user, status=source).values_list("id", flat=True)[:25])
+                            if ids:
+                                moved = transition_orders(staff, "staff", ids, target)
+                                with lock:
+                                    outcome["moved"] += sum(o.outcome == "ok" for o in moved)
+                    except DatabaseError as exc:
+                        failed(exc)
+                    time.sleep(0.05)
+            finally:
+                connection.close()
+
+        def reader():
+            try:
+                while time.perf_counter() < stop:
+                    try:
+                        list(Order.objects.filter(user=user).order_by("-id").values("id", "status", "total")[:50])
+                    except DatabaseError as exc:
+                        failed(exc)
+                        continue
+                    with lock:
+                        outcome["reads"] += 1
+                    time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(options["writers"])]
+        threads += [threading.Thread(target=kitchen) for _ in range(options["kitchen"])]
+        threads += [threading.Thread(target=reader) for _ in range(options["readers"])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        outcome["elapsed"] = time.perf_counter() - started
+        return outcome
+
+    def _report(self, profile, outcome, options):
+        latencies = outcome["latencies"]
+        self.stdout.write(
+            "{:<10} orders={} ({:.1f}/s of {:.0f}/s) create ms: p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f} "
+            "start lag p99={:.0f} ms | moved={} reads={} errors={} locked={}".format(
+                profile,
+                len(latencies),
+                len(latencies) / outcome["elapsed"],
+                options["rate"],
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000,
+                max(latencies or [0]) * 1000,
+                percentile(outcome["lag"], 99) * 1000,
+                outcome["moved"],
+                outcome["reads"],
+                len(outcome["errors"]),
+                outcome["locked"],
+            )
+        )
+        for msg in sorted(set(outcome["errors"]))[:3]:
+            self.stdout.write(self.style.WARNING(f"error: {msg}"))
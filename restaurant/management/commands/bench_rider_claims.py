@@ -0,0 +1,102 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from restaurant import dispatch
+from restaurant.models import MenuItem, Order, RiderAssignment
+from restaurant.orders import build_order, persist_orders
+
+from .bench_voucher_redeem import percentile
+
+
+class Command(BaseCommand):
+    help = "Fire N concurrent claims at each ready job and verify every job gets exactly one rider."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=20, help="Ready jobs to fight over.")
+        parser.add_argument("--riders", type=int, default=16, help="Concurrent claims per job (threads).")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        jobs = options["jobs"]
+        riders = options["riders"]
+        tag = f"BENCH{int(time.time())}"
+
+        customer, _ = User.objects.get_or_create(username=f"bench_{tag.lower()}")
+        rider_users = [User(username=f"bench_{tag.lower()}_r{i}") for i in range(riders)]
+        User.objects.bulk_create(rider_users)
+        rider_users = list(User.objects.filter(username__startswith=f"bench_{tag.lower()}_r"))
+        item = MenuItem.objects.create(name=f"{tag} Rice", price=Decimal("100.00"))
+        payload = {"type": "delivery", "address": "Bench", "items": [{"menuItemId": item.pk, "quantity": 1}]}
+        persist_orders([build_order(customer, payload) for _ in range(jobs)])
+        order_ids = list(Order.objects.filter(user=customer).values_list("pk", flat=True))
+        Order.objects.filter(pk__in=order_ids).update(status=Order.STATUS_READY)
+
+        lock = threading.Lock()
+        latencies, errors = [], []
+        outcomes = {}
+        winners = {pk: [] for pk in order_ids}
+        started_at = time.perf_counter()
+
+        for order_id in order_ids:
+            barrier = threading.Barrier(riders)
+
+            def worker(rider, order_id=order_id, barrier=barrier):
+                try:
+                    barrier.wait()
+                    started = time.perf_counter()
+                    try:
+                        outcome = dispatch.claim_job(order_id, rider)
+                    except DatabaseError as exc:
+                        outcome = "error"
+                        with lock:
+                            errors.append(str(exc))
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                        if outcome == dispatch.CLAIMED:
+                            winners[order_id].append(rider.pk)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=worker, args=(r,)) for r in rider_users]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        wall = time.perf_counter() - started_at
+
+        stored = dict(RiderAssignment.objects.filter(order_id__in=order_ids).values_list("order_id", "rider_id"))
+        double = [pk for pk, won in winners.items() if len(won) > 1]
+        mismatched = [pk for pk, won in winners.items() if len(won) == 1 and stored.get(pk) != won[0]]
+        unclaimed = [pk for pk, won in winners.items() if not won]
+
+        self.stdout.write(f"jobs={jobs} claims_per_job={riders} total_claims={len(latencies)}")
+        self.stdout.write("outcomes: " + " ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+        self.stdout.write(
+            "claim latency ms: p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}".format(
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000,
+                max(latencies or [0]) * 1000,
+            )
+        )
+        self.stdout.write(f"throughput={len(latencies) / wall:.1f} claims/s over {wall:.2f}s")
+        self.stdout.write(f"double_assigned={len(double)} mismatched={len(mismatched)} unclaimed={len(unclaimed)}")
+        for msg in sorted(set(errors))[:5]:
+            self.stdout.write(self.style.WARNING(f"error: {msg}"))
+
+        if not options["keep"]:
+            Order.objects.filter(pk__in=order_ids).delete()
+            item.delete()
+            User.objects.filter(pk__in=[r.pk for r in rider_users]).delete()
+            customer.delete()
+
+        if double or mismatched:
+            raise CommandError("A job was assigned to more than one rider.")
+        self.stdout.write(self.style.SUCCESS("Every job has at most one rider."))
@@ -0,0 +1,145 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from restaurant.models import MenuItem, Order
+from restaurant.orders import build_order, persist_order
+from restaurant.roles import role_home
+from restaurant.sessions import is_signed
+
+from .bench_voucher_redeem import percentile
+
+# mode -> (SESSION_ENGINE, RESTAURANT_COOKIE_SESSION_ROLES)
+MODES = {
+    "db": ("django.contrib.sessions.backends.db", ()),
+    "cache": ("restaurant.sessions", ()),
+    "cookie": ("restaurant.sessions", None),  # None: the configured roles
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time order creation while other threads log in and browse role pages, under the stock database "
+        "sessions, the cache-first store and signed-cookie sessions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=(*MODES, "all"), default="all")
+        parser.add_argument("--ordering", type=int, default=4, help="Threads creating orders.")
+        parser.add_argument("--browsing", type=int, default=8, help="Threads logging in and loading pages.")
+        parser.add_argument("--reads", type=int, default=3, help="Role page loads after each login.")
+        parser.add_argument("--role", default="customer", help="Demo role the browsing threads log in as.")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per mode.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        tag = f"BS{int(time.time())}"
+        user = User.objects.create(username=f"bench_{tag.lower()}")
+        item = MenuItem.objects.create(name=f"{tag} Rice", price=Decimal("60.00"))
+        payload = {"type": "takeaway", "items": [{"menuItemId": item.pk, "quantity": 1}]}
+
+        modes = tuple(MODES) if options["mode"] == "all" else (options["mode"],)
+        session_keys = []
+        try:
+            for mode in modes:
+                engine, roles = MODES[mode]
+                roles = settings.RESTAURANT_COOKIE_SESSION_ROLES if roles is None else roles
+                with override_settings(
+                    SESSION_ENGINE=engine,
+                    RESTAURANT_COOKIE_SESSION_ROLES=roles,
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                ):
+                    outcome = self._run(user, payload, options)
+                session_keys.extend(outcome["session_keys"])
+                self._report(mode, outcome)
+        finally:
+            if not options["keep"]:
+                Order.objects.filter(user=user).delete()
+                item.delete()
+                user.delete()
+                Session.objects.filter(session_key__in=session_keys).delete()
+
+    def _run(self, user, payload, options):
+        stop = time.perf_counter() + options["duration"]
+        lock = threading.Lock()
+        outcome = {"orders": [], "order_errors": [], "logins": 0, "reads": 0, "browse_errors": 0, "session_keys": []}
+        login_url = reverse("login_demo", args=[options["role"]])
+        page_url = role_home(options["role"])
+
+        def ordering():
+            try:
+                while time.perf_counter() < stop:
+                    draft = build_order(user, payload)
+                    started = time.perf_counter()
+                    try:
+                        persist_order(draft)
+                    except DatabaseError as exc:
+                        with lock:
+                            outcome["order_errors"].append(str(exc))
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        outcome["orders"].append(elapsed)
+            finally:
+                connection.close()
+
+        def browsing():
+            try:
+                while time.perf_counter() < stop:
+                    client = Client()
+                    try:
+                        if client.get(login_url).status_code >= 400:
+                            raise DatabaseError("login failed")
+                        cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+                        reads = sum(client.get(page_url).status_code == 200 for _ in range(options["reads"]))
+                    except DatabaseError:
+                        with lock:
+                            outcome["browse_errors"] += 1
+                        continue
+                    with lock:
+                        outcome["logins"] += 1
+                        outcome["reads"] += reads
+                        if cookie is not None and cookie.value and not is_signed(cookie.value):
+                            outcome["session_keys"].append(cookie.value)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=ordering) for _ in range(options["ordering"])]
+        threads += [threading.Thread(target=browsing) for _ in range(options["browsing"])]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        outcome["elapsed"] = time.perf_counter() - started
+        return outcome
+
+    def _report(self, mode, outcome):
+        orders = outcome["orders"]
+        self.stdout.write(
+            "{:<6} orders={} p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f} ms errors={} | logins/s={:.1f} "
+            "page loads={} browse errors={} session rows={}".format(
+                mode,
+                len(orders),
+                percentile(orders, 50) * 1000,
+                percentile(orders, 95) * 1000,
+                percentile(orders, 99) * 1000,
+                max(orders or [0]) * 1000,
+                len(outcome["order_errors"]),
+                outcome["logins"] / outcome["elapsed"],
+                outcome["reads"],
+                outcome["browse_errors"],
+                len(outcome["session_keys"]),
+            )
+        )
+        for msg in sorted(set(outcome["order_errors"]))[:3]:
+            self.stdout.write(self.style.WARNING(f"error: {msg}"))
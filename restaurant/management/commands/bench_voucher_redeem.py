@@ -0,0 +1,108 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from restaurant.models import MenuItem, Order, Voucher, VoucherRedemption
+from restaurant.orders import build_order, persist_order
+from restaurant.vouchers import VoucherUnavailable
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class Command(BaseCommand):
+    help = "Race N parallel checkouts against one limited voucher and verify it is never over-redeemed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--redeemers", type=int, default=200, help="Parallel checkouts (threads).")
+        parser.add_argument("--limit", type=int, default=50, help="Voucher usage_limit for the run.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        redeemers = options["redeemers"]
+        limit = options["limit"]
+        tag = f"BENCH{int(time.time())}"
+
+        user, _ = User.objects.get_or_create(username=f"bench_{tag.lower()}")
+        item = MenuItem.objects.create(name=f"{tag} Rice", price=Decimal("100.00"))
+        voucher = Voucher.objects.create(
+            code=tag,
+            discount_type=Voucher.DISCOUNT_FIXED,
+            amount=Decimal("10.00"),
+            usage_limit=limit,
+        )
+        payload = {"type": "takeaway", "voucherCode": tag, "items": [{"menuItemId": item.pk, "quantity": 1}]}
+
+        released = []
+        barrier = threading.Barrier(redeemers, action=lambda: released.append(time.perf_counter()))
+        lock = threading.Lock()
+        latencies, outcomes = [], {"ok": 0, "rejected": 0, "error": 0}
+        errors = []
+
+        def worker():
+            try:
+                draft = build_order(user, payload)
+                barrier.wait()
+                started = time.perf_counter()
+                try:
+                    persist_order(draft)
+                    outcome = "ok"
+                except VoucherUnavailable:
+                    outcome = "rejected"
+                except DatabaseError as exc:
+                    outcome = "error"
+                    with lock:
+                        errors.append(str(exc))
+                elapsed = time.perf_counter() - started
+                with lock:
+                    outcomes[outcome] += 1
+                    latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(redeemers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - released[0]
+
+        voucher.refresh_from_db()
+        ledger = VoucherRedemption.objects.filter(voucher=voucher).count()
+        self.stdout.write(f"redeemers={redeemers} usage_limit={limit}")
+        self.stdout.write(
+            f"succeeded={outcomes['ok']} rejected={outcomes['rejected']} errors={outcomes['error']}"
+        )
+        self.stdout.write(f"used_count={voucher.used_count} ledger_rows={ledger}")
+        self.stdout.write(
+            "checkout latency ms: p50={:.1f} p95={:.1f} p99={:.1f} max={:.1f}".format(
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000,
+                max(latencies or [0]) * 1000,
+            )
+        )
+        self.stdout.write(f"throughput={len(latencies) / wall:.1f} checkouts/s over {wall:.2f}s")
+        for msg in sorted(set(errors))[:5]:
+            self.stdout.write(self.style.WARNING(f"error: {msg}"))
+
+        over = voucher.used_count > limit or voucher.used_count != outcomes["ok"] or ledger != outcomes["ok"]
+
+        if not options["keep"]:
+            Order.objects.filter(user=user).delete()
+            voucher.delete()
+            item.delete()
+            user.delete()
+
+        if over:
+            raise CommandError("Voucher was over-redeemed or the ledger does not match used_count.")
+        self.stdout.write(self.style.SUCCESS("No over-redemption."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.changelog import compact
+
+
+class Command(BaseCommand):
+    help = "Drop sync change-log rows superseded by a later change to the same object (run from cron)."
+
+    def handle(self, *args, **options):
+        removed = compact()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} superseded changes"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from restaurant.sessions import PURGE_CHUNK, purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in short chunks so order writes are not blocked (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=PURGE_CHUNK, help="Rows deleted per statement.")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds to wait between chunks.")
+
+    def handle(self, *args, **options):
+        removed = purge_expired(chunk=options["chunk"], pause=options["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired sessions"))
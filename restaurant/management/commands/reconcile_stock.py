@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from restaurant import changelog, counters
+from restaurant.availability import refresh_availability
+from restaurant.inventory import reconcile_stock
+from restaurant.models import Ingredient, InventoryTransaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify Ingredient.stock_quantity against checkpoints plus the inventory ledger. Drift means either "
+        "the stock column or the ledger is wrong (e.g. stock edited in the admin, which writes no ledger row): "
+        "--fix restores stock from the ledger, --adopt-stock books the difference into the ledger instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--tolerance", type=float, default=1e-6)
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument("--fix", action="store_true", help="Overwrite drifted stock with the ledger value.")
+        mode.add_argument(
+            "--adopt-stock",
+            action="store_true",
+            help="Keep the stock on hand and write a correcting ledger entry for the difference.",
+        )
+        parser.add_argument(
+            "--noinput", "--no-input", action="store_false", dest="interactive",
+            help="Do not ask before overwriting stock.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = list(reconcile_stock(options["chunk_size"], options["tolerance"]))
+        for pk, stock, expected in drifted:
+            self.stdout.write(self.style.WARNING(f"ingredient {pk}: stock={stock} ledger={expected}"))
+        if drifted and options["fix"]:
+            if options["interactive"] and not self._confirm(len(drifted)):
+                raise CommandError("Cancelled; stock left as it was.")
+            self._restore_stock(drifted)
+        elif drifted and options["adopt_stock"]:
+            self._book_difference(drifted)
+        elif drifted:
+            raise CommandError(f"{len(drifted)} ingredient(s) drifted from the ledger")
+        self.stdout.write(self.style.SUCCESS(f"Reconciled; {len(drifted)} ingredient(s) drifted."))
+
+    def _confirm(self, count):
+        answer = input(
+            f"Overwrite stock of {count} ingredient(s) with the ledger value? Stock edited outside the "
+            "ledger (e.g. in the admin) will be lost; --adopt-stock keeps it. [y/N] "
+        )
+        return answer.strip().lower() in ("y", "yes")
+
+    def _restore_stock(self, drifted):
+        ids = [pk for pk, _, _ in drifted]
+        with transaction.atomic():
+            for pk, _, expected in drifted:
+                Ingredient.objects.filter(pk=pk).update(stock_quantity=expected)
+            changelog.record(changelog.ENTITY_INGREDIENT, ids)
+            # The update skips signals: re-evaluate what these ingredients make sellable
+            refresh_availability(ingredient_ids=ids)
+
+    def _book_difference(self, drifted):
+        ledger = []
+        for pk, stock, expected in drifted:
+            difference = stock - expected
+            ledger.append(InventoryTransaction(
+                ingredient_id=pk,
+                change_qty=difference,
+                type=InventoryTransaction.TYPE_IN if difference > 0 else InventoryTransaction.TYPE_OUT,
+                reason="reconcile: stock changed outside the ledger",
+            ))
+        with transaction.atomic():
+            InventoryTransaction.objects.bulk_create(ledger)
+            counters.add({"inventory_transactions": len(ledger)})
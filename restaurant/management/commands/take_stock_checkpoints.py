@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from restaurant.inventory import take_checkpoints
+
+
+class Command(BaseCommand):
+    help = "Checkpoint every ingredient's stock at the last hour/day boundary (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", choices=["hour", "day"], default="hour")
+        parser.add_argument("--at", help="Explicit ISO datetime instead of the last boundary.")
+
+    def handle(self, *args, **options):
+        if options["at"]:
+            at = parse_datetime(options["at"])
+            if at is None:
+                raise CommandError("--at must be an ISO datetime")
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+        else:
+            at = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+            if options["interval"] == "day":
+                at = at.replace(hour=0)
+        written = take_checkpoints(at)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} checkpoints at {at.isoformat()}"))
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+
+def normalize(code):
+    return (code or '').strip().casefold()
+
+
+def fill_normalized_code(apps, schema_editor):
+    Voucher = apps.get_model('restaurant', 'Voucher')
+    codes = {}
+    for pk, code in Voucher.objects.values_list('pk', 'code').iterator():
+        codes.setdefault(normalize(code), []).append((pk, code))
+    # ``code`` is unique case-sensitively; the new index is not. Picking a winner would change
+    # which voucher customers redeem, so stop and let an operator rename or delete the extras.
+    conflicts = {normalized: rows for normalized, rows in codes.items() if len(rows) > 1}
+    if conflicts:
+        listing = '; '.join(
+            ', '.join(f'{code!r} (id {pk})' for pk, code in rows) for rows in conflicts.values()
+        )
+        raise RuntimeError(
+            'Voucher codes that differ only in case or surrounding spaces cannot share the unique '
+            f'normalized_code index. Rename or delete all but one of each group, then migrate again: {listing}'
+        )
+    for normalized, rows in codes.items():
+        Voucher.objects.filter(pk=rows[0][0]).update(normalized_code=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0005_voucherredemption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='normalized_code',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_normalized_code, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='voucher',
+            name='normalized_code',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+    ]
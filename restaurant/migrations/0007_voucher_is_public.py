@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0006_voucher_normalized_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='is_public',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['is_public', 'active'], name='voucher_public_active_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_voucher_is_public'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodset',
+            name='in_stock',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='menuitem',
+            name='in_stock',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+    ]
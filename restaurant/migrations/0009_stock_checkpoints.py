@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0008_menu_in_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('stock_quantity', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['ingredient', 'created_at'], name='inventory_tx_ingredient_time'),
+        ),
+        migrations.AddField(
+            model_name='stockcheckpoint',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='restaurant.ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockcheckpoint',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'taken_at'), name='stock_checkpoint_unique'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0009_stock_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
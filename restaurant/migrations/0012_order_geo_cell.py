@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+from restaurant.geo import cell_for
+
+
+def fill_geo_cell(apps, schema_editor):
+    Order = apps.get_model('restaurant', 'Order')
+    located = Order.objects.filter(lat__isnull=False, lng__isnull=False).only('pk', 'lat', 'lng')
+    for order in located.iterator():
+        Order.objects.filter(pk=order.pk).update(geo_cell=cell_for(order.lat, order.lng))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0011_order_user_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_geo_cell, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'geo_cell'], name='order_status_geo_idx'),
+        ),
+    ]
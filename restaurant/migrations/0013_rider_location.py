@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0012_order_geo_cell'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiderLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat', models.FloatField()),
+                ('lng', models.FloatField()),
+                ('accuracy', models.FloatField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='restaurant.order')),
+                ('rider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='locations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'recorded_at'], name='rider_location_order_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0014_order_status_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, default='', max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('order_type', models.CharField(max_length=16)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='restaurant.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'created_at'], name='status_event_order_idx'), models.Index(fields=['created_at'], name='status_event_time_idx')],
+            },
+        ),
+    ]
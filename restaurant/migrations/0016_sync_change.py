@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0015_order_status_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=24)),
+                ('object_id', models.BigIntegerField()),
+                ('op', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], default='upsert', max_length=8)),
+                ('scope', models.CharField(choices=[('public', 'Public'), ('staff', 'Staff'), ('user', 'User')], default='public', max_length=8)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entity', 'object_id'], name='sync_change_object_idx'), models.Index(fields=['owner', 'id'], name='sync_change_owner_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+# auth_user belongs to django.contrib.auth, so its functional indexes are
+# created through the schema editor rather than declared in a Meta.
+USER_INDEXES = [
+    models.Index(Lower('email'), name='auth_user_email_lower_idx'),
+    models.Index(Lower('username'), name='auth_user_username_lower_idx'),
+]
+
+
+def add_user_indexes(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for index in USER_INDEXES:
+        schema_editor.add_index(User, index)
+
+
+def remove_user_indexes(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for index in USER_INDEXES:
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0016_sync_change'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['phone'], name='profile_phone_idx'),
+        ),
+        migrations.RunPython(add_user_indexes, remove_user_indexes),
+    ]
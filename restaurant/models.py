@@ -2,8 +2,11 @@ from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from django.core.validators import MinValueValidator
+from datetime import datetime, timezone as dt_timezone
 from decimal import Decimal
 
+from . import geo
+
 
 class Profile(models.Model):
 	ROLE_CHOICES = [
@@ -18,6 +21,19 @@ class Profile(models.Model):
 	role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='customer')
 	phone = models.CharField(max_length=20, blank=True, default='')
 
+	class Meta:
+		indexes = [
+			# Login by phone (restaurant.backends)
+			models.Index(fields=['phone'], name='profile_phone_idx'),
+		]
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Remember the stored role so role changes can be detected on save
+		instance._loaded_role = instance.__dict__.get('role')
+		return instance
+
 	def __str__(self):
 		return f"{self.user.username} ({self.role})"
 
@@ -47,6 +63,8 @@ class MenuItem(models.Model):
 	description = models.TextField(blank=True, default='')
 	image_url = models.URLField(blank=True, default='')
 	available = models.BooleanField(default=True)
+	# Maintained by restaurant.availability from ingredient stock; not edited by hand
+	in_stock = models.BooleanField(default=True, editable=False)
 	featured = models.BooleanField(default=False)
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
@@ -71,6 +89,8 @@ class FoodSet(models.Model):
 	name = models.CharField(max_length=160)
 	price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
 	active = models.BooleanField(default=True)
+	# Maintained by restaurant.availability: every component is in stock
+	in_stock = models.BooleanField(default=True, editable=False)
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
@@ -101,6 +121,8 @@ class Voucher(models.Model):
 	]
 
 	code = models.CharField(max_length=32, unique=True)
+	# Case-folded ``code``; exact lookups on it use the unique index
+	normalized_code = models.CharField(max_length=64, unique=True, editable=False)
 	discount_type = models.CharField(max_length=16, choices=DISCOUNT_TYPES, default=DISCOUNT_PERCENT)
 	amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 	min_spend = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
@@ -110,6 +132,24 @@ class Voucher(models.Model):
 	usage_limit = models.PositiveIntegerField(default=0)  # 0 = unlimited
 	used_count = models.PositiveIntegerField(default=0)
 	active = models.BooleanField(default=True)
+	# Public vouchers are offered to every customer; campaign codes are not
+	is_public = models.BooleanField(default=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['is_public', 'active'], name='voucher_public_active_idx'),
+		]
+
+	@staticmethod
+	def normalize_code(code):
+		return (code or '').strip().casefold()
+
+	def save(self, *args, **kwargs):
+		self.normalized_code = self.normalize_code(self.code)
+		update_fields = kwargs.get('update_fields')
+		if update_fields is not None and 'code' in update_fields:
+			kwargs['update_fields'] = {*update_fields, 'normalized_code'}
+		super().save(*args, **kwargs)
 
 	def __str__(self):
 		return self.code
@@ -164,6 +204,8 @@ class Order(models.Model):
 	address_text = models.CharField(max_length=255, blank=True, default='')
 	lat = models.FloatField(null=True, blank=True)
 	lng = models.FloatField(null=True, blank=True)
+	# restaurant.geo grid cell of (lat, lng), kept in step by save()
+	geo_cell = models.IntegerField(null=True, blank=True, editable=False)
 	subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
 	delivery_fee = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
 	discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
@@ -173,6 +215,31 @@ class Order(models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Stored status, so saves can tell a status change from other edits
+		instance._loaded_status = instance.__dict__.get('status')
+		return instance
+
+	class Meta:
+		indexes = [
+			# Keyset pages of a customer's history and their delta sync
+			models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+			models.Index(fields=['user', 'updated_at'], name='order_user_updated_idx'),
+			# Nearby-job lookups: ready orders by grid cell
+			models.Index(fields=['status', 'geo_cell'], name='order_status_geo_idx'),
+			# Kitchen queue: open orders oldest first
+			models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+		]
+
+	def save(self, *args, **kwargs):
+		self.geo_cell = geo.cell_for(self.lat, self.lng)
+		update_fields = kwargs.get('update_fields')
+		if update_fields is not None and {'lat', 'lng'} & set(update_fields):
+			kwargs['update_fields'] = {*update_fields, 'geo_cell'}
+		super().save(*args, **kwargs)
+
 	def __str__(self):
 		return f"Order #{self.pk} ({self.order_type}) - {self.status}"
 
@@ -219,11 +286,62 @@ class RiderAssignment(models.Model):
 	delivered_at = models.DateTimeField(null=True, blank=True)
 	status = models.CharField(max_length=20, default='available')  # available, accepted, delivering, completed
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._loaded_state = (instance.__dict__.get('rider_id'), instance.__dict__.get('status'))
+		return instance
+
 	def __str__(self):
 		oid = getattr(getattr(self, 'order', None), 'pk', '?')
 		return f"RiderAssignment for Order #{oid} - {self.status}"
 
 
+class RiderLocation(models.Model):
+	"""Downsampled GPS trail of a rider on an order; live pings stay in ``restaurant.tracking``."""
+	order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='locations')
+	rider = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='locations')
+	lat = models.FloatField()
+	lng = models.FloatField()
+	accuracy = models.FloatField(null=True, blank=True)
+	recorded_at = models.DateTimeField()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['order', 'recorded_at'], name='rider_location_order_idx'),
+		]
+
+	@classmethod
+	def from_ping(cls, order_id, rider_id, ts, lat, lng, accuracy=None):
+		return cls(
+			order_id=order_id,
+			rider_id=rider_id,
+			lat=lat,
+			lng=lng,
+			accuracy=accuracy,
+			recorded_at=datetime.fromtimestamp(ts, tz=dt_timezone.utc),
+		)
+
+	def __str__(self):
+		return f"Order #{self.order_id} @ {self.lat:.5f},{self.lng:.5f}"
+
+
+class VoucherRedemption(models.Model):
+	voucher = models.ForeignKey(Voucher, on_delete=models.CASCADE, related_name='redemptions')
+	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='voucher_redemptions')
+	order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='voucher_redemption')
+	discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['voucher', 'user'], name='voucher_redemption_user_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.voucher.code} used on Order #{self.order_id}"
+
+
 class InventoryTransaction(models.Model):
 	TYPE_IN = 'in'
 	TYPE_OUT = 'out'
@@ -238,7 +356,99 @@ class InventoryTransaction(models.Model):
 	reason = models.CharField(max_length=255, blank=True, default='')
 	created_at = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=['ingredient', 'created_at'], name='inventory_tx_ingredient_time'),
+		]
+
 	def __str__(self):
 		return f"{self.type} {self.change_qty} of {self.ingredient.name}"
 
 
+class RowCounter(models.Model):
+	"""Maintained row count for a table (or a slice of one, e.g. profiles per role)."""
+	key = models.CharField(max_length=64, unique=True)
+	value = models.BigIntegerField(default=0)
+	# When ``value`` was last set from an exact COUNT(*)
+	synced_at = models.DateTimeField(null=True, blank=True)
+
+	def __str__(self):
+		return f"{self.key} = {self.value}"
+
+
+class StockCheckpoint(models.Model):
+	"""Stock level of an ingredient at ``taken_at``, covering every ledger row up to it."""
+	ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='checkpoints')
+	taken_at = models.DateTimeField()
+	stock_quantity = models.FloatField()
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['ingredient', 'taken_at'], name='stock_checkpoint_unique'),
+		]
+
+	def __str__(self):
+		return f"{self.ingredient.name} @ {self.taken_at:%Y-%m-%d %H:%M}: {self.stock_quantity}"
+
+
+class OrderStatusEvent(models.Model):
+	"""
+	Append-only log of order status changes, one row per change.
+
+	``duration_seconds`` is how long the order spent in ``from_status``;
+	``order_type`` is copied from the order so per-stage statistics need no join.
+	"""
+	order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+	from_status = models.CharField(max_length=20, blank=True, default='')
+	to_status = models.CharField(max_length=20)
+	order_type = models.CharField(max_length=16)
+	duration_seconds = models.FloatField(null=True, blank=True)
+	created_at = models.DateTimeField(default=timezone.now)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['order', 'created_at'], name='status_event_order_idx'),
+			models.Index(fields=['created_at'], name='status_event_time_idx'),
+		]
+
+	def save(self, *args, **kwargs):
+		if not self._state.adding:
+			raise ValueError('Order status events are append-only')
+		super().save(*args, **kwargs)
+
+	def __str__(self):
+		return f"Order #{self.order_id}: {self.from_status or '-'} -> {self.to_status}"
+
+
+class SyncChange(models.Model):
+	"""
+	Change log behind ``/api/sync``; the primary key is the sync sequence.
+
+	``scope`` says who may see the change: everyone (``public``), kitchen and
+	front-of-house staff (``staff``), or ``owner`` plus staff (``user``).
+	"""
+	OP_UPSERT = 'upsert'
+	OP_DELETE = 'delete'
+	OPS = [(OP_UPSERT, 'Upsert'), (OP_DELETE, 'Delete')]
+
+	SCOPE_PUBLIC = 'public'
+	SCOPE_STAFF = 'staff'
+	SCOPE_USER = 'user'
+	SCOPES = [(SCOPE_PUBLIC, 'Public'), (SCOPE_STAFF, 'Staff'), (SCOPE_USER, 'User')]
+
+	entity = models.CharField(max_length=24)
+	object_id = models.BigIntegerField()
+	op = models.CharField(max_length=8, choices=OPS, default=OP_UPSERT)
+	scope = models.CharField(max_length=8, choices=SCOPES, default=SCOPE_PUBLIC)
+	owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+	created_at = models.DateTimeField(default=timezone.now)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['entity', 'object_id'], name='sync_change_object_idx'),
+			models.Index(fields=['owner', 'id'], name='sync_change_owner_idx'),
+		]
+
+	def __str__(self):
+		return f"#{self.pk} {self.op} {self.entity}:{self.object_id}"
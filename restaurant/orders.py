@@ -0,0 +1,240 @@
+"""
+Order write pipeline.
+
+An order is built fully in memory (``OrderDraft``) and then persisted with a
+handful of statements inside one transaction: the ``Order`` row, a single
+``bulk_create`` for its items, the payment / rider assignment rows and the
+stock deduction (see ``restaurant.inventory``); ``release_orders`` undoes the
+stock and voucher side when an order is cancelled. Batches of drafts share one
+transaction per group so a reconnecting POS pays one commit per group instead
+of one per row.
+"""
+from dataclasses import dataclass, field
+
+from django.db import DatabaseError, connection, transaction
+
+from . import changelog, counters, events, geo, history
+from .availability import refresh_availability
+from .inventory import deduct_stock, return_stock
+from .models import Order, OrderItem, Payment, RiderAssignment, VoucherRedemption
+from .pricing import KIND_SET, PricingError, quote_cart
+from .vouchers import VoucherUnavailable, find_voucher, redeem_voucher, release_redemptions
+
+
+class OrderPayloadError(ValueError):
+	"""Raised when an order payload cannot be turned into an order."""
+
+
+@dataclass
+class OrderDraft:
+	order: Order
+	items: list = field(default_factory=list)
+	payment: Payment | None = None
+	rider_assignment: RiderAssignment | None = None
+	redemption: VoucherRedemption | None = None
+	client_ref: str = ''
+
+
+def build_order(user, order_data: dict) -> OrderDraft:
+	"""
+	Turn a client order payload into an unsaved order graph.
+
+	Lines, delivery fee and discount are priced server-side; the client's
+	``subtotal``/``deliveryFee``/``price`` fields are ignored.
+	"""
+	if not isinstance(order_data, dict):
+		raise OrderPayloadError('Invalid order payload')
+
+	order_type = order_data.get('type') or order_data.get('order_type') or 'delivery'
+	address_text = order_data.get('address') or order_data.get('address_text') or ''
+	table_number = order_data.get('tableNumber') or ''
+	lat = order_data.get('lat')
+	lng = order_data.get('lng')
+	items = order_data.get('items') or []
+	if order_type not in dict(Order.ORDER_TYPES):
+		raise OrderPayloadError('Invalid order type')
+
+	voucher = find_voucher(order_data.get('voucherCode'))
+	try:
+		quote = quote_cart(items, order_type, voucher)
+	except PricingError as exc:
+		raise OrderPayloadError(str(exc)) from exc
+	total = quote.total
+	# Only a voucher that actually changed the price is attached and redeemed
+	applied = voucher is not None and (quote.discount > 0 or quote.free_ship)
+
+	order = Order(
+		user=user,
+		order_type=order_type,
+		table_number=table_number or '',
+		address_text=address_text or '',
+		lat=lat if isinstance(lat, (int, float)) else None,
+		lng=lng if isinstance(lng, (int, float)) else None,
+		subtotal=quote.subtotal,
+		delivery_fee=quote.delivery_fee,
+		discount_amount=quote.discount,
+		total=total,
+		status=Order.STATUS_PENDING,
+		voucher=voucher if applied else None,
+	)
+	# bulk_create skips Order.save(), which normally fills this in
+	order.geo_cell = geo.cell_for(order.lat, order.lng)
+
+	draft = OrderDraft(order=order, client_ref=str(order_data.get('id') or ''))
+	for line in quote.lines:
+		draft.items.append(OrderItem(
+			menu_item_id=line.ref_id if line.kind != KIND_SET else None,
+			food_set_id=line.ref_id if line.kind == KIND_SET else None,
+			quantity=line.quantity,
+			unit_price=line.unit_price,
+			total_price=line.total_price,
+			note=line.note,
+		))
+
+	method_raw = (order_data.get('paymentMethod') or '').lower()
+	method = Payment.METHOD_QR if method_raw == 'qr' else Payment.METHOD_CASH
+	draft.payment = Payment(method=method, amount=total, status='unpaid')
+
+	if order_type in (Order.TYPE_DELIVERY, Order.TYPE_TAKEAWAY):
+		draft.rider_assignment = RiderAssignment(status='available')
+	if applied:
+		draft.redemption = VoucherRedemption(voucher=voucher, user=user, discount_amount=quote.discount)
+	return draft
+
+
+def _redeem_vouchers(drafts):
+	"""Consume voucher uses for a group: one conditional UPDATE per voucher."""
+	wanted = {}
+	for d in drafts:
+		if d.redemption is not None:
+			wanted[d.redemption.voucher_id] = wanted.get(d.redemption.voucher_id, 0) + 1
+	for voucher_id, count in wanted.items():
+		if not redeem_voucher(voucher_id, count):
+			raise VoucherUnavailable('Voucher is no longer available')
+
+
+def _write_group(drafts):
+	"""Insert a group of drafts; must run inside a transaction."""
+	# Write first: the voucher UPDATE takes SQLite's write lock up front
+	_redeem_vouchers(drafts)
+	orders = [d.order for d in drafts]
+	# bulk_create skips signals, so everything inserted that way is counted and
+	# announced here
+	bulk_counts = {}
+	if len(orders) > 1 and connection.features.can_return_rows_from_bulk_insert:
+		Order.objects.bulk_create(orders)
+		bulk_counts['orders'] = len(orders)
+		for order in orders:
+			order._loaded_status = order.status
+			events.order_created(order)
+		history.record([(order, '', order.status) for order in orders])
+		changelog.record_orders(orders)
+	else:
+		for order in orders:
+			order.save(force_insert=True)
+
+	items, payments, assignments, redemptions = [], [], [], []
+	for d in drafts:
+		for it in d.items:
+			it.order = d.order
+			items.append(it)
+		if d.payment is not None:
+			d.payment.order = d.order
+			payments.append(d.payment)
+		if d.rider_assignment is not None:
+			d.rider_assignment.order = d.order
+			assignments.append(d.rider_assignment)
+		if d.redemption is not None:
+			d.redemption.order = d.order
+			redemptions.append(d.redemption)
+	if items:
+		OrderItem.objects.bulk_create(items)
+		deducted = deduct_stock([(d.order, d.items) for d in drafts])
+		if deducted:
+			refresh_availability(ingredient_ids=deducted)
+	if payments:
+		Payment.objects.bulk_create(payments)
+	if assignments:
+		RiderAssignment.objects.bulk_create(assignments)
+	if redemptions:
+		VoucherRedemption.objects.bulk_create(redemptions)
+	bulk_counts.update(order_items=len(items), payments=len(payments), rider_assignments=len(assignments))
+	counters.add(bulk_counts)
+
+
+def _reset(draft):
+	"""Forget primary keys assigned by a rolled back insert."""
+	draft.order.pk = None
+	draft.order._state.adding = True
+	for obj in [*draft.items, draft.payment, draft.rider_assignment, draft.redemption]:
+		if obj is not None:
+			obj.pk = None
+			obj._state.adding = True
+
+
+def persist_order(draft: OrderDraft) -> Order:
+	"""Persist one order graph atomically."""
+	with transaction.atomic():
+		_write_group([draft])
+	return draft.order
+
+
+def persist_orders(drafts, group_size: int = 50):
+	"""
+	Persist many drafts, one transaction per ``group_size`` orders.
+
+	Returns a list of ``(draft, error)`` in input order; ``error`` is ``None``
+	on success. When a group fails it is retried order by order so a single
+	bad order cannot take the rest of its group down with it.
+	"""
+	results = []
+	for start in range(0, len(drafts), group_size):
+		group = drafts[start:start + group_size]
+		try:
+			with transaction.atomic():
+				_write_group(group)
+			results.extend((d, None) for d in group)
+			continue
+		except (DatabaseError, VoucherUnavailable) as exc:
+			if len(group) == 1:
+				_reset(group[0])
+				results.append((group[0], _error_message(exc)))
+				continue
+		for d in group:
+			_reset(d)
+			try:
+				persist_order(d)
+				results.append((d, None))
+			except (DatabaseError, VoucherUnavailable) as exc:
+				_reset(d)
+				results.append((d, _error_message(exc)))
+	return results
+
+
+def release_orders(order_ids):
+	"""Undo the stock deduction and voucher use of cancelled orders; run inside the cancelling transaction."""
+	returned = return_stock(order_ids)
+	if returned:
+		refresh_availability(ingredient_ids=returned)
+	release_redemptions(order_ids)
+
+
+def _error_message(exc):
+	if isinstance(exc, VoucherUnavailable):
+		return str(exc)
+	return 'Could not save order'
+
+
+def order_summary(order) -> dict:
+	"""The order as listed to its customer (``/api/orders/my``, ``/api/sync``)."""
+	return {
+		'id': order.pk,
+		'order_type': order.order_type,
+		'status': order.status,
+		'subtotal': str(order.subtotal),
+		'delivery_fee': str(order.delivery_fee),
+		'discount_amount': str(order.discount_amount),
+		'total': str(order.total),
+		'created_at': order.created_at.isoformat(),
+		'updated_at': order.updated_at.isoformat(),
+	}
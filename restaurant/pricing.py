@@ -0,0 +1,287 @@
+"""
+Server-side cart pricing.
+
+Prices come from ``MenuSnapshot``: a compiled, read-only copy of the menu
+(items, sets and their compositions) kept in process memory. The snapshot is
+tagged with a menu version stored in the Django cache; the version is bumped by
+signals whenever ``MenuItem``, ``FoodSet`` or ``SetItem`` change, and the next
+reader rebuilds. A snapshot is also rebuilt once it is
+``MENU_SNAPSHOT_MAX_AGE`` seconds old: with a per-process cache backend
+(LocMem) a bump made in one worker never reaches the others, and the age
+limit bounds how long they price from a stale menu. Pricing a cart against a
+warm snapshot runs no queries.
+
+Code that changes menu rows without signals (``QuerySet.update``, raw SQL)
+must call ``bump_menu_version()`` itself.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+
+from .models import FoodSet, MenuItem, Order, SetItem
+from .versioning import bump_version, get_version
+from .vouchers import apply_voucher
+
+MENU_VERSION_KEY = 'restaurant:menu_version'
+# Seconds a snapshot is used without a version bump reaching this process
+MENU_SNAPSHOT_MAX_AGE = 30
+
+KIND_ITEM = 'item'
+KIND_SET = 'set'
+
+
+class PricingError(ValueError):
+	"""Raised when cart lines cannot be priced; ``errors`` lists the bad lines."""
+
+	def __init__(self, errors):
+		self.errors = errors
+		message = 'Invalid cart'
+		if errors:
+			first = errors[0]
+			message = first['error'] if first['line'] is None else f"Line {first['line']}: {first['error']}"
+		super().__init__(message)
+
+
+@dataclass(frozen=True)
+class MenuEntry:
+	id: int
+	name: str
+	price: Decimal
+	# ``available`` (manual switch) and ``in_stock``
+	available: bool
+	category_id: int | None
+
+
+@dataclass(frozen=True)
+class SetEntry:
+	id: int
+	name: str
+	price: Decimal
+	active: bool
+	# ``active`` and every component currently sellable
+	available: bool
+	# ((menu_item_id, quantity), ...)
+	components: tuple
+
+
+@dataclass
+class MenuSnapshot:
+	version: int
+	items: dict
+	sets: dict
+	# casefolded name -> (kind, id); names shared by several rows are left out
+	names: dict
+	built_at: float = field(default_factory=time.monotonic)
+
+	def resolve(self, line: dict):
+		"""Return ``(kind, entry)`` for a cart line, or ``(None, None)``."""
+		for key, kind in (('menuItemId', KIND_ITEM), ('foodSetId', KIND_SET), ('setId', KIND_SET)):
+			ref = _as_int(line.get(key))
+			if ref is not None:
+				return kind, self._get(kind, ref)
+		ref = _as_int(line.get('id'))
+		if ref is not None:
+			kind = KIND_SET if line.get('kind') == KIND_SET else KIND_ITEM
+			return kind, self._get(kind, ref)
+		name = (line.get('name') or '').strip().casefold()
+		if name in self.names:
+			kind, ref = self.names[name]
+			return kind, self._get(kind, ref)
+		return None, None
+
+	def _get(self, kind, ref):
+		return (self.sets if kind == KIND_SET else self.items).get(ref)
+
+
+def _as_int(value):
+	if isinstance(value, bool):
+		return None
+	if isinstance(value, int):
+		return value
+	if isinstance(value, str) and value.isdigit():
+		return int(value)
+	return None
+
+
+def menu_version() -> int:
+	return get_version(MENU_VERSION_KEY)
+
+
+def bump_menu_version():
+	"""Invalidate every process's menu snapshot."""
+	bump_version(MENU_VERSION_KEY)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def build_snapshot(version: int) -> MenuSnapshot:
+	items = {}
+	for pk, name, price, available, in_stock, category_id in MenuItem.objects.values_list(
+		'id', 'name', 'price', 'available', 'in_stock', 'category_id'
+	):
+		items[pk] = MenuEntry(pk, name, price, available and in_stock, category_id)
+	components = {}
+	for set_id, menu_item_id, qty in SetItem.objects.values_list('food_set_id', 'menu_item_id', 'quantity').order_by('id'):
+		components.setdefault(set_id, []).append((menu_item_id, qty))
+	sets = {}
+	for set_id, name, price, active, in_stock in FoodSet.objects.values_list('id', 'name', 'price', 'active', 'in_stock'):
+		comp = tuple(components.get(set_id, ()))
+		# A set can only be sold while every component is sellable
+		sellable = active and in_stock and all(items.get(mid) is not None and items[mid].available for mid, _ in comp)
+		sets[set_id] = SetEntry(set_id, name, price, active, sellable, comp)
+
+	names, seen = {}, set()
+	for kind, rows in ((KIND_ITEM, items.values()), (KIND_SET, sets.values())):
+		for entry in rows:
+			key = entry.name.strip().casefold()
+			if key in seen:
+				names.pop(key, None)
+				continue
+			seen.add(key)
+			names[key] = (kind, entry.id)
+	return MenuSnapshot(version=version, items=items, sets=sets, names=names)
+
+
+def _fresh(snap, version) -> bool:
+	return snap is not None and snap.version == version and time.monotonic() - snap.built_at < MENU_SNAPSHOT_MAX_AGE
+
+
+def get_snapshot() -> MenuSnapshot:
+	"""Return the current menu snapshot, rebuilding it if the version moved or it aged out."""
+	global _snapshot
+	version = menu_version()
+	snap = _snapshot
+	if _fresh(snap, version):
+		return snap
+	with _snapshot_lock:
+		snap = _snapshot
+		if not _fresh(snap, version):
+			snap = build_snapshot(version)
+			_snapshot = snap
+	return snap
+
+
+@dataclass
+class PricedLine:
+	kind: str
+	ref_id: int
+	name: str
+	quantity: int
+	unit_price: Decimal
+	total_price: Decimal
+	note: str = ''
+
+	def as_dict(self):
+		return {
+			'kind': self.kind,
+			'id': self.ref_id,
+			'name': self.name,
+			'quantity': self.quantity,
+			'unit_price': str(self.unit_price),
+			'total_price': str(self.total_price),
+		}
+
+
+@dataclass
+class Quote:
+	lines: list = field(default_factory=list)
+	subtotal: Decimal = Decimal('0.00')
+	delivery_fee: Decimal = Decimal('0.00')
+	discount: Decimal = Decimal('0.00')
+	total: Decimal = Decimal('0.00')
+	free_ship: bool = False
+	voucher: object = None
+	menu_version: int = 0
+
+	def as_dict(self):
+		return {
+			'lines': [ln.as_dict() for ln in self.lines],
+			'subtotal': str(self.subtotal),
+			'delivery_fee': str(self.delivery_fee),
+			'discount': str(self.discount),
+			'total': str(self.total),
+			'free_ship': self.free_ship,
+			'voucher': self.voucher.code if self.voucher else None,
+			'menu_version': self.menu_version,
+		}
+
+
+def delivery_fee_for(order_type: str) -> Decimal:
+	if order_type != Order.TYPE_DELIVERY:
+		return Decimal('0.00')
+	return Decimal(str(getattr(settings, 'RESTAURANT_DELIVERY_FEE', '30.00'))).quantize(Decimal('0.01'))
+
+
+def _line_quantity(raw):
+	"""Whole-number quantity of a cart line (1 when missing), or ``None`` when it is not one."""
+	if raw is None or raw == '':
+		return 1
+	if isinstance(raw, bool):
+		return None
+	if isinstance(raw, int):
+		return raw
+	if isinstance(raw, float):
+		return int(raw) if raw.is_integer() else None
+	if isinstance(raw, str) and raw.strip().isdigit():
+		return int(raw)
+	return None
+
+
+def price_lines(items, snapshot: MenuSnapshot | None = None):
+	"""Price cart lines against the snapshot; returns ``(lines, subtotal)``."""
+	if not isinstance(items, list):
+		raise PricingError([{'line': None, 'error': 'Invalid items'}])
+	snapshot = snapshot or get_snapshot()
+	lines, errors = [], []
+	subtotal = Decimal('0.00')
+	for idx, it in enumerate(items):
+		if not isinstance(it, dict):
+			errors.append({'line': idx, 'error': 'Invalid item'})
+			continue
+		qty = _line_quantity(it.get('quantity'))
+		if qty is None or qty < 1:
+			errors.append({'line': idx, 'error': 'Invalid item quantity'})
+			continue
+		note = it.get('note')
+		if note is not None and not isinstance(note, str):
+			errors.append({'line': idx, 'error': 'Invalid item note'})
+			continue
+		kind, entry = snapshot.resolve(it)
+		if entry is None:
+			errors.append({'line': idx, 'error': 'Unknown item'})
+			continue
+		if not entry.available:
+			errors.append({'line': idx, 'error': f'{entry.name} is not available'})
+			continue
+		total_price = (entry.price * qty).quantize(Decimal('0.01'))
+		subtotal += total_price
+		lines.append(PricedLine(kind, entry.id, entry.name, qty, entry.price, total_price, (note or '')[:255]))
+	if errors:
+		raise PricingError(errors)
+	return lines, subtotal
+
+
+def quote_cart(items, order_type: str, voucher=None) -> Quote:
+	"""Price a cart end to end: lines, delivery fee and voucher."""
+	snapshot = get_snapshot()
+	lines, subtotal = price_lines(items, snapshot)
+	delivery_fee = delivery_fee_for(order_type)
+	discount, eff_delivery_fee, free_ship = apply_voucher(voucher, subtotal, delivery_fee)
+	total = (subtotal - discount + eff_delivery_fee).quantize(Decimal('0.01'))
+	if total < 0:
+		total = Decimal('0.00')
+	return Quote(
+		lines=lines,
+		subtotal=subtotal,
+		delivery_fee=eff_delivery_fee,
+		discount=discount,
+		total=total,
+		free_ship=free_ship,
+		voucher=voucher,
+		menu_version=snapshot.version,
+	)
@@ -0,0 +1,182 @@
+"""
+Sessions that stay off the SQLite writer.
+
+With the stock database engine every login, and every request that
+modifies the session, writes ``django_session``. Those writes queue for the
+same writer lock as order writes. This module is the project's
+``SESSION_ENGINE`` and provides two ways to avoid them:
+
+* ``SessionStore``: cache first, database behind. Reads come from the cache,
+  and the database row is only a fallback for cache misses and restarts. A
+  save writes through only when the data changed since it was loaded. A
+  new key is not inserted on its own; the row is created by the first save
+  that carries data, so a login costs one insert instead of an insert plus
+  an update.
+* Signed-cookie sessions for the roles in ``RESTAURANT_COOKIE_SESSION_ROLES``.
+  These are the read-mostly screens (kitchen, riders, customers) that keep
+  nothing in the session except the login. They need no database access at
+  all. ``RoleSessionMiddleware`` replaces Django's ``SessionMiddleware``. It
+  chooses the store from the cookie and moves a session between stores when
+  a login changes its role. Staff and admins, who may move any order, stay
+  server-side so that logging out revokes the session.
+
+Expired rows are removed in chunks by ``purge_expired``. Run the
+``purge_sessions`` command from cron; ``clearsessions`` also chunks.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.signed_cookies import SessionStore as CookieStore
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.utils import timezone
+
+from .roles import role_of
+
+ROLE_KEY = '_restaurant_role'
+PURGE_CHUNK = 1000
+
+
+def _snapshot(store, data):
+	return store.serializer().dumps(data)
+
+
+class SessionStore(cached_db.SessionStore):
+	cache_key_prefix = 'restaurant.sessions'
+
+	def __init__(self, session_key=None):
+		super().__init__(session_key)
+		self._stored = None
+		self._unsaved = False
+
+	def load(self):
+		data = super().load()
+		self._stored = _snapshot(self, data)
+		return data
+
+	async def aload(self):
+		data = await super().aload()
+		self._stored = _snapshot(self, data)
+		return data
+
+	def create(self):
+		# The first save inserts the row; see the module docstring
+		self._session_key = self._get_new_session_key()
+		self._unsaved = True
+		self.modified = True
+
+	async def acreate(self):
+		self._session_key = await self._aget_new_session_key()
+		self._unsaved = True
+		self.modified = True
+
+	def _unchanged(self, must_create):
+		if must_create or self._unsaved:
+			return False
+		return _snapshot(self, self._session) == self._stored
+
+	def save(self, must_create=False):
+		if self.session_key is None:
+			self.create()
+		elif self._unchanged(must_create):
+			return
+		must_create = must_create or self._unsaved
+		super().save(must_create)
+		self._unsaved = False
+		self._stored = _snapshot(self, self._session)
+
+	async def asave(self, must_create=False):
+		if self.session_key is None:
+			await self.acreate()
+		elif self._unchanged(must_create):
+			return
+		must_create = must_create or self._unsaved
+		await super().asave(must_create)
+		self._unsaved = False
+		self._stored = _snapshot(self, self._session)
+
+	def _never_stored(self, session_key):
+		return self._unsaved and session_key in (None, self.session_key)
+
+	def delete(self, session_key=None):
+		if self._never_stored(session_key):
+			self._unsaved = False
+			return
+		super().delete(session_key)
+
+	async def adelete(self, session_key=None):
+		if self._never_stored(session_key):
+			self._unsaved = False
+			return
+		await super().adelete(session_key)
+
+	@classmethod
+	def clear_expired(cls):
+		purge_expired()
+
+
+def is_signed(session_key) -> bool:
+	"""Signed-cookie sessions carry ``:`` separators; stored session keys never do."""
+	return bool(session_key) and ':' in session_key
+
+
+def cookie_roles() -> frozenset:
+	return frozenset(getattr(settings, 'RESTAURANT_COOKIE_SESSION_ROLES', ()))
+
+
+def remember_role(sender, request, user, **kwargs):
+	"""``user_logged_in`` receiver: record the role so the middleware can pick a store without a query."""
+	if request is not None and hasattr(request, 'session'):
+		request.session[ROLE_KEY] = role_of(user)
+
+
+class RoleSessionMiddleware(SessionMiddleware):
+	"""``SessionMiddleware`` that keeps sessions of ``cookie_roles()`` in a signed cookie."""
+
+	def __init__(self, get_response):
+		super().__init__(get_response)
+		self.cookie_roles = cookie_roles()
+
+	def process_request(self, request):
+		session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+		store = CookieStore if is_signed(session_key) else self.SessionStore
+		request.session = store(session_key)
+
+	def process_response(self, request, response):
+		session = getattr(request, 'session', None)
+		if session is not None and session.modified and not session.is_empty():
+			request.session = self._rehome(session)
+		return super().process_response(request, response)
+
+	def _rehome(self, session):
+		wants_cookie = session.get(ROLE_KEY) in self.cookie_roles
+		if wants_cookie == isinstance(session, CookieStore):
+			return session
+		data = dict(session.items())
+		if not isinstance(session, CookieStore) and session.session_key:
+			session.delete()
+		moved = CookieStore() if wants_cookie else self.SessionStore()
+		moved.update(data)
+		return moved
+
+
+def purge_expired(chunk: int = PURGE_CHUNK, pause: float = 0.0) -> int:
+	"""
+	Delete expired session rows with at most ``chunk`` rows per statement, and
+	return how many were removed.
+
+	Each chunk commits on its own. The writer lock is therefore held for one
+	short delete at a time and never for the whole backlog. ``pause`` adds
+	seconds between chunks so writers queued behind the lock can get in.
+	"""
+	model = SessionStore.get_model_class()
+	now = timezone.now()
+	removed = 0
+	while True:
+		keys = list(model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:chunk])
+		if keys:
+			removed += model.objects.filter(session_key__in=keys).delete()[0]
+		if len(keys) < chunk:
+			return removed
+		if pause:
+			time.sleep(pause)
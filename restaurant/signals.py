@@ -0,0 +1,101 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_migrate
+from django.dispatch import receiver
+
+from . import changelog, counters, events, history, sessions
+from .availability import refresh_availability
+from .catalog import bump_catalog_version
+from .inventory import bump_bom_version
+from .models import FoodSet, Ingredient, IngredientUsage, MenuCategory, MenuItem, Order, RiderAssignment, SetItem, Voucher
+from .pricing import bump_menu_version
+from .vouchers import bump_voucher_version
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=FoodSet)
+@receiver(post_delete, sender=FoodSet)
+@receiver(post_save, sender=SetItem)
+@receiver(post_delete, sender=SetItem)
+def menu_changed(sender, **kwargs):
+	bump_menu_version()
+	bump_bom_version()
+
+
+@receiver(post_save, sender=IngredientUsage)
+@receiver(post_delete, sender=IngredientUsage)
+def recipe_changed(sender, instance, **kwargs):
+	bump_bom_version()
+	if not kwargs.get('raw'):
+		refresh_availability(menu_item_ids=[instance.menu_item_id])
+
+
+@receiver(post_save, sender=SetItem)
+@receiver(post_delete, sender=SetItem)
+def set_composition_changed(sender, instance, **kwargs):
+	if not kwargs.get('raw'):
+		refresh_availability(food_set_ids=[instance.food_set_id])
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_save, sender=FoodSet)
+def menu_row_created(sender, instance, created, **kwargs):
+	if created and not kwargs.get('raw'):
+		if sender is MenuItem:
+			refresh_availability(menu_item_ids=[instance.pk])
+		else:
+			refresh_availability(food_set_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, **kwargs):
+	if not kwargs.get('raw'):
+		refresh_availability(ingredient_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+	if raw:
+		return
+	old = getattr(instance, '_loaded_status', None)
+	if created:
+		events.order_created(instance)
+		history.record([(instance, '', instance.status)])
+	elif old != instance.status:
+		events.order_status_changed(instance, old)
+		history.record([(instance, old, instance.status)])
+	instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+def voucher_changed(sender, **kwargs):
+	bump_voucher_version()
+
+
+@receiver(post_save, sender=MenuCategory)
+@receiver(post_delete, sender=MenuCategory)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=FoodSet)
+@receiver(post_delete, sender=FoodSet)
+@receiver(post_save, sender=SetItem)
+@receiver(post_delete, sender=SetItem)
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+def catalog_changed(sender, **kwargs):
+	bump_catalog_version()
+
+
+for _key, _model in counters.counted_models().items():
+	post_save.connect(counters.row_created, sender=_model, dispatch_uid=f'row-counter-save:{_key}')
+	post_delete.connect(counters.row_deleted, sender=_model, dispatch_uid=f'row-counter-delete:{_key}')
+pre_migrate.connect(counters.pause, dispatch_uid='row-counter-pause')
+post_migrate.connect(counters.resume, dispatch_uid='row-counter-resume')
+for _model, _entity in changelog.synced_models().items():
+	post_save.connect(changelog.row_saved, sender=_model, dispatch_uid=f'changelog-save:{_entity}')
+	post_delete.connect(changelog.row_deleted, sender=_model, dispatch_uid=f'changelog-delete:{_entity}')
+post_save.connect(changelog.set_item_changed, sender=SetItem, dispatch_uid='changelog-save:set_item')
+post_delete.connect(changelog.set_item_changed, sender=SetItem, dispatch_uid='changelog-delete:set_item')
+post_save.connect(events.assignment_saved, sender=RiderAssignment, dispatch_uid='events-assignment-saved')
+user_logged_in.connect(sessions.remember_role, dispatch_uid='sessions-remember-role')
@@ -0,0 +1,81 @@
+"""
+SQLite with an in-process writer gate.
+
+SQLite lets one connection write at a time. Transactions that start
+deferred and upgrade to a write lock halfway through can deadlock each
+other: SQLite then fails one of them with "database is locked" at once,
+whatever the busy timeout. With ``transaction_mode='IMMEDIATE'`` every
+``atomic()`` block takes the write lock at ``BEGIN``, so that deadlock
+cannot happen. Writers that wait still poll in SQLite's busy handler,
+sleeping up to 100 ms between tries, which is unfair under load and slow.
+
+This backend puts a lock in front of ``BEGIN``. All connections of this
+process to the same database file take it before beginning a transaction
+and release it on commit, rollback or close. Writers in one process
+therefore queue on the lock and enter SQLite one after another, and the
+busy handler is only needed between processes. A writer that waits
+longer than the ``timeout`` option raises ``OperationalError`` in the same
+way SQLite would.
+
+Use it with the WAL profile in ``rest/settings.py``. WAL lets reads run
+beside the single writer, so reads never pass through the gate.
+"""
+import threading
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+DEFAULT_TIMEOUT = 5.0
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def writer_gate(name) -> threading.Lock:
+	"""The process-wide writer lock for database file ``name``."""
+	with _gates_lock:
+		return _gates.setdefault(str(name), threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self._holds_gate = False
+
+	@property
+	def gate_timeout(self) -> float:
+		return self.settings_dict['OPTIONS'].get('timeout', DEFAULT_TIMEOUT)
+
+	def _start_transaction_under_autocommit(self):
+		gate = writer_gate(self.settings_dict['NAME'])
+		if not gate.acquire(timeout=self.gate_timeout):
+			raise OperationalError('database is locked (writer gate timeout)')
+		self._holds_gate = True
+		try:
+			super()._start_transaction_under_autocommit()
+		except BaseException:
+			self._release_gate()
+			raise
+
+	def _release_gate(self):
+		if self._holds_gate:
+			self._holds_gate = False
+			writer_gate(self.settings_dict['NAME']).release()
+
+	def _commit(self):
+		try:
+			super()._commit()
+		finally:
+			self._release_gate()
+
+	def _rollback(self):
+		try:
+			super()._rollback()
+		finally:
+			self._release_gate()
+
+	def _close(self):
+		try:
+			super()._close()
+		finally:
+			self._release_gate()
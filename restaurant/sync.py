@@ -0,0 +1,86 @@
+"""
+``/api/sync``: changes after a client's cursor.
+
+Clients keep the ``next`` sequence number from each response and send it
+back as ``since``. A page reads at most ``limit`` log rows (a primary key
+range scan), keeps the newest change per object, and loads the current row
+of every upserted object with one query per entity type, so the payload is
+proportional to what changed since the cursor rather than to the data set.
+An upsert whose row has since disappeared is sent as a delete. ``since=0``
+is a full sync.
+"""
+from django.db.models import F, Q
+
+from . import catalog, changelog
+from .models import FoodSet, Ingredient, MenuCategory, MenuItem, Order, SyncChange, Voucher
+from .orders import order_summary
+
+SYNC_PAGE_DEFAULT = 500
+SYNC_PAGE_MAX = 2000
+STAFF_ROLES = ('admin', 'staff', 'chef')
+
+
+def _ingredient(ingredient):
+	return {
+		'id': ingredient.pk,
+		'name': ingredient.name,
+		'unit': ingredient.unit,
+		'stock_quantity': ingredient.stock_quantity,
+		'low_stock_threshold': ingredient.low_stock_threshold,
+		'active': ingredient.active,
+	}
+
+
+# entity -> (queryset, serializer)
+LOADERS = {
+	changelog.ENTITY_CATEGORY: (lambda: MenuCategory.objects.all(), lambda c: {'id': c.pk, 'name': c.name}),
+	changelog.ENTITY_MENU_ITEM: (lambda: MenuItem.objects.all(), catalog.item_data),
+	changelog.ENTITY_FOOD_SET: (lambda: FoodSet.objects.prefetch_related(catalog.set_components()), catalog.set_data),
+	# Campaign codes are never synced, not even to staff; dead vouchers go out as deletes
+	changelog.ENTITY_VOUCHER: (
+		lambda: Voucher.objects.filter(is_public=True, active=True).filter(Q(usage_limit=0) | Q(used_count__lt=F('usage_limit'))),
+		catalog.voucher_data,
+	),
+	changelog.ENTITY_INGREDIENT: (lambda: Ingredient.objects.all(), _ingredient),
+	changelog.ENTITY_ORDER: (lambda: Order.objects.all(), order_summary),
+}
+
+
+def visible_changes(user, role):
+	qs = SyncChange.objects.all()
+	if role in STAFF_ROLES:
+		return qs
+	return qs.filter(Q(scope=SyncChange.SCOPE_PUBLIC) | Q(scope=SyncChange.SCOPE_USER, owner=user))
+
+
+def changes_since(user, role, since: int, limit: int = SYNC_PAGE_DEFAULT):
+	"""``{'changes': [...], 'next': seq, 'more': bool}`` for changes after ``since``."""
+	rows = list(
+		visible_changes(user, role).filter(id__gt=since).order_by('id')
+		.values_list('id', 'entity', 'object_id', 'op')[:limit + 1]
+	)
+	more = len(rows) > limit
+	rows = rows[:limit]
+	latest = {}
+	for seq, entity, object_id, op in rows:
+		latest.pop((entity, object_id), None)
+		latest[(entity, object_id)] = (seq, op)
+
+	wanted = {}
+	for (entity, object_id), (_, op) in latest.items():
+		if op == SyncChange.OP_UPSERT and entity in LOADERS:
+			wanted.setdefault(entity, []).append(object_id)
+	current = {}
+	for entity, ids in wanted.items():
+		queryset, serialize = LOADERS[entity]
+		for obj in queryset().filter(pk__in=ids):
+			current[(entity, obj.pk)] = serialize(obj)
+
+	changes = []
+	for key, (seq, op) in latest.items():
+		entity, object_id = key
+		data = current.get(key) if op == SyncChange.OP_UPSERT else None
+		if data is None:
+			op = SyncChange.OP_DELETE
+		changes.append({'seq': seq, 'entity': entity, 'id': object_id, 'op': op, 'data': data})
+	return {'changes': changes, 'next': rows[-1][0] if rows else since, 'more': more}
@@ -1,6 +1,51 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models.functions import Lower
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from . import backends, batching, changelog, counters, dispatch, eta, events, hashing, history, kitchen, pricing, roles, sessions, tracking, transitions
+from .inventory import get_bom, stock_at, take_checkpoints
+from .models import (
+	FoodSet,
+	Ingredient,
+	IngredientUsage,
+	InventoryTransaction,
+	MenuCategory,
+	MenuItem,
+	Order,
+	OrderItem,
+	OrderStatusEvent,
+	Profile,
+	RiderAssignment,
+	RiderLocation,
+	RowCounter,
+	SetItem,
+	StockCheckpoint,
+	SyncChange,
+	Voucher,
+	VoucherRedemption,
+)
+from .orders import build_order, persist_order, persist_orders
+from .sqlite.base import writer_gate
+from .pricing import get_snapshot, price_lines
+from .vouchers import VoucherUnavailable, find_voucher
 
 
 class AuthViewsTests(TestCase):
@@ -48,6 +93,53 @@ class AuthViewsTests(TestCase):
 		self.assertEqual(resp.status_code, 200)
 		self.assertContains(resp, 'ไม่ถูกต้อง', status_code=200)
 
+	def test_login_resolves_email_phone_and_username_in_one_query(self):
+		user = User.objects.create_user(username='Carol', password='pass12345', email='Carol@Example.com')
+		Profile.objects.create(user=user, role='chef', phone='0899999999')
+		for identifier in ('carol@example.COM', '0899999999', 'CAROL'):
+			with self.assertNumQueries(1):
+				found = backends.resolve_user(identifier)
+			self.assertEqual(found, user)
+			with self.assertNumQueries(0):
+				self.assertEqual(found.profile.role, 'chef')
+		self.assertIsNone(backends.resolve_user('nobody@example.com'))
+		resp = self.client.post(reverse('login'), {'loginEmail': '0899999999', 'loginPassword': 'pass12345'})
+		self.assertIn('/chef/', resp['Location'])
+
+	def test_usernames_shaped_like_an_email_still_authenticate(self):
+		User.objects.create_user(username='x@y', password='pass12345', email='other@example.com')
+		self.assertIsNotNone(authenticate(username='x@y', password='pass12345'))
+
+	def test_all_digit_usernames_still_authenticate(self):
+		User.objects.create_user(username='0811112222', password='pass12345')
+		self.assertIsNotNone(authenticate(username='0811112222', password='pass12345'))
+
+	def test_login_lookups_use_indexes(self):
+		users = User.objects.alias(email_lower=Lower('email'), username_lower=Lower('username'))
+		self.assertIn('auth_user_email_lower_idx', users.filter(**backends.identifier_filter('a@b.c')).explain())
+		self.assertIn('auth_user_username_lower_idx', users.filter(**backends.identifier_filter('Bob')).explain())
+		self.assertIn('profile_phone_idx', users.filter(**backends.identifier_filter('0812345678')).explain())
+
+	def test_saturated_hash_pool_sheds_logins_with_503(self):
+		User.objects.create_user(username='dana', password='pass12345')
+		busy = hashing.HashPool(workers=1, queue_depth=0)
+		busy._pending = 1
+		with mock.patch.object(hashing, 'pool', busy):
+			resp = self.client.post(reverse('login'), {'loginEmail': 'dana', 'loginPassword': 'pass12345'})
+		self.assertEqual(resp.status_code, 503)
+		self.assertEqual(resp['Retry-After'], '1')
+		self.assertEqual(busy.stats()['shed'], 1)
+		resp = self.client.post(reverse('login'), {'loginEmail': 'dana', 'loginPassword': 'pass12345'})
+		self.assertEqual(resp.status_code, 302)
+
+	def test_hash_pool_records_queue_wait(self):
+		pool = hashing.HashPool(workers=2, queue_depth=4)
+		matches, rehash = asyncio.run(pool.run(hashing.verify, 'pw', hashing.hash_password('pw')))
+		self.assertTrue(matches)
+		self.assertFalse(rehash)
+		stats = pool.stats()
+		self.assertEqual((stats['completed'], stats['in_flight']), (1, 0))
+
 	def test_demo_login_customer(self):
 		resp = self.client.get(reverse('login_demo', args=['customer']))
 		self.assertEqual(resp.status_code, 302)
@@ -55,3 +147,1232 @@ class AuthViewsTests(TestCase):
 		# After redirect, user is authenticated
 		resp2 = self.client.get('/customer/')
 		self.assertEqual(resp2.status_code, 200)
+
+
+class RoleRoutingTests(TestCase):
+	def setUp(self):
+		self.chef = User.objects.create_user(username='cho', password='pass12345')
+		Profile.objects.create(user=self.chef, role='chef')
+		self.admin = User.objects.create_user(username='ada', password='pass12345')
+		Profile.objects.create(user=self.admin, role='admin')
+
+	def test_role_pages_cost_one_user_query(self):
+		self.client.force_login(self.chef)
+		with self.assertNumQueries(1):  # user joined with profile; the session comes from the cache
+			self.assertEqual(self.client.get(reverse('chef')).status_code, 200)
+		with self.assertNumQueries(1):
+			resp = self.client.get(reverse('staff'))
+		self.assertEqual(resp['Location'], '/chef/')
+
+	def test_admins_land_on_the_app_admin_in_one_redirect(self):
+		self.client.force_login(self.admin)
+		self.assertEqual(self.client.get(reverse('rider'))['Location'], reverse('admin_panel'))
+
+	def test_api_roles_answer_403(self):
+		self.client.force_login(self.chef)
+		self.assertEqual(self.client.get(reverse('api_admin_health')).status_code, 403)
+		self.assertEqual(self.client.get(reverse('api_kitchen_queue')).status_code, 200)
+		self.client.logout()
+		self.assertEqual(self.client.get(reverse('api_kitchen_queue')).status_code, 302)
+
+	def test_request_role_is_lazy(self):
+		request = RequestFactory().get('/')
+		request.user = self.chef
+		with self.assertNumQueries(0):
+			roles.RoleMiddleware(lambda r: None)(request)
+		self.assertEqual(request.role, 'chef')
+
+
+class SessionTests(TestCase):
+	def _login(self, username, role):
+		user = User.objects.create_user(username=username, password='pass12345')
+		Profile.objects.create(user=user, role=role)
+		return self.client.post(reverse('login'), {'loginEmail': username, 'loginPassword': 'pass12345'})
+
+	def _session_writes(self, queries):
+		return [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'django_session' in q['sql']]
+
+	def test_read_mostly_roles_keep_the_session_in_a_signed_cookie(self):
+		self.assertEqual(self._login('kim', 'chef')['Location'], '/chef/')
+		self.assertTrue(sessions.is_signed(self.client.cookies[settings.SESSION_COOKIE_NAME].value))
+		self.assertFalse(Session.objects.exists())
+		with self.assertNumQueries(1):  # user only
+			self.assertEqual(self.client.get(reverse('chef')).status_code, 200)
+		self.client.get(reverse('logout_view'))
+		self.assertEqual(self.client.get(reverse('chef')).status_code, 302)
+
+	def test_staff_sessions_stay_revocable(self):
+		self._login('stan', 'staff')
+		self.assertFalse(sessions.is_signed(self.client.cookies[settings.SESSION_COOKIE_NAME].value))
+
+	def test_admin_login_inserts_one_row_and_reads_skip_the_database(self):
+		with CaptureQueriesContext(connection) as ctx:
+			self.assertEqual(self._login('ada', 'admin').status_code, 302)
+		writes = self._session_writes(ctx.captured_queries)
+		self.assertEqual(len(writes), 1)
+		self.assertTrue(writes[0].startswith('INSERT'))
+		self.assertFalse(sessions.is_signed(self.client.cookies[settings.SESSION_COOKIE_NAME].value))
+		with self.assertNumQueries(1):
+			self.assertEqual(self.client.get(reverse('admin_panel')).status_code, 200)
+
+	def test_saves_write_through_only_on_change(self):
+		store = sessions.SessionStore()
+		store['cart'] = [1, 2]
+		store.save()
+		cache.clear()  # force the database fallback
+		store = sessions.SessionStore(store.session_key)
+		self.assertEqual(store['cart'], [1, 2])
+		store['cart'] = [1, 2]
+		with self.assertNumQueries(0):
+			store.save()
+		store['cart'] = [3]
+		with CaptureQueriesContext(connection) as ctx:
+			store.save()
+		self.assertEqual(len(self._session_writes(ctx.captured_queries)), 1)
+		self.assertEqual(sessions.SessionStore(store.session_key)['cart'], [3])
+
+	def test_purge_removes_expired_rows_in_chunks(self):
+		past = timezone.now() - timedelta(days=1)
+		Session.objects.bulk_create([Session(session_key=f'expired{i:05d}', session_data='', expire_date=past) for i in range(5)])
+		Session.objects.create(session_key='livesession01', session_data='', expire_date=timezone.now() + timedelta(days=1))
+		with mock.patch.object(sessions.time, 'sleep') as sleep:
+			self.assertEqual(sessions.purge_expired(chunk=2, pause=0.1), 5)
+		self.assertEqual(sleep.call_count, 2)
+		self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['livesession01'])
+
+
+class WriterGateTests(TransactionTestCase):
+	def _gate(self):
+		return writer_gate(connection.settings_dict['NAME'])
+
+	def test_transactions_hold_the_gate_until_commit_or_rollback(self):
+		self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+		with transaction.atomic():
+			MenuCategory.objects.create(name='Noodles')
+			self.assertTrue(self._gate().locked())
+		self.assertFalse(self._gate().locked())
+		with self.assertRaises(ValueError), transaction.atomic():
+			MenuCategory.objects.create(name='Rice')
+			raise ValueError
+		self.assertFalse(self._gate().locked())
+		self.assertEqual(list(MenuCategory.objects.values_list('name', flat=True)), ['Noodles'])
+
+	def test_a_writer_that_waits_too_long_gets_database_locked(self):
+		with mock.patch.dict(connection.settings_dict['OPTIONS'], {'timeout': 0.05}):
+			gate = self._gate()
+			gate.acquire()
+			try:
+				with self.assertRaisesMessage(OperationalError, 'database is locked'), transaction.atomic():
+					pass
+			finally:
+				gate.release()
+			with transaction.atomic():
+				self.assertTrue(gate.locked())
+
+
+class OrderPipelineTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='carol', password='pass12345')
+		self.client.force_login(self.user)
+		self.rice = MenuItem.objects.create(name='Basil Chicken Rice', price=Decimal('50.00'))
+		self.tea = MenuItem.objects.create(name='Milk Tea', price=Decimal('30.00'))
+
+	def _order(self, **extra):
+		order = {
+			'type': 'delivery',
+			'address': '1 Main St',
+			'subtotal': 130,
+			'deliveryFee': 20,
+			'paymentMethod': 'qr',
+			'items': [
+				{'name': 'Basil Chicken Rice', 'quantity': 2, 'price': 50},
+				{'name': 'Milk Tea', 'quantity': 1, 'price': 30},
+			],
+		}
+		order.update(extra)
+		return order
+
+	def test_create_persists_whole_graph(self):
+		resp = self.client.post(reverse('api_orders_create'), data=json.dumps({'type': 'order', 'data': json.dumps(self._order())}), content_type='application/json')
+		self.assertEqual(resp.status_code, 200)
+		order = Order.objects.get(pk=resp.json()['id'])
+		self.assertEqual(order.items.count(), 2)
+		self.assertEqual(order.payment.method, 'qr')
+		self.assertEqual(str(order.payment.amount), '160.00')
+		self.assertEqual(set(order.items.values_list('menu_item_id', flat=True)), {self.rice.pk, self.tea.pk})
+		self.assertEqual(order.rider_assignment.status, 'available')
+
+	def test_create_rejects_bad_payload(self):
+		resp = self.client.post(reverse('api_orders_create'), data=json.dumps(self._order(items=[{'name': 'Ghost', 'quantity': 1}])), content_type='application/json')
+		self.assertEqual(resp.status_code, 400)
+		self.assertEqual(Order.objects.count(), 0)
+
+	def test_non_object_bodies_are_bad_requests(self):
+		for name in ('api_orders_create', 'api_orders_batch', 'api_cart_quote'):
+			for body in ([], 'order', 5):
+				resp = self.client.post(reverse(name), data=json.dumps(body), content_type='application/json')
+				self.assertEqual(resp.status_code, 400, (name, body))
+
+	def test_batch_reports_per_order_results(self):
+		orders = [self._order(id='pos-1'), self._order(items='nope'), self._order(type='dine-in', tableNumber='4')]
+		resp = self.client.post(reverse('api_orders_batch'), data=json.dumps({'orders': orders}), content_type='application/json')
+		self.assertEqual(resp.status_code, 200)
+		body = resp.json()
+		self.assertEqual([r['ok'] for r in body['results']], [True, False, True])
+		self.assertEqual(body['results'][0]['client_ref'], 'pos-1')
+		self.assertEqual(body['created'], 2)
+		self.assertEqual(Order.objects.count(), 2)
+		self.assertEqual(OrderItem.objects.count(), 4)
+		dine_in = Order.objects.get(pk=body['results'][2]['id'])
+		self.assertFalse(RiderAssignment.objects.filter(order=dine_in).exists())
+
+
+class PricingTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='dave', password='pass12345')
+		self.client.force_login(self.user)
+		self.rice = MenuItem.objects.create(name='Basil Chicken Rice', price=Decimal('65.00'))
+		self.tea = MenuItem.objects.create(name='Milk Tea', price=Decimal('35.00'))
+		self.lunch = FoodSet.objects.create(name='Lunch Set', price=Decimal('89.00'))
+		SetItem.objects.create(food_set=self.lunch, menu_item=self.rice, quantity=1)
+		SetItem.objects.create(food_set=self.lunch, menu_item=self.tea, quantity=1)
+
+	def _quote(self, items, **extra):
+		body = {'type': 'delivery', 'items': items}
+		body.update(extra)
+		return self.client.post(reverse('api_cart_quote'), data=json.dumps(body), content_type='application/json')
+
+	def test_quote_uses_server_prices(self):
+		resp = self._quote([
+			{'menuItemId': self.rice.pk, 'quantity': 2, 'price': 1},
+			{'foodSetId': self.lunch.pk, 'quantity': 1},
+			{'name': 'milk tea', 'quantity': 1},
+		])
+		self.assertEqual(resp.status_code, 200)
+		body = resp.json()
+		self.assertEqual(body['subtotal'], '254.00')
+		self.assertEqual(body['delivery_fee'], '30.00')
+		self.assertEqual(body['total'], '284.00')
+		self.assertEqual([ln['kind'] for ln in body['lines']], ['item', 'set', 'item'])
+
+	def test_unavailable_component_blocks_set(self):
+		self.tea.available = False
+		self.tea.save()
+		resp = self._quote([{'foodSetId': self.lunch.pk, 'quantity': 1}])
+		self.assertEqual(resp.status_code, 400)
+		self.assertEqual(resp.json()['errors'][0]['line'], 0)
+
+	def test_warm_snapshot_prices_without_queries(self):
+		get_snapshot()
+		cart = [{'menuItemId': self.rice.pk, 'quantity': 1} for _ in range(30)]
+		with self.assertNumQueries(0):
+			lines, subtotal = price_lines(cart)
+		self.assertEqual(subtotal, Decimal('1950.00'))
+
+	def test_snapshot_rebuilt_on_menu_change(self):
+		before = get_snapshot()
+		self.rice.price = Decimal('70.00')
+		self.rice.save()
+		after = get_snapshot()
+		self.assertNotEqual(before.version, after.version)
+		self.assertEqual(after.items[self.rice.pk].price, Decimal('70.00'))
+
+	def test_snapshot_ages_out_without_a_bump(self):
+		# A change made in another worker: the row moves, this process sees no bump
+		before = get_snapshot()
+		MenuItem.objects.filter(pk=self.rice.pk).update(price=Decimal('75.00'))
+		self.assertIs(get_snapshot(), before)
+		with mock.patch.object(pricing.time, 'monotonic', return_value=before.built_at + pricing.MENU_SNAPSHOT_MAX_AGE):
+			self.assertEqual(get_snapshot().items[self.rice.pk].price, Decimal('75.00'))
+
+	def test_bad_quantities_and_notes_are_line_errors(self):
+		resp = self._quote([
+			{'menuItemId': self.rice.pk, 'quantity': 1.7},
+			{'menuItemId': self.rice.pk, 'quantity': '2'},
+			{'menuItemId': self.rice.pk, 'quantity': 1, 'note': 5},
+		])
+		self.assertEqual(resp.status_code, 400)
+		self.assertEqual(resp.json()['errors'], [
+			{'line': 0, 'error': 'Invalid item quantity'},
+			{'line': 2, 'error': 'Invalid item note'},
+		])
+
+
+class VoucherRedemptionTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='erin', password='pass12345')
+		self.client.force_login(self.user)
+		self.item = MenuItem.objects.create(name='Basil Chicken Rice', price=Decimal('120.00'))
+		self.voucher = Voucher.objects.create(code='FLASH', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('20.00'), usage_limit=2)
+
+	def _order(self, code='FLASH'):
+		return {'type': 'takeaway', 'voucherCode': code, 'items': [{'menuItemId': self.item.pk, 'quantity': 1}]}
+
+	def test_single_order_redeems_until_limit(self):
+		for _ in range(2):
+			resp = self.client.post(reverse('api_orders_create'), data=json.dumps(self._order()), content_type='application/json')
+			self.assertEqual(resp.status_code, 200)
+			self.assertEqual(resp.json()['total'], '100.00')
+		# Stale in-memory voucher state cannot bypass the conditional UPDATE
+		self.voucher.refresh_from_db()
+		self.assertEqual(self.voucher.used_count, 2)
+		self.voucher.used_count = 0
+		self.voucher.save()
+		draft = build_order(self.user, self._order())
+		Voucher.objects.filter(pk=self.voucher.pk).update(used_count=2)
+		with self.assertRaises(VoucherUnavailable):
+			persist_order(draft)
+		self.assertEqual(Order.objects.count(), 2)
+		self.assertEqual(VoucherRedemption.objects.filter(voucher=self.voucher, user=self.user).count(), 2)
+
+	def test_batch_never_over_redeems(self):
+		orders = [self._order() for _ in range(3)]
+		resp = self.client.post(reverse('api_orders_batch'), data=json.dumps({'orders': orders}), content_type='application/json')
+		body = resp.json()
+		self.assertEqual([r['ok'] for r in body['results']], [True, True, False])
+		self.assertEqual(body['results'][2]['error'], 'Voucher is no longer available')
+		self.voucher.refresh_from_db()
+		self.assertEqual(self.voucher.used_count, 2)
+		self.assertEqual(VoucherRedemption.objects.count(), 2)
+
+
+class VoucherLookupTests(TestCase):
+	def setUp(self):
+		self.voucher = Voucher.objects.create(code='Welcome10', amount=Decimal('10'))
+
+	def test_lookup_is_case_insensitive(self):
+		self.assertEqual(self.voucher.normalized_code, 'welcome10')
+		self.assertEqual(find_voucher(' WELCOME10 '), self.voucher)
+
+	def test_cached_hits_and_filtered_misses_skip_the_database(self):
+		find_voucher('welcome10')
+		with self.assertNumQueries(0):
+			self.assertEqual(find_voucher('WELCOME10'), self.voucher)
+			self.assertIsNone(find_voucher('NOPE-123'))
+
+	def test_save_invalidates_cache(self):
+		find_voucher('welcome10')
+		self.voucher.active = False
+		self.voucher.save()
+		self.assertFalse(find_voucher('welcome10').active)
+
+	def test_generate_vouchers_command(self):
+		call_command('generate_vouchers', '250', '--prefix', 'xmas-', '--amount', '50', '--type', 'fixed', stdout=io.StringIO())
+		codes = Voucher.objects.filter(code__startswith='XMAS-')
+		self.assertEqual(codes.count(), 250)
+		self.assertEqual(codes.values('normalized_code').distinct().count(), 250)
+		sample = codes.first()
+		self.assertEqual((sample.usage_limit, sample.discount_type, sample.amount), (1, 'fixed', Decimal('50.00')))
+		self.assertEqual(find_voucher(sample.code.lower()), sample)
+
+	def test_generated_public_vouchers_reach_sync_clients(self):
+		call_command('generate_vouchers', '3', '--prefix', 'pub-', '--public', stdout=io.StringIO())
+		ids = set(Voucher.objects.filter(code__startswith='PUB-').values_list('pk', flat=True))
+		changes = SyncChange.objects.filter(entity=changelog.ENTITY_VOUCHER, op=SyncChange.OP_UPSERT).exclude(object_id=self.voucher.pk)
+		self.assertEqual(set(changes.values_list('object_id', flat=True)), ids)
+
+	def test_generate_vouchers_checks_and_localizes_dates(self):
+		with self.assertRaises(CommandError):
+			call_command('generate_vouchers', '5', '--prefix', 'bad-', '--end', 'next week', stdout=io.StringIO())
+		self.assertFalse(Voucher.objects.filter(code__startswith='BAD-').exists())
+		call_command('generate_vouchers', '5', '--prefix', 'nye-', '--end', '2031-12-31T23:59', stdout=io.StringIO())
+		end_at = Voucher.objects.filter(code__startswith='NYE-').first().end_at
+		self.assertEqual(end_at, timezone.make_aware(datetime(2031, 12, 31, 23, 59)))
+
+
+class BestVoucherTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='frank', password='pass12345')
+		self.client.force_login(self.user)
+		now = timezone.now()
+		Voucher.objects.create(code='PCT10', discount_type=Voucher.DISCOUNT_PERCENT, amount=Decimal('10'), max_discount=Decimal('40'))
+		Voucher.objects.create(code='BIG50', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('50'), min_spend=Decimal('300'))
+		Voucher.objects.create(code='SHIP', discount_type=Voucher.DISCOUNT_FREE_SHIP)
+		Voucher.objects.create(code='SECRET99', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('99'), is_public=False)
+		Voucher.objects.create(code='LATER', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('80'), start_at=now + timedelta(days=1))
+		Voucher.objects.create(code='GONE', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('80'), usage_limit=1, used_count=1)
+
+	def _best(self, subtotal, fee):
+		resp = self.client.post(reverse('api_vouchers_best'), data=json.dumps({'subtotal': subtotal, 'delivery_fee': fee}), content_type='application/json')
+		self.assertEqual(resp.status_code, 200)
+		return resp.json()
+
+	def test_picks_largest_saving(self):
+		self.assertEqual(self._best(200, 30)['code'], 'SHIP')
+		body = self._best(350, 30)
+		self.assertEqual(body['code'], 'BIG50')
+		self.assertEqual(body['saving'], '50.00')
+		self.assertEqual(self._best(1000, 30)['code'], 'BIG50')
+
+	def test_ignores_private_future_and_exhausted_vouchers(self):
+		body = self._best(1000, 0)
+		self.assertEqual(body['code'], 'BIG50')
+		self.assertEqual(body['eligible'], 3)
+
+	def test_rejects_non_finite_amounts_and_non_object_bodies(self):
+		for body in ({'subtotal': 'NaN', 'delivery_fee': 0}, {'subtotal': 100, 'delivery_fee': 'Infinity'}, [], 'x'):
+			for name in ('api_vouchers_best', 'api_vouchers_validate'):
+				resp = self.client.post(reverse(name), data=json.dumps(body), content_type='application/json')
+				self.assertEqual(resp.status_code, 400, (name, body))
+
+
+class StockDeductionTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='gina', password='pass12345')
+		self.client.force_login(self.user)
+		self.rice = Ingredient.objects.create(name='Rice', stock_quantity=10)
+		self.chicken = Ingredient.objects.create(name='Chicken', stock_quantity=5)
+		self.tea = Ingredient.objects.create(name='Tea', stock_quantity=8)
+		self.krapao = MenuItem.objects.create(name='Basil Chicken Rice', price=Decimal('65.00'))
+		self.milk_tea = MenuItem.objects.create(name='Milk Tea', price=Decimal('35.00'))
+		IngredientUsage.objects.create(menu_item=self.krapao, ingredient=self.rice, quantity_per_unit=0.2)
+		IngredientUsage.objects.create(menu_item=self.krapao, ingredient=self.chicken, quantity_per_unit=0.25)
+		IngredientUsage.objects.create(menu_item=self.milk_tea, ingredient=self.tea, quantity_per_unit=0.3)
+		self.lunch = FoodSet.objects.create(name='Lunch Set', price=Decimal('89.00'))
+		SetItem.objects.create(food_set=self.lunch, menu_item=self.krapao, quantity=2)
+		SetItem.objects.create(food_set=self.lunch, menu_item=self.milk_tea, quantity=1)
+
+	def test_bom_explodes_sets_without_queries(self):
+		bom = get_bom()
+		with self.assertNumQueries(0):
+			totals = get_bom().explode([(None, self.lunch.pk, 2), (self.krapao.pk, None, 1)])
+		self.assertIs(get_bom(), bom)
+		self.assertAlmostEqual(totals[self.rice.pk], 1.0)
+		self.assertAlmostEqual(totals[self.chicken.pk], 1.25)
+		self.assertAlmostEqual(totals[self.tea.pk], 0.6)
+
+	def test_order_deducts_stock_and_writes_ledger(self):
+		order = {'type': 'dine-in', 'items': [
+			{'foodSetId': self.lunch.pk, 'quantity': 2},
+			{'menuItemId': self.krapao.pk, 'quantity': 1},
+		]}
+		resp = self.client.post(reverse('api_orders_create'), data=json.dumps(order), content_type='application/json')
+		self.assertEqual(resp.status_code, 200)
+		self.rice.refresh_from_db()
+		self.chicken.refresh_from_db()
+		self.tea.refresh_from_db()
+		self.assertAlmostEqual(self.rice.stock_quantity, 9.0)
+		self.assertAlmostEqual(self.chicken.stock_quantity, 3.75)
+		self.assertAlmostEqual(self.tea.stock_quantity, 7.4)
+		ledger = InventoryTransaction.objects.filter(order_id=resp.json()['id'])
+		self.assertEqual(ledger.count(), 3)
+		self.assertTrue(all(t.type == InventoryTransaction.TYPE_OUT and t.change_qty < 0 for t in ledger))
+
+	def test_cancel_returns_stock_and_voucher_use(self):
+		voucher = Voucher.objects.create(code='SORRY', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('5.00'), usage_limit=1)
+		order = persist_order(build_order(self.user, {
+			'type': 'dine-in', 'voucherCode': 'SORRY', 'items': [{'menuItemId': self.krapao.pk, 'quantity': 20}],
+		}))
+		self.krapao.refresh_from_db()
+		self.assertFalse(self.krapao.in_stock)
+		# The reversal follows the order's ledger rows, not the recipe as it is now
+		IngredientUsage.objects.filter(menu_item=self.krapao, ingredient=self.chicken).update(quantity_per_unit=1)
+		for _ in range(2):
+			transitions.transition_orders(self.user, 'customer', [order.pk], Order.STATUS_CANCELLED)
+		self.chicken.refresh_from_db()
+		self.rice.refresh_from_db()
+		self.assertAlmostEqual(self.chicken.stock_quantity, 5)
+		self.assertAlmostEqual(self.rice.stock_quantity, 10)
+		self.assertEqual(InventoryTransaction.objects.filter(order=order, type=InventoryTransaction.TYPE_IN).count(), 2)
+		self.krapao.refresh_from_db()
+		self.assertTrue(self.krapao.in_stock)
+		voucher.refresh_from_db()
+		self.assertEqual(voucher.used_count, 0)
+		self.assertFalse(VoucherRedemption.objects.filter(order=order).exists())
+
+	def test_recipe_change_rebuilds_bom(self):
+		before = get_bom()
+		IngredientUsage.objects.filter(menu_item=self.milk_tea).delete()
+		IngredientUsage.objects.create(menu_item=self.milk_tea, ingredient=self.tea, quantity_per_unit=0.5)
+		self.assertNotEqual(get_bom().version, before.version)
+		self.assertEqual(get_bom().items[self.milk_tea.pk], {self.tea.pk: 0.5})
+
+
+class AvailabilityTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='hank', password='pass12345')
+		self.client.force_login(self.user)
+		self.chicken = Ingredient.objects.create(name='Chicken', stock_quantity=0.5)
+		self.tea = Ingredient.objects.create(name='Tea', stock_quantity=8)
+		self.krapao = MenuItem.objects.create(name='Basil Chicken Rice', price=Decimal('65.00'))
+		self.milk_tea = MenuItem.objects.create(name='Milk Tea', price=Decimal('35.00'))
+		self.water = MenuItem.objects.create(name='Water', price=Decimal('10.00'))
+		IngredientUsage.objects.create(menu_item=self.krapao, ingredient=self.chicken, quantity_per_unit=0.25)
+		IngredientUsage.objects.create(menu_item=self.milk_tea, ingredient=self.tea, quantity_per_unit=0.3)
+		self.lunch = FoodSet.objects.create(name='Lunch Set', price=Decimal('89.00'))
+		SetItem.objects.create(food_set=self.lunch, menu_item=self.krapao, quantity=1)
+		self.drinks = FoodSet.objects.create(name='Drinks Set', price=Decimal('40.00'))
+		SetItem.objects.create(food_set=self.drinks, menu_item=self.milk_tea, quantity=1)
+
+	def _order(self, item, qty):
+		order = {'type': 'dine-in', 'items': [{'menuItemId': item.pk, 'quantity': qty}]}
+		return self.client.post(reverse('api_orders_create'), data=json.dumps(order), content_type='application/json')
+
+	def _sellable(self):
+		return self.client.get(reverse('api_menu_availability')).json()
+
+	def test_running_out_flips_only_dependents(self):
+		self.assertEqual(self._order(self.krapao, 2).status_code, 200)
+		self.krapao.refresh_from_db()
+		self.lunch.refresh_from_db()
+		self.assertFalse(self.krapao.in_stock)
+		self.assertFalse(self.lunch.in_stock)
+		body = self._sellable()
+		self.assertEqual(body['items'], sorted([self.milk_tea.pk, self.water.pk]))
+		self.assertEqual(body['sets'], [self.drinks.pk])
+		self.assertEqual(self._order(self.krapao, 1).status_code, 400)
+
+	def test_restock_brings_items_back(self):
+		self._order(self.krapao, 2)
+		self.chicken.stock_quantity = 3
+		self.chicken.save()
+		self.assertIn(self.krapao.pk, self._sellable()['items'])
+		self.assertIn(self.lunch.pk, self._sellable()['sets'])
+
+	def test_availability_supports_etag(self):
+		resp = self.client.get(reverse('api_menu_availability'))
+		again = self.client.get(reverse('api_menu_availability'), HTTP_IF_NONE_MATCH=resp['ETag'])
+		self.assertEqual(again.status_code, 304)
+
+	def test_availability_etag_follows_content_not_version(self):
+		# Another worker sold out the tea: the row moves, this process sees no bump
+		tag = self.client.get(reverse('api_menu_availability'))['ETag']
+		before = get_snapshot()
+		MenuItem.objects.filter(pk=self.milk_tea.pk).update(in_stock=False)
+		with mock.patch.object(pricing.time, 'monotonic', return_value=before.built_at + pricing.MENU_SNAPSHOT_MAX_AGE):
+			resp = self.client.get(reverse('api_menu_availability'), HTTP_IF_NONE_MATCH=tag)
+		self.assertEqual(resp.status_code, 200)
+		self.assertNotIn(self.milk_tea.pk, resp.json()['items'])
+
+
+class CatalogTests(TestCase):
+	def setUp(self):
+		noodles = MenuCategory.objects.create(name='Noodles')
+		self.pad_thai = MenuItem.objects.create(name='Pad Thai', price=Decimal('60.00'), category=noodles)
+		self.hidden = MenuItem.objects.create(name='Off Menu', price=Decimal('10.00'), available=False)
+		self.combo = FoodSet.objects.create(name='Noodle Combo', price=Decimal('99.00'))
+		SetItem.objects.create(food_set=self.combo, menu_item=self.pad_thai, quantity=2)
+		Voucher.objects.create(code='HELLO10', amount=Decimal('10'))
+		Voucher.objects.create(code='SECRET', amount=Decimal('50'), is_public=False)
+
+	def _get(self, **headers):
+		return self.client.get(reverse('api_catalog'), headers=headers)
+
+	def test_catalog_lists_sellable_rows_and_public_vouchers(self):
+		body = self._get().json()
+		self.assertEqual([c['name'] for c in body['categories']], ['Noodles'])
+		self.assertEqual([i['id'] for i in body['items']], [self.pad_thai.pk])
+		self.assertEqual(body['sets'][0]['items'], [{'menu_item_id': self.pad_thai.pk, 'name': 'Pad Thai', 'quantity': 2}])
+		self.assertEqual([v['code'] for v in body['vouchers']], ['HELLO10'])
+
+	def test_repeat_loads_are_served_from_memory_and_revalidate(self):
+		first = self._get(accept_encoding='gzip, deflate')
+		self.assertEqual(first['Content-Encoding'], 'gzip')
+		self.assertEqual(json.loads(gzip.decompress(first.content))['items'][0]['name'], 'Pad Thai')
+		with self.assertNumQueries(0):
+			again = self._get(accept_encoding='gzip', if_none_match=first['ETag'])
+		self.assertEqual(again.status_code, 304)
+		# The identity encoding has its own tag
+		self.assertNotEqual(self._get()['ETag'], first['ETag'])
+
+	def test_catalog_changes_bump_the_version(self):
+		tag = self._get()['ETag']
+		self.pad_thai.price = Decimal('65.00')
+		self.pad_thai.save()
+		changed = self._get(if_none_match=tag)
+		self.assertEqual(changed.status_code, 200)
+		self.assertEqual(changed.json()['items'][0]['price'], '65.00')
+
+
+class StockLedgerTests(TestCase):
+	def setUp(self):
+		self.chicken = Ingredient.objects.create(name='Chicken', stock_quantity=10)
+		self.t0 = timezone.now() - timedelta(hours=3)
+
+	def _move(self, qty, hours_after_t0, kind=InventoryTransaction.TYPE_OUT):
+		tx = InventoryTransaction.objects.create(ingredient=self.chicken, change_qty=qty, type=kind)
+		InventoryTransaction.objects.filter(pk=tx.pk).update(created_at=self.t0 + timedelta(hours=hours_after_t0))
+
+	def _set_stock(self, qty):
+		Ingredient.objects.filter(pk=self.chicken.pk).update(stock_quantity=qty)
+
+	def test_stock_at_uses_checkpoint_and_tail(self):
+		take_checkpoints(self.t0)
+		self._move(-2, 0.5)
+		self._move(3, 1.5, InventoryTransaction.TYPE_IN)
+		self._move(1, 2.5)  # unsigned "out" entered by hand
+		self._set_stock(10)
+		take_checkpoints(self.t0 + timedelta(hours=2))
+		self.assertEqual(StockCheckpoint.objects.get(taken_at=self.t0 + timedelta(hours=2)).stock_quantity, 11)
+		self.assertEqual(stock_at(self.chicken.pk, self.t0 + timedelta(hours=1)), 8)
+		with self.assertNumQueries(3):
+			self.assertEqual(stock_at(self.chicken.pk, self.t0 + timedelta(hours=2, minutes=45)), 10)
+
+	def test_first_checkpoint_is_derived_from_current_stock(self):
+		self._move(-4, 1)
+		self._set_stock(6)
+		take_checkpoints(self.t0)
+		self.assertEqual(StockCheckpoint.objects.get().stock_quantity, 10)
+
+	def test_reconcile_command_reports_and_fixes_drift(self):
+		take_checkpoints(self.t0)
+		self._move(-2, 1)
+		self._set_stock(8)
+		call_command('reconcile_stock', stdout=io.StringIO())
+		self._set_stock(7.5)
+		with self.assertRaises(CommandError):
+			call_command('reconcile_stock', stdout=io.StringIO())
+		with mock.patch('builtins.input', return_value='n'), self.assertRaises(CommandError):
+			call_command('reconcile_stock', '--fix', stdout=io.StringIO())
+		self.chicken.refresh_from_db()
+		self.assertEqual(self.chicken.stock_quantity, 7.5)
+		with mock.patch('builtins.input', return_value='y'):
+			call_command('reconcile_stock', '--fix', stdout=io.StringIO())
+		self.chicken.refresh_from_db()
+		self.assertEqual(self.chicken.stock_quantity, 8)
+
+	def test_reconcile_fix_refreshes_availability(self):
+		curry = MenuItem.objects.create(name='Curry', price=Decimal('80.00'))
+		IngredientUsage.objects.create(menu_item=curry, ingredient=self.chicken, quantity_per_unit=9)
+		take_checkpoints(self.t0)
+		self._move(-2, 1)
+		self._set_stock(9.5)
+		call_command('reconcile_stock', '--fix', '--no-input', stdout=io.StringIO())
+		curry.refresh_from_db()
+		self.assertFalse(curry.in_stock)
+
+	def test_reconcile_adopt_stock_books_the_difference(self):
+		take_checkpoints(self.t0)
+		self._move(-2, 1)
+		self._set_stock(9.5)
+		call_command('reconcile_stock', '--adopt-stock', stdout=io.StringIO())
+		self.chicken.refresh_from_db()
+		self.assertEqual(self.chicken.stock_quantity, 9.5)
+		correction = InventoryTransaction.objects.latest('id')
+		self.assertEqual((correction.type, correction.change_qty), (InventoryTransaction.TYPE_IN, 1.5))
+		call_command('reconcile_stock', stdout=io.StringIO())
+
+
+class AdminHealthCounterTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.admin = User.objects.create_user(username='boss', password='pass12345')
+		Profile.objects.create(user=self.admin, role='admin')
+		self.client.force_login(self.admin)
+		self.rice = MenuItem.objects.create(name='Fried Rice', price=Decimal('40.00'))
+
+	def _health(self):
+		cache.delete(counters.READ_CACHE_KEY)
+		return self.client.get(reverse('api_admin_health')).json()
+
+	def test_counts_follow_writes_and_match_resync(self):
+		self._health()
+		user = User.objects.create_user(username='rider1', password='pass12345')
+		profile = Profile.objects.create(user=user, role='customer')
+		profile = Profile.objects.get(pk=profile.pk)
+		profile.role = 'rider'
+		profile.save()
+		orders = [build_order(self.admin, {'type': 'takeaway', 'items': [{'menuItemId': self.rice.pk, 'quantity': 1}]}) for _ in range(3)]
+		persist_orders(orders)
+		persist_order(build_order(self.admin, {'type': 'dine-in', 'items': [{'menuItemId': self.rice.pk, 'quantity': 2}]}))
+		Order.objects.filter(pk=orders[0].order.pk).delete()
+		body = self._health()
+		self.assertEqual(body['counts']['orders'], 3)
+		self.assertEqual(body['counts']['order_items'], 3)
+		self.assertEqual(body['counts']['payments'], 3)
+		# The default admin from migration 0004 is counted too
+		self.assertEqual(body['counts']['profiles_by_role'], {'admin': 2, 'rider': 1})
+		self.assertEqual(body['meta']['source'], 'counters')
+		exact = counters.resync()
+		self.assertEqual({k: v for k, v in body['counts'].items() if k in exact}, {k: v for k, v in exact.items() if k in body['counts']})
+
+	def test_health_reads_counters_in_one_query(self):
+		self._health()
+		cache.delete(counters.READ_CACHE_KEY)
+		with self.assertNumQueries(1):
+			counters.cached_read()
+		with self.assertNumQueries(0):
+			counts, _, meta = counters.cached_read()
+		self.assertEqual(meta['source'], 'cache')
+		self.assertEqual(counts['menu_items'], 1)
+
+	def test_sync_command_repairs_drift(self):
+		self._health()
+		RowCounter.objects.filter(key='menu_items').update(value=99)
+		call_command('sync_counters', stdout=io.StringIO())
+		self.assertEqual(self._health()['counts']['menu_items'], 1)
+		self.assertIsNotNone(self._health()['meta']['synced_at'])
+
+
+class MyOrdersPagingTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='dave', password='pass12345')
+		self.client.force_login(self.user)
+		rice = MenuItem.objects.create(name='Pad Thai', price=Decimal('60.00'))
+		payload = {'type': 'takeaway', 'items': [{'menuItemId': rice.pk, 'quantity': 1}]}
+		self.orders = [persist_order(build_order(self.user, payload)) for _ in range(5)]
+		# Two orders share a timestamp so the id tie-breaker matters
+		Order.objects.filter(pk=self.orders[2].pk).update(created_at=self.orders[1].created_at)
+
+	def _get(self, **params):
+		return self.client.get(reverse('api_orders_my'), params)
+
+	def test_keyset_pages_cover_history_once(self):
+		seen, cursor = [], None
+		while True:
+			body = self._get(limit=2, **({'cursor': cursor} if cursor else {})).json()
+			seen += [o['id'] for o in body['orders']]
+			cursor = body['next_cursor']
+			if not cursor:
+				break
+		expected = list(Order.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True))
+		self.assertEqual(seen, expected)
+		self.assertEqual(self._get(cursor='garbage!').status_code, 400)
+
+	def test_updated_since_returns_only_changed_orders(self):
+		token = self._get(updated_since=timezone.now().isoformat()).json()['sync_token']
+		order = Order.objects.get(pk=self.orders[3].pk)
+		order.status = Order.STATUS_PREPARING
+		order.save()
+		body = self._get(updated_since=token).json()
+		self.assertEqual([o['id'] for o in body['orders']], [order.pk])
+		self.assertEqual(self._get(updated_since=body['sync_token']).json()['orders'], [])
+
+	def test_etag_answers_304_until_orders_change(self):
+		first = self._get(limit=3)
+		etag = first['ETag']
+		again = self.client.get(reverse('api_orders_my'), {'limit': 3}, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(again.status_code, 304)
+		self.assertEqual(again.content, b'')
+		Order.objects.filter(pk=self.orders[0].pk).update(status=Order.STATUS_CANCELLED, updated_at=timezone.now())
+		changed = self.client.get(reverse('api_orders_my'), {'limit': 3}, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(changed.status_code, 200)
+
+
+
+class EventStreamTests(TestCase):
+	def setUp(self):
+		self.customer = User.objects.create_user(username='erin', password='pass12345')
+		self.rider = User.objects.create_user(username='rick', password='pass12345')
+		Profile.objects.create(user=self.rider, role='rider')
+		item = MenuItem.objects.create(name='Khao Man Gai', price=Decimal('55.00'))
+		self.order = persist_order(build_order(self.customer, {
+			'type': 'delivery', 'address': '9 Soi', 'items': [{'menuItemId': item.pk, 'quantity': 1}],
+		}))
+		# Everything published before this id is history for the test
+		self.mark = events.hub.publish('probe', {}, {'nobody'}).id
+
+	def _collect(self, topics, count, last_id=None, order_ids=None, publish=()):
+		"""Open a stream, publish while subscribed, return ``count`` frames after ``retry``."""
+		async def run():
+			body = events.stream(topics, order_ids, last_id, heartbeat=0.05)
+			frames = [await body.__anext__()]
+			for args in publish:
+				events.hub.publish(*args)
+			while len(frames) <= count:
+				frames.append(await body.__anext__())
+			await body.aclose()
+			return frames[1:]
+		return asyncio.run(run())
+
+	def test_status_change_is_replayed_to_customer_and_riders(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			order = Order.objects.get(pk=self.order.pk)
+			order.status = Order.STATUS_READY
+			order.save()
+		customer = self._collect({events.user_topic(self.customer.pk)}, 1, last_id=self.mark)
+		self.assertIn(b'event: order.status', customer[0])
+		self.assertIn(b'"status":"ready"', customer[0])
+		rider = self._collect(events.topics_for(self.rider.pk, 'rider'), 1, last_id=self.mark)
+		self.assertIn(b'event: job.ready', rider[0])
+
+	def test_accepting_a_job_notifies_riders(self):
+		Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+		self.client.force_login(self.rider)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.post(reverse('api_rider_accept', args=[self.order.pk]))
+		frames = self._collect(events.topics_for(self.rider.pk, 'rider'), 2, last_id=self.mark)
+		self.assertIn(b'event: assignment', frames[0])
+		self.assertIn(b'event: job.taken', frames[1])
+
+	def test_live_stream_filters_by_order_and_sends_heartbeats(self):
+		topics = {events.TOPIC_STAFF}
+		frames = self._collect(topics, 2, order_ids={self.order.pk}, publish=[
+			('order.status', {'id': 0}, topics, self.order.pk + 1),
+			('order.status', {'id': self.order.pk}, topics, self.order.pk),
+		])
+		self.assertIn(f'"id":{self.order.pk}'.encode(), frames[0])
+		self.assertEqual(frames[1], b': ping\n\n')
+
+	def test_unknown_last_event_id_asks_client_to_reset(self):
+		frames = self._collect({events.TOPIC_STAFF}, 1, last_id=1)
+		self.assertTrue(frames[0].startswith(b'event: reset'))
+
+	async def test_view_requires_login_and_streams(self):
+		resp = await self.async_client.get(reverse('api_events'))
+		self.assertEqual(resp.status_code, 403)
+		await self.async_client.aforce_login(self.rider)
+		resp = await self.async_client.get(reverse('api_events'))
+		self.assertEqual(resp['Content-Type'], 'text/event-stream')
+		first = await resp.streaming_content.__anext__()
+		self.assertTrue(first.startswith(b'retry:'))
+
+
+class RiderDispatchTests(TestCase):
+	def setUp(self):
+		customer = User.objects.create_user(username='fay', password='pass12345')
+		self.rider = User.objects.create_user(username='ron', password='pass12345')
+		self.other = User.objects.create_user(username='rex', password='pass12345')
+		Profile.objects.bulk_create([Profile(user=self.rider, role='rider'), Profile(user=self.other, role='rider')])
+		item = MenuItem.objects.create(name='Som Tam', price=Decimal('45.00'))
+		self.order = persist_order(build_order(customer, {
+			'type': 'delivery', 'address': '3 Road', 'items': [{'menuItemId': item.pk, 'quantity': 1}],
+		}))
+
+	def _post(self, name, user):
+		self.client.force_login(user)
+		return self.client.post(reverse(name, args=[self.order.pk]))
+
+	def test_only_ready_orders_can_be_claimed(self):
+		resp = self._post('api_rider_accept', self.rider)
+		self.assertEqual(resp.status_code, 409)
+		self.assertEqual(resp.json()['outcome'], dispatch.NOT_CLAIMABLE)
+
+	def test_staff_moves_bring_the_assignment_along(self):
+		staff = User.objects.create_user(username='stu', password='pass12345')
+		Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+		transitions.transition_orders(staff, 'staff', [self.order.pk], Order.STATUS_DELIVERING)
+		assignment = RiderAssignment.objects.get(order=self.order)
+		self.assertEqual(assignment.status, dispatch.ASSIGNMENT_DELIVERING)
+		self.assertIsNotNone(assignment.picked_at)
+		transitions.transition_orders(staff, 'staff', [self.order.pk], Order.STATUS_COMPLETED)
+		assignment.refresh_from_db()
+		self.assertEqual(assignment.status, dispatch.ASSIGNMENT_COMPLETED)
+		self.assertIsNotNone(assignment.delivered_at)
+		self.assertEqual(dispatch.claim_job(self.order.pk, self.rider), dispatch.NOT_CLAIMABLE)
+
+	def test_claiming_a_legacy_order_counts_the_new_assignment(self):
+		RiderAssignment.objects.filter(order=self.order).delete()
+		Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+		counters.resync()
+		self.assertEqual(dispatch.claim_job(self.order.pk, self.rider), dispatch.CLAIMED)
+		self.assertEqual(RowCounter.objects.get(key='rider_assignments').value, RiderAssignment.objects.count())
+
+	def test_claiming_a_legacy_batch_counts_the_new_assignments(self):
+		RiderAssignment.objects.filter(order=self.order).delete()
+		Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+		counters.resync()
+		self.assertEqual(dispatch.claim_batch([self.order.pk], self.rider), dispatch.CLAIMED)
+		self.assertEqual(RowCounter.objects.get(key='rider_assignments').value, RiderAssignment.objects.count())
+
+	def test_second_claim_loses_and_steps_are_guarded(self):
+		Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+		self.assertEqual(dispatch.claim_job(self.order.pk, self.rider), dispatch.CLAIMED)
+		self.assertEqual(dispatch.claim_job(self.order.pk, self.other), dispatch.TAKEN)
+		self.assertEqual(dispatch.claim_job(self.order.pk, self.rider), dispatch.ALREADY_YOURS)
+		self.assertEqual(self._post('api_rider_complete', self.rider).json()['outcome'], dispatch.OUT_OF_ORDER)
+		self.assertEqual(self._post('api_rider_picked', self.other).status_code, 403)
+		self.assertEqual(self._post('api_rider_picked', self.rider).status_code, 200)
+		self.assertEqual(self._post('api_rider_complete', self.rider).status_code, 200)
+		order = Order.objects.select_related('rider_assignment').get(pk=self.order.pk)
+		self.assertEqual(order.status, Order.STATUS_COMPLETED)
+		self.assertEqual(order.rider_assignment.rider, self.rider)
+		self.assertEqual(order.rider_assignment.status, dispatch.ASSIGNMENT_COMPLETED)
+
+	def test_claim_creates_missing_assignment(self):
+		RiderAssignment.objects.filter(order=self.order).delete()
+		Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+		self.assertEqual(dispatch.claim_job(self.order.pk, self.rider), dispatch.CLAIMED)
+		self.assertEqual(RiderAssignment.objects.get(order=self.order).rider, self.rider)
+
+
+class NearbyJobsTests(TestCase):
+	def setUp(self):
+		self.rider = User.objects.create_user(username='nina', password='pass12345')
+		Profile.objects.create(user=self.rider, role='rider')
+		self.client.force_login(self.rider)
+		item = MenuItem.objects.create(name='Larb', price=Decimal('50.00'))
+		self.jobs = {}
+		# Roughly 0.1, 1.1, 3.3 and 22 km north of the rider
+		for name, dlat in (('near', 0.001), ('mid', 0.01), ('far', 0.03), ('out', 0.2)):
+			draft = build_order(self.rider, {
+				'type': 'delivery', 'address': name, 'lat': 13.75 + dlat, 'lng': 100.5,
+				'items': [{'menuItemId': item.pk, 'quantity': 1}],
+			})
+			self.jobs[name] = persist_order(draft)
+		Order.objects.update(status=Order.STATUS_READY)
+
+	def _nearby(self, **params):
+		return self.client.get(reverse('api_rider_jobs_nearby'), {'lat': 13.75, 'lng': 100.5, **params})
+
+	def test_returns_nearest_open_jobs_within_radius(self):
+		dispatch.claim_job(self.jobs['mid'].pk, self.rider)
+		body = self._nearby(radius=10).json()
+		self.assertEqual([j['address'] for j in body['jobs']], ['near', 'far'])
+		self.assertAlmostEqual(body['jobs'][0]['distance_km'], 0.111, places=2)
+		self.assertEqual([j['address'] for j in self._nearby(radius=50, limit=1).json()['jobs']], ['near'])
+
+	def test_search_widens_only_as_needed(self):
+		with self.assertNumQueries(1):
+			dispatch.nearby_jobs(13.75, 100.5, 50, 1)
+		self.assertEqual(len(dispatch.nearby_jobs(13.75, 100.5, 50, 4)), 4)
+
+	def test_rejects_missing_location(self):
+		self.assertEqual(self.client.get(reverse('api_rider_jobs_nearby')).status_code, 400)
+
+
+class DeliveryBatchingTests(TestCase):
+	def setUp(self):
+		self.rider = User.objects.create_user(username='bo', password='pass12345')
+		self.other = User.objects.create_user(username='bea', password='pass12345')
+		Profile.objects.bulk_create([Profile(user=self.rider, role='rider'), Profile(user=self.other, role='rider')])
+		self.now = timezone.now()
+
+	def _stop(self, pk, dlat, dlng, minutes=0):
+		return batching.Stop(order_id=pk, lat=13.75 + dlat, lng=100.5 + dlng, ready_at=self.now + timedelta(minutes=minutes))
+
+	def test_groups_nearby_orders_with_close_ready_times(self):
+		stops = [
+			self._stop(1, 0.000, 0.000),
+			self._stop(2, 0.005, 0.000, minutes=3),
+			self._stop(3, 0.000, 0.005, minutes=5),
+			self._stop(4, 0.002, 0.002, minutes=30),  # ready too late
+			self._stop(5, 0.100, 0.100),  # too far
+		]
+		batches = batching.build_batches(stops, origin=(13.75, 100.49))
+		groups = sorted(sorted(b.order_ids) for b in batches)
+		self.assertEqual(groups, [[1, 2, 3], [4], [5]])
+
+	def test_route_is_no_longer_than_nearest_neighbour(self):
+		origin = (13.75, 100.5)
+		# Stops on a line, listed out of order
+		stops = [self._stop(pk, 0, d) for pk, d in ((1, 0.03), (2, 0.01), (3, 0.04), (4, 0.02))]
+		route, distance = batching.order_route(origin, stops)
+		self.assertEqual([s.order_id for s in route], [2, 4, 1, 3])
+		self.assertAlmostEqual(distance, batching.route_length(origin, route))
+
+	def test_batch_accept_is_all_or_nothing(self):
+		item = MenuItem.objects.create(name='Tom Yum', price=Decimal('80.00'))
+		orders = [
+			persist_order(build_order(self.rider, {
+				'type': 'delivery', 'address': 'x', 'lat': 13.75, 'lng': 100.5 + i * 0.001,
+				'items': [{'menuItemId': item.pk, 'quantity': 1}],
+			}))
+			for i in range(3)
+		]
+		Order.objects.update(status=Order.STATUS_READY)
+		self.client.force_login(self.rider)
+		body = self.client.get(reverse('api_rider_batches')).json()
+		self.assertEqual(len(body['batches']), 1)
+		ids = body['batches'][0]['orders']
+		dispatch.claim_job(orders[1].pk, self.other)
+		resp = self.client.post(reverse('api_rider_batch_accept'), data=json.dumps({'orders': ids}), content_type='application/json')
+		self.assertEqual(resp.status_code, 409)
+		self.assertEqual(RiderAssignment.objects.filter(rider=self.rider).count(), 0)
+		RiderAssignment.objects.filter(order=orders[1]).update(rider=None, status='available')
+		resp = self.client.post(reverse('api_rider_batch_accept'), data=json.dumps({'orders': ids}), content_type='application/json')
+		self.assertEqual(resp.json()['outcome'], dispatch.CLAIMED)
+		self.assertEqual(RiderAssignment.objects.filter(rider=self.rider).count(), 3)
+
+
+	def test_rider_endpoints_refuse_customers(self):
+		customer = User.objects.create_user(username='cal', password='pass12345')
+		Profile.objects.create(user=customer, role='customer')
+		self.client.force_login(customer)
+		self.assertEqual(self.client.get(reverse('api_rider_batches')).status_code, 403)
+		self.assertEqual(self.client.get(reverse('api_rider_jobs_nearby'), {'lat': 13.75, 'lng': 100.5}).status_code, 403)
+		for name, body in (('api_rider_batch_accept', {'orders': [1]}), ('api_rider_location', {'lat': 13.75, 'lng': 100.5})):
+			resp = self.client.post(reverse(name), data=json.dumps(body), content_type='application/json')
+			self.assertEqual(resp.status_code, 403)
+		self.assertFalse(RiderAssignment.objects.filter(rider=customer).exists())
+
+class RiderTrackingTests(TestCase):
+	def setUp(self):
+		self.customer = User.objects.create_user(username='gus', password='pass12345')
+		self.rider = User.objects.create_user(username='rae', password='pass12345')
+		Profile.objects.create(user=self.rider, role='rider')
+		item = MenuItem.objects.create(name='Pad Kra Pao', price=Decimal('55.00'))
+		self.order = persist_order(build_order(self.customer, {
+			'type': 'delivery', 'address': '7 Lane', 'items': [{'menuItemId': item.pk, 'quantity': 1}],
+		}))
+		Order.objects.filter(pk=self.order.pk).update(status=Order.STATUS_READY)
+		dispatch.claim_job(self.order.pk, self.rider)
+		self.addCleanup(tracking.store.close, self.order.pk)
+
+	def _ping(self, **body):
+		self.client.force_login(self.rider)
+		return self.client.post(reverse('api_rider_location'), data=json.dumps(body), content_type='application/json')
+
+	def test_pings_are_downsampled_and_tracking_reads_memory(self):
+		start = time.time() - 100
+		points = [{'lat': 13.75 + i * 1e-5, 'lng': 100.5, 'ts': start + i} for i in range(90)]
+		self.assertEqual(self._ping(points=points).json()['orders'], [self.order.pk])
+		# 90 pings a second apart -> one row per 30 s
+		self.assertEqual(RiderLocation.objects.filter(order=self.order).count(), 3)
+		self.client.force_login(self.customer)
+		eta.model.warm()
+		with self.assertNumQueries(1):  # user only; the session is read from the cache
+			body = self.client.get(reverse('api_order_tracking', args=[self.order.pk]), {'trail': 3}).json()
+		self.assertEqual(body['source'], 'memory')
+		self.assertAlmostEqual(body['position']['lat'], 13.75 + 89e-5)
+		self.assertEqual(len(body['trail']), 3)
+		self.assertGreater(body['eta']['seconds'], 0)
+
+	def test_cancelling_closes_the_ring(self):
+		self._ping(lat=13.75, lng=100.5)
+		self.assertIsNotNone(tracking.store.ring(self.order.pk))
+		staff = User.objects.create_user(username='sam', password='pass12345')
+		transitions.transition_orders(staff, 'staff', [self.order.pk], Order.STATUS_CANCELLED)
+		self.assertIsNone(tracking.store.ring(self.order.pk))
+		self.assertEqual(self._ping(lat=13.76, lng=100.5).json()['orders'], [])
+		self.assertIsNone(tracking.store.ring(self.order.pk))
+
+	def test_ring_keeps_only_the_newest_pings(self):
+		ring = tracking.LocationRing(1, 2, 3, capacity=4)
+		for i in range(10):
+			ring.push(float(i), 1.0, 2.0)
+		self.assertEqual([p['ts'] for p in ring.recent(10)], [6.0, 7.0, 8.0, 9.0])
+		self.assertEqual(ring.latest()['ts'], 9.0)
+
+	def test_other_users_cannot_track_and_bad_pings_are_rejected(self):
+		self.assertEqual(self._ping(lat=200, lng=0).status_code, 400)
+		self.assertEqual(self._ping(points=[1, 'x', None]).status_code, 400)
+		self.assertEqual(self._ping(points=[{'lat': 13.75, 'lng': 100.5}, 'x']).json()['accepted'], 1)
+		self._ping(lat=13.75, lng=100.5)
+		stranger = User.objects.create_user(username='sid', password='pass12345')
+		self.client.force_login(stranger)
+		self.assertEqual(self.client.get(reverse('api_order_tracking', args=[self.order.pk])).status_code, 403)
+
+
+class KitchenQueueTests(TestCase):
+	def setUp(self):
+		self.chef = User.objects.create_user(username='chef1', password='pass12345')
+		Profile.objects.create(user=self.chef, role='chef')
+		self.client.force_login(self.chef)
+		self.rice = MenuItem.objects.create(name='Basil Chicken Rice', price=Decimal('50.00'))
+		self.egg = MenuItem.objects.create(name='Fried Egg', price=Decimal('10.00'))
+		combo = FoodSet.objects.create(name='Rice Combo', price=Decimal('55.00'))
+		SetItem.objects.create(food_set=combo, menu_item=self.rice, quantity=1)
+		SetItem.objects.create(food_set=combo, menu_item=self.egg, quantity=2)
+		self.orders = [
+			persist_order(build_order(self.chef, {'type': 'dine-in', 'items': items}))
+			for items in (
+				[{'menuItemId': self.rice.pk, 'quantity': 2}],
+				[{'foodSetId': combo.pk, 'quantity': 3}],
+				[{'menuItemId': self.egg.pk, 'quantity': 1}],
+			)
+		]
+		Order.objects.filter(pk=self.orders[2].pk).update(status=Order.STATUS_READY)
+
+	def test_cook_list_aggregates_items_and_set_components(self):
+		with self.assertNumQueries(1):
+			cook = kitchen.cook_list()
+		self.assertEqual(cook, [
+			{'menu_item_id': self.egg.pk, 'name': 'Fried Egg', 'quantity': 6, 'orders': 1},
+			{'menu_item_id': self.rice.pk, 'name': 'Basil Chicken Rice', 'quantity': 5, 'orders': 2},
+		])
+
+	def test_queue_etag_and_since(self):
+		resp = self.client.get(reverse('api_kitchen_queue'))
+		body = resp.json()
+		self.assertEqual(body['queue'], [self.orders[0].pk, self.orders[1].pk])
+		again = self.client.get(reverse('api_kitchen_queue'), HTTP_IF_NONE_MATCH=resp['ETag'])
+		self.assertEqual(again.status_code, 304)
+		order = Order.objects.get(pk=self.orders[1].pk)
+		order.status = Order.STATUS_PREPARING
+		order.save()
+		delta = self.client.get(reverse('api_kitchen_queue'), {'since': body['server_time']}).json()
+		self.assertEqual([o['id'] for o in delta['orders']], [order.pk])
+
+	def test_customers_are_turned_away(self):
+		customer = User.objects.create_user(username='hal', password='pass12345')
+		self.client.force_login(customer)
+		self.assertEqual(self.client.get(reverse('api_kitchen_queue')).status_code, 403)
+
+
+class OrderTransitionTests(TestCase):
+	def setUp(self):
+		self.staff = User.objects.create_user(username='sam', password='pass12345')
+		Profile.objects.create(user=self.staff, role='staff')
+		self.customer = User.objects.create_user(username='ivy', password='pass12345')
+		item = MenuItem.objects.create(name='Green Curry', price=Decimal('70.00'))
+		payload = {'type': 'dine-in', 'items': [{'menuItemId': item.pk, 'quantity': 1}]}
+		self.orders = [persist_order(build_order(self.customer, payload)) for _ in range(6)]
+		self.ids = [o.pk for o in self.orders]
+
+	def _transition(self, user, ids, status):
+		self.client.force_login(user)
+		return self.client.post(
+			reverse('api_orders_transition'),
+			data=json.dumps({'orders': ids, 'status': status}),
+			content_type='application/json',
+		)
+
+	def test_bulk_move_costs_one_update_per_source_status(self):
+		Order.objects.filter(pk__in=self.ids[:2]).update(status=Order.STATUS_PENDING)
+		Order.objects.filter(pk__in=self.ids[2:5]).update(status=Order.STATUS_PREPARING)
+		Order.objects.filter(pk=self.ids[5]).update(status=Order.STATUS_COMPLETED)
+		with self.captureOnCommitCallbacks() as published:
+			# read, 2 updates, verify, history read + insert, change log insert, ledger and
+			# redemption reads for the cancel (nothing to return here), savepoint pair
+			with self.assertNumQueries(11):
+				results = transitions.transition_orders(self.staff, 'staff', self.ids + [999999], Order.STATUS_CANCELLED)
+		self.assertEqual([r.outcome for r in results], ['ok'] * 5 + ['not_allowed', 'not_found'])
+		self.assertEqual(Order.objects.filter(status=Order.STATUS_CANCELLED).count(), 5)
+		self.assertEqual(OrderStatusEvent.objects.filter(to_status=Order.STATUS_CANCELLED).count(), 5)
+		# One event per moved order plus the ETA model feed
+		self.assertEqual(len(published), 6)
+
+	def test_endpoint_enforces_role_rules(self):
+		body = self._transition(self.customer, self.ids[:1], Order.STATUS_READY).json()
+		self.assertEqual(body['results'][0]['outcome'], transitions.NOT_ALLOWED)
+		body = self._transition(self.customer, self.ids[:1], Order.STATUS_CANCELLED).json()
+		self.assertEqual(body['changed'], 1)
+		body = self._transition(self.staff, self.ids[1:3], Order.STATUS_PREPARING).json()
+		self.assertEqual([r['status'] for r in body['results']], ['preparing', 'preparing'])
+		self.assertEqual(self._transition(self.staff, self.ids[1:3], 'bogus').status_code, 400)
+		self.client.force_login(self.staff)
+		for body in ([], 'ready', 5):
+			resp = self.client.post(reverse('api_orders_transition'), data=json.dumps(body), content_type='application/json')
+			self.assertEqual(resp.status_code, 400)
+
+	def test_customers_only_reach_their_own_orders(self):
+		other = User.objects.create_user(username='jo', password='pass12345')
+		body = self._transition(other, self.ids[:1], Order.STATUS_CANCELLED).json()
+		self.assertEqual(body['results'][0]['outcome'], transitions.NOT_FOUND)
+
+
+class OrderHistoryTests(TestCase):
+	def setUp(self):
+		self.customer = User.objects.create_user(username='kai', password='pass12345')
+		self.rider = User.objects.create_user(username='rob', password='pass12345')
+		item = MenuItem.objects.create(name='Khao Soi', price=Decimal('65.00'))
+		self.order = persist_order(build_order(self.customer, {
+			'type': 'delivery', 'address': '3 Lane', 'items': [{'menuItemId': item.pk, 'quantity': 1}],
+		}))
+		self.addCleanup(eta.model.warm)
+
+	def test_every_status_change_is_logged_once(self):
+		self.order.status = Order.STATUS_PREPARING
+		self.order.save()
+		self.order.save()
+		transitions.transition_orders(None, 'admin', [self.order.pk], Order.STATUS_READY)
+		dispatch.claim_job(self.order.pk, self.rider)
+		dispatch.pick_up(self.order.pk, self.rider)
+		steps = [(e.from_status, e.to_status) for e in history.timeline(self.order.pk)]
+		self.assertEqual(steps, [
+			('', 'pending'), ('pending', 'preparing'), ('preparing', 'ready'), ('ready', 'delivering'),
+		])
+		self.assertIsNone(history.timeline(self.order.pk)[0].duration_seconds)
+		self.assertTrue(all(e.duration_seconds >= 0 for e in history.timeline(self.order.pk)[1:]))
+
+	def test_events_are_append_only(self):
+		event = OrderStatusEvent.objects.get(order=self.order)
+		event.to_status = Order.STATUS_COMPLETED
+		with self.assertRaises(ValueError):
+			event.save()
+
+	def test_eta_reads_memory_only(self):
+		model = eta.EtaModel()
+		with self.assertNumQueries(0):
+			self.assertIsNone(model.eta(self.order.pk))
+		model.warm()
+		with self.assertNumQueries(0):
+			self.assertEqual(model.eta(self.order.pk)[1], Order.STATUS_PENDING)
+
+	def test_eta_follows_observed_stage_times(self):
+		model = eta.EtaModel()
+		model.warm()
+		now = timezone.now()
+		fresh = model.eta(self.order.pk, now)[0]
+		self.assertAlmostEqual(fresh, sum(eta.DEFAULT_SECONDS[s] for s in eta.PATHS[Order.TYPE_DELIVERY]), delta=5)
+		# A slow kitchen pushes the preparing estimate up
+		past = now - timedelta(hours=1)
+		model.apply([
+			OrderStatusEvent(order_id=0, from_status='preparing', to_status='ready', order_type='delivery',
+				duration_seconds=3600.0, created_at=past)
+			for _ in range(10)
+		])
+		self.assertGreater(model.eta(self.order.pk, now)[0], fresh)
+		# Later, the order's own progress is applied incrementally and done orders drop out
+		model.apply([OrderStatusEvent(order_id=self.order.pk, from_status='pending', to_status='cancelled',
+			order_type='delivery', duration_seconds=5.0, created_at=now)])
+		self.assertIsNone(model.eta(self.order.pk, now))
+
+
+class SyncTests(TestCase):
+	def setUp(self):
+		self.customer = User.objects.create_user(username='lea', password='pass12345')
+		self.other = User.objects.create_user(username='max', password='pass12345')
+		self.item = MenuItem.objects.create(name='Tom Yum', price=Decimal('80.00'))
+		self.rice = Ingredient.objects.create(name='Rice', stock_quantity=10)
+		self.client.force_login(self.customer)
+
+	def _sync(self, since=0, **params):
+		return self.client.get(reverse('api_sync'), {'since': since, **params}).json()
+
+	def _order(self, user):
+		return persist_order(build_order(user, {'type': 'dine-in', 'items': [{'menuItemId': self.item.pk, 'quantity': 1}]}))
+
+	def test_sync_returns_only_changes_after_the_cursor(self):
+		start = self._sync()
+		self.assertEqual([(c['entity'], c['op']) for c in start['changes']], [('menu_item', 'upsert')])
+		self.item.price = Decimal('85.00')
+		self.item.save()
+		order = self._order(self.customer)
+		body = self._sync(start['next'])
+		self.assertEqual([(c['entity'], c['id']) for c in body['changes']], [('menu_item', self.item.pk), ('order', order.pk)])
+		self.assertEqual(body['changes'][0]['data']['price'], '85.00')
+		self.assertEqual(self._sync(body['next'])['changes'], [])
+
+	def test_customers_see_their_orders_but_not_staff_data(self):
+		mine = self._order(self.customer)
+		self._order(self.other)
+		ids = {(c['entity'], c['id']) for c in self._sync()['changes']}
+		self.assertIn(('order', mine.pk), ids)
+		self.assertEqual({e for e, _ in ids}, {'menu_item', 'order'})
+		staff = User.objects.create_user(username='ned', password='pass12345')
+		Profile.objects.create(user=staff, role='staff')
+		self.client.force_login(staff)
+		entities = [c['entity'] for c in self._sync()['changes']]
+		self.assertEqual(entities.count('order'), 2)
+		self.assertIn('ingredient', entities)
+
+	def test_deletes_and_compaction(self):
+		self.item.save()
+		self.item.save()
+		cursor = self._sync()['next']
+		self.assertEqual(changelog.compact(), 2)
+		self.assertEqual(SyncChange.objects.filter(entity='menu_item').count(), 1)
+		pk = self.item.pk
+		self.item.delete()
+		body = self._sync(cursor)
+		self.assertEqual([(c['id'], c['op'], c['data']) for c in body['changes']], [(pk, 'delete', None)])
+
+	def _voucher_ops(self, since, voucher):
+		return [c['op'] for c in self._sync(since)['changes'] if c['entity'] == 'voucher' and c['id'] == voucher.pk]
+
+	def test_dead_vouchers_sync_as_deletes(self):
+		voucher = Voucher.objects.create(code='SYNC10', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('10.00'))
+		cursor = self._sync()['next']
+		voucher.active = False
+		voucher.save()
+		self.assertEqual(self._voucher_ops(cursor, voucher), ['delete'])
+
+	def test_using_up_a_voucher_syncs_a_delete(self):
+		voucher = Voucher.objects.create(code='LAST1', discount_type=Voucher.DISCOUNT_FIXED, amount=Decimal('10.00'), usage_limit=2, used_count=1)
+		cursor = self._sync()['next']
+		self.assertEqual(self._voucher_ops(cursor, voucher), [])
+		persist_order(build_order(self.customer, {
+			'type': 'dine-in', 'voucherCode': 'LAST1', 'items': [{'menuItemId': self.item.pk, 'quantity': 1}],
+		}))
+		self.assertEqual(self._voucher_ops(cursor, voucher), ['delete'])
+
+	def test_pages_follow_limit(self):
+		for _ in range(3):
+			MenuItem.objects.create(name='Extra', price=Decimal('1.00'))
+		first = self._sync(limit=2)
+		self.assertTrue(first['more'])
+		rest = self._sync(first['next'], limit=10)
+		self.assertFalse(rest['more'])
+		self.assertEqual(len(first['changes']) + len(rest['changes']), 4)
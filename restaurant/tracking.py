@@ -0,0 +1,152 @@
+"""
+Live rider positions for order tracking.
+
+Riders post GPS pings several times a second. Each active assignment keeps
+its recent pings in a ``LocationRing``: a fixed-size ``array('d')`` of
+``(timestamp, lat, lng, accuracy)`` slots written round-robin, so a ping is
+a few float stores with no allocation and memory per order is fixed.
+Tracking reads are answered from the ring without touching the database.
+
+Only one ping per ``PERSIST_INTERVAL`` seconds per assignment is written to
+``RiderLocation``, as a durable (downsampled) trail for support and for
+processes that have not seen the live pings.
+
+The rider -> active orders mapping is cached for ``ACTIVE_TTL`` seconds and
+dropped by ``dispatch`` whenever the rider's assignments change. An order's
+ring is closed as soon as it reaches a ``TERMINAL_STATUSES`` status, whether
+through ``dispatch`` (hand-over) or ``transitions`` (e.g. a cancel). Like the
+event hub this state is per process; with several workers, route a rider's
+pings and the tracking reads to the same one or rely on the persisted trail.
+"""
+import threading
+import time
+from array import array
+
+from .models import Order, RiderAssignment, RiderLocation
+
+RING_CAPACITY = 128
+PERSIST_INTERVAL = 30.0
+ACTIVE_TTL = 15.0
+ACTIVE_STATUSES = ('accepted', 'delivering')
+TERMINAL_STATUSES = (Order.STATUS_COMPLETED, Order.STATUS_CANCELLED)
+
+_FIELDS = 4  # timestamp, lat, lng, accuracy
+_NO_ACCURACY = -1.0
+
+
+class LocationRing:
+	"""Fixed-capacity ring of pings for one order."""
+
+	__slots__ = ('order_id', 'rider_id', 'customer_id', 'data', 'capacity', 'head', 'count', 'persisted_at')
+
+	def __init__(self, order_id, rider_id, customer_id, capacity: int = RING_CAPACITY):
+		self.order_id = order_id
+		self.rider_id = rider_id
+		self.customer_id = customer_id
+		self.capacity = capacity
+		self.data = array('d', bytes(8 * _FIELDS * capacity))
+		self.head = 0
+		self.count = 0
+		self.persisted_at = 0.0
+
+	def push(self, ts: float, lat: float, lng: float, accuracy=None):
+		i = self.head * _FIELDS
+		data = self.data
+		data[i] = ts
+		data[i + 1] = lat
+		data[i + 2] = lng
+		data[i + 3] = _NO_ACCURACY if accuracy is None else accuracy
+		self.head = (self.head + 1) % self.capacity
+		if self.count < self.capacity:
+			self.count += 1
+
+	def _point(self, slot):
+		i = slot * _FIELDS
+		ts, lat, lng, accuracy = self.data[i:i + _FIELDS]
+		return {'ts': ts, 'lat': lat, 'lng': lng, 'accuracy': None if accuracy == _NO_ACCURACY else accuracy}
+
+	def latest(self):
+		if not self.count:
+			return None
+		return self._point((self.head - 1) % self.capacity)
+
+	def recent(self, n: int):
+		"""Up to ``n`` most recent pings, oldest first."""
+		n = min(n, self.count)
+		return [self._point((self.head - n + k) % self.capacity) for k in range(n)]
+
+
+class LocationStore:
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._rings = {}
+		# rider_id -> (expires_at, [(order_id, customer_id), ...])
+		self._active = {}
+
+	def _active_orders(self, rider_id):
+		now = time.monotonic()
+		cached = self._active.get(rider_id)
+		if cached and cached[0] > now:
+			return cached[1]
+		orders = list(
+			RiderAssignment.objects.filter(rider_id=rider_id, status__in=ACTIVE_STATUSES)
+			.exclude(order__status__in=TERMINAL_STATUSES)
+			.values_list('order_id', 'order__user_id')
+		)
+		self._active[rider_id] = (now + ACTIVE_TTL, orders)
+		return orders
+
+	def record(self, rider_id, points):
+		"""
+		Store ``[(ts, lat, lng, accuracy), ...]`` (oldest first) for the rider's active orders.
+
+		Returns the order ids the pings were recorded against.
+		"""
+		orders = self._active_orders(rider_id)
+		if not orders or not points:
+			return []
+		due = []
+		with self._lock:
+			for order_id, customer_id in orders:
+				ring = self._rings.get(order_id)
+				if ring is None or ring.rider_id != rider_id:
+					ring = self._rings[order_id] = LocationRing(order_id, rider_id, customer_id)
+				for ts, lat, lng, accuracy in points:
+					ring.push(ts, lat, lng, accuracy)
+					if ts - ring.persisted_at >= PERSIST_INTERVAL:
+						ring.persisted_at = ts
+						due.append(RiderLocation.from_ping(order_id, rider_id, ts, lat, lng, accuracy))
+		if due:
+			RiderLocation.objects.bulk_create(due)
+		return [order_id for order_id, _ in orders]
+
+	def ring(self, order_id):
+		return self._rings.get(order_id)
+
+	def forget_rider(self, rider_id):
+		"""Drop the cached active orders, e.g. after a claim or hand-over."""
+		self._active.pop(rider_id, None)
+
+	def close(self, order_id):
+		self.close_orders([order_id])
+
+	def close_orders(self, order_ids):
+		"""Drop the rings of finished orders and every cached rider mapping that still lists them."""
+		closed = set(order_ids)
+		with self._lock:
+			for order_id in closed:
+				self._rings.pop(order_id, None)
+		for rider_id, (_, orders) in list(self._active.items()):
+			if any(order_id in closed for order_id, _ in orders):
+				self._active.pop(rider_id, None)
+
+
+store = LocationStore()
+
+
+def last_persisted(order_id):
+	"""Newest persisted ping for an order, for processes without a live ring."""
+	row = RiderLocation.objects.filter(order_id=order_id).order_by('-recorded_at').first()
+	if row is None:
+		return None
+	return {'ts': row.recorded_at.timestamp(), 'lat': row.lat, 'lng': row.lng, 'accuracy': row.accuracy}
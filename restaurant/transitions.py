@@ -0,0 +1,142 @@
+"""
+Order status state machine and bulk transitions.
+
+``TRANSITIONS`` is the full graph of allowed status moves; ``ROLE_TRANSITIONS``
+says which of those moves each role may make. Customers may only touch their
+own orders; riders go through ``restaurant.dispatch`` instead.
+
+``transition_orders`` moves many orders to one target status with one
+conditional UPDATE per distinct source status (``WHERE id IN (...) AND
+status = <source>``), so a concurrent change to any order simply makes it
+miss the UPDATE instead of being overwritten. Together with the initial read
+and the closing read that tells winners from losers, a batch costs
+O(statuses) queries whatever its size. Every order that actually moved gets
+its own ``order.status`` event and ``OrderStatusEvent`` row, the rows written
+with one ``bulk_create``. Cancelled orders get their stock and voucher uses
+back in the same transaction (``orders.release_orders``).
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import changelog, dispatch, events, history, tracking
+from .models import Order
+from .orders import release_orders
+
+TRANSITIONS = {
+	Order.STATUS_PENDING: {Order.STATUS_PREPARING, Order.STATUS_CANCELLED},
+	Order.STATUS_PREPARING: {Order.STATUS_READY, Order.STATUS_CANCELLED},
+	Order.STATUS_READY: {
+		Order.STATUS_DELIVERING,
+		Order.STATUS_WAITING_PAYMENT,
+		Order.STATUS_PAID,
+		Order.STATUS_COMPLETED,
+		Order.STATUS_CANCELLED,
+	},
+	Order.STATUS_DELIVERING: {Order.STATUS_COMPLETED, Order.STATUS_WAITING_PAYMENT},
+	Order.STATUS_WAITING_PAYMENT: {Order.STATUS_PAID, Order.STATUS_CANCELLED},
+	Order.STATUS_PAID: {Order.STATUS_COMPLETED},
+	Order.STATUS_COMPLETED: set(),
+	Order.STATUS_CANCELLED: set(),
+}
+
+_ALL = {(source, target) for source, targets in TRANSITIONS.items() for target in targets}
+
+ROLE_TRANSITIONS = {
+	'admin': _ALL,
+	'staff': _ALL,
+	'chef': {
+		(Order.STATUS_PENDING, Order.STATUS_PREPARING),
+		(Order.STATUS_PREPARING, Order.STATUS_READY),
+		(Order.STATUS_PENDING, Order.STATUS_CANCELLED),
+		(Order.STATUS_PREPARING, Order.STATUS_CANCELLED),
+	},
+	# Riders move their orders through restaurant.dispatch (pick-up, hand-over),
+	# which keeps the RiderAssignment in step with the order; staff moves past
+	# those steps bring the assignment along (dispatch.follow_orders)
+	'rider': set(),
+	'customer': {(Order.STATUS_PENDING, Order.STATUS_CANCELLED)},
+}
+
+# Outcomes
+OK = 'ok'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not_found'
+NOT_ALLOWED = 'not_allowed'
+CONFLICT = 'conflict'
+
+
+def allowed(role: str, source: str, target: str) -> bool:
+	return (source, target) in ROLE_TRANSITIONS.get(role, ())
+
+
+def _scope(user, role):
+	"""Orders ``user`` may transition at all."""
+	qs = Order.objects.all()
+	if role == 'customer':
+		qs = qs.filter(user=user)
+	return qs
+
+
+@dataclass
+class Outcome:
+	order_id: int
+	outcome: str
+	previous: str = None
+	status: str = None
+
+	def as_dict(self):
+		return {'id': self.order_id, 'outcome': self.outcome, 'previous': self.previous, 'status': self.status}
+
+
+def transition_orders(user, role: str, order_ids, target: str):
+	"""Move ``order_ids`` to ``target`` as ``role``; returns one ``Outcome`` per id, in input order."""
+	if target not in TRANSITIONS:
+		raise ValueError(f'Unknown status: {target}')
+	order_ids = list(dict.fromkeys(order_ids))
+	scope = _scope(user, role)
+	current = dict(scope.filter(pk__in=order_ids).values_list('id', 'status'))
+
+	outcomes = {}
+	by_source = {}
+	for pk in order_ids:
+		status = current.get(pk)
+		if status is None:
+			outcomes[pk] = Outcome(pk, NOT_FOUND)
+		elif status == target:
+			outcomes[pk] = Outcome(pk, UNCHANGED, status, status)
+		elif not allowed(role, status, target):
+			outcomes[pk] = Outcome(pk, NOT_ALLOWED, status, status)
+		else:
+			by_source.setdefault(status, []).append(pk)
+
+	if by_source:
+		now = timezone.now()
+		with transaction.atomic():
+			for source, ids in by_source.items():
+				scope.filter(pk__in=ids, status=source).update(status=target, updated_at=now)
+			# The stamp is unique to this call, so it picks out exactly our writes
+			moved = {
+				o.pk: o for o in Order.objects.filter(
+					pk__in=[pk for ids in by_source.values() for pk in ids], status=target, updated_at=now,
+				)
+			}
+			changes = []
+			for source, ids in by_source.items():
+				for pk in ids:
+					order = moved.get(pk)
+					if order is None:
+						outcomes[pk] = Outcome(pk, CONFLICT, source)
+						continue
+					outcomes[pk] = Outcome(pk, OK, source, target)
+					events.order_status_changed(order, source)
+					changes.append((order, source, target))
+			history.record(changes, at=now)
+			changelog.record_orders([order for order, _, _ in changes])
+			dispatch.follow_orders([order.pk for order, _, _ in changes], target, now)
+			if target == Order.STATUS_CANCELLED and changes:
+				release_orders([order.pk for order, _, _ in changes])
+		if target in tracking.TERMINAL_STATUSES:
+			tracking.store.close_orders([order.pk for order, _, _ in changes])
+	return [outcomes[pk] for pk in order_ids]
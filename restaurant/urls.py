@@ -19,11 +19,25 @@ urlpatterns = [
     path('app-admin/', views.admin_panel, name='admin_panel'),
     # API endpoints
     path('api/orders/', views.api_orders_create, name='api_orders_create'),
+    path('api/orders/batch', views.api_orders_batch, name='api_orders_batch'),
+    path('api/orders/transition', views.api_orders_transition, name='api_orders_transition'),
     path('api/orders/my', views.api_orders_my, name='api_orders_my'),
+    path('api/kitchen/queue', views.api_kitchen_queue, name='api_kitchen_queue'),
+    path('api/catalog', views.api_catalog, name='api_catalog'),
+    path('api/sync', views.api_sync, name='api_sync'),
+    path('api/menu/availability', views.api_menu_availability, name='api_menu_availability'),
+    path('api/cart/quote', views.api_cart_quote, name='api_cart_quote'),
     path('api/vouchers/validate/', views.api_vouchers_validate, name='api_vouchers_validate'),
+    path('api/vouchers/best', views.api_vouchers_best, name='api_vouchers_best'),
+    path('api/orders/<int:order_id>/tracking', views.api_order_tracking, name='api_order_tracking'),
+    path('api/rider/location', views.api_rider_location, name='api_rider_location'),
     path('api/rider/jobs/available', views.api_rider_jobs_available, name='api_rider_jobs_available'),
+    path('api/rider/jobs/nearby', views.api_rider_jobs_nearby, name='api_rider_jobs_nearby'),
+    path('api/rider/batches', views.api_rider_batches, name='api_rider_batches'),
+    path('api/rider/batches/accept', views.api_rider_batch_accept, name='api_rider_batch_accept'),
     path('api/rider/jobs/<int:order_id>/accept', views.api_rider_accept, name='api_rider_accept'),
     path('api/rider/jobs/<int:order_id>/picked', views.api_rider_picked, name='api_rider_picked'),
     path('api/rider/jobs/<int:order_id>/complete', views.api_rider_complete, name='api_rider_complete'),
+    path('api/events', views.api_events, name='api_events'),
     path('api/admin/health', views.api_admin_health, name='api_admin_health'),
 ]
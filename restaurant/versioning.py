@@ -0,0 +1,36 @@
+"""
+Cache-backed version counters for process-local caches.
+
+Each in-memory cache (menu snapshot, voucher lookups, ...) remembers the
+version it was built for and rebuilds when the counter moves. Counters live in
+the Django cache so that, with a shared cache backend, a bump in one worker
+process invalidates every other worker too.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _new_version():
+	return time.time_ns()
+
+
+def get_version(key: str) -> int:
+	version = cache.get(key)
+	if version is None:
+		cache.add(key, _new_version(), timeout=None)
+		version = cache.get(key)
+	return version
+
+
+def bump_version(key: str):
+	def _bump():
+		try:
+			cache.incr(key)
+		except ValueError:
+			cache.set(key, _new_version(), timeout=None)
+	_bump()
+	# Bump again on commit so a cache rebuilt while the writing
+	# transaction was still open is thrown away too.
+	transaction.on_commit(_bump)
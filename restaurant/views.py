@@ -1,28 +1,47 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import authenticate, login, logout as dj_logout
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate, alogin, login, logout as dj_logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_GET, require_POST
-from decimal import Decimal
+from django.views.decorators.http import etag, require_GET, require_POST
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+import base64
+import binascii
+import hashlib
+import time
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_datetime
 from .models import (
 	Profile,
 	Order,
-	OrderItem,
-	Voucher,
-	Payment,
-	RiderAssignment,
-	MenuCategory,
-	MenuItem,
-	Ingredient,
-	FoodSet,
-	SetItem,
-	Address,
-	InventoryTransaction,
 )
+from . import backends, batching, catalog, counters, dispatch, eta, events, geo, hashing, kitchen, sync, tracking, transitions
+from .availability import sellable_menu
+from .orders import OrderPayloadError, build_order, order_summary, persist_order, persist_orders
+from .pricing import PricingError, quote_cart
+from .roles import role_home, role_required
+from .vouchers import VoucherUnavailable, apply_voucher, best_voucher, find_voucher
 from django.utils import timezone
-from django.db.models import Count
+
+# Upper bound on orders accepted by one /api/orders/batch or /api/orders/transition call
+ORDER_BATCH_MAX = 500
+# Page size for /api/orders/my
+ORDERS_PAGE_DEFAULT = 100
+ORDERS_PAGE_MAX = 200
+# /api/rider/jobs/nearby search radius (km) and result size
+NEARBY_RADIUS_DEFAULT = 5.0
+NEARBY_RADIUS_MAX = 50.0
+NEARBY_LIMIT_DEFAULT = 20
+NEARBY_LIMIT_MAX = 100
+# /api/rider/location: pings per request and tolerated client clock skew (s)
+LOCATION_POINTS_MAX = 100
+LOCATION_MAX_SKEW = 300
 
 
 def home(request):
@@ -35,56 +54,55 @@ def home(request):
 	})
 
 
-def login_page(request):
-	"""Dedicated login landing page shown first on refresh."""
+async def _render(request, template, context, status=200):
+	# Context processors may touch the session or user lazily, which is sync-only
+	return await sync_to_async(render)(request, template, context, status=status)
+
+
+async def _busy(request, page_title, error_key):
+	"""Shed a login/register while the hashing pool is saturated."""
+	response = await _render(request, 'restaurant/login.html', {
+		'page_title': page_title,
+		error_key: 'ระบบมีผู้เข้าสู่ระบบจำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่',
+	}, status=503)
+	response['Retry-After'] = '1'
+	return response
+
+
+async def login_page(request):
+	"""
+	Dedicated login landing page shown first on refresh.
+
+	Async so the password check waits on the hashing pool (``restaurant.hashing``)
+	without holding a worker thread; a full pool answers 503 at once.
+	"""
 	if request.method == 'POST':
 		identifier = request.POST.get('loginEmail', '').strip()
 		password = request.POST.get('loginPassword', '')
 		role = request.POST.get('loginRole', 'customer')
 
-		user = None
-		if '@' in identifier:
-			try:
-				user = User.objects.get(email__iexact=identifier)
-			except User.DoesNotExist:
-				user = None
-		elif identifier.isdigit():
-			# Lookup by phone on profile
-			try:
-				profile = Profile.objects.select_related('user').get(phone=identifier)
-				user = profile.user
-			except Profile.DoesNotExist:
-				user = None
-		else:
-			try:
-				user = User.objects.get(username__iexact=identifier)
-			except User.DoesNotExist:
-				user = None
-
-		if user is not None:
-			auth_user = authenticate(request, username=user.username, password=password)
-		else:
-			auth_user = None
+		# Resolves email, phone or username and loads the profile in one query
+		try:
+			auth_user = await aauthenticate(request, username=identifier, password=password)
+		except hashing.Overloaded:
+			return await _busy(request, 'เข้าสู่ระบบ', 'login_error')
 
 		if auth_user is not None:
-			login(request, auth_user)
-			# Ensure profile exists and optionally update role to selected (only if none yet)
-			profile, created = Profile.objects.get_or_create(user=auth_user)
-			if created and role:
-				profile.role = role
-				profile.save()
+			# Ensure profile exists and optionally update role to selected (only if none yet);
+			# before login so the session records the role (restaurant.sessions)
+			profile = getattr(auth_user, 'profile', None)
+			if profile is None:
+				profile = await Profile.objects.acreate(user=auth_user, role=role or 'customer')
+			await alogin(request, auth_user)
 			# Redirect by profile role
-			target_role = profile.role if profile else 'customer'
-			if target_role == 'admin':
-				return redirect('admin_panel')
-			return redirect(f'/{target_role}/')
+			return redirect(role_home(profile.role))
 		else:
-			return render(request, 'restaurant/login.html', {
+			return await _render(request, 'restaurant/login.html', {
 				'page_title': 'เข้าสู่ระบบ',
 				'login_error': 'บัญชีหรือรหัสผ่านไม่ถูกต้อง',
 			})
 	# GET
-	return render(request, 'restaurant/login.html', {
+	return await _render(request, 'restaurant/login.html', {
 		'page_title': 'เข้าสู่ระบบ'
 	})
 
@@ -116,12 +134,24 @@ def login_demo(request, role: str):
 		profile.role = role
 		profile.save(update_fields=['role'])
 	# Directly log the user in using the default auth backend
-	login(request, user, backend='django.contrib.auth.backends.ModelBackend')
-	if role == 'admin':
-		return redirect('admin_panel')
-	return redirect(f'/{role}/')
+	login(request, user, backend=backends.BACKEND)
+	return redirect(role_home(role))
+
+def _create_account(username, email, encoded_password, first_name, last_name, role, phone):
+	with transaction.atomic():
+		user = User.objects.create(
+			username=User.normalize_username(username),
+			email=User.objects.normalize_email(email),
+			password=encoded_password,
+			first_name=first_name,
+			last_name=last_name,
+		)
+		profile = Profile.objects.create(user=user, role=role, phone=phone)
+	return user, profile
+
 
-def register(request):
+async def register(request):
+	"""Create an account; the password is hashed on the hashing pool like at login."""
 	if request.method == 'POST':
 		username = request.POST.get('registerUsername', '').strip()
 		email = request.POST.get('registerEmail', '').strip()
@@ -133,31 +163,30 @@ def register(request):
 		last_name = request.POST.get('registerLastName', '').strip()
 
 		if not username or not password or password != confirm:
-			return render(request, 'restaurant/login.html', {
+			return await _render(request, 'restaurant/login.html', {
 				'page_title': 'สมัครสมาชิก',
 				'register_error': 'ข้อมูลไม่ครบถ้วนหรือรหัสผ่านไม่ตรงกัน',
 			})
-		if User.objects.filter(username__iexact=username).exists():
-			return render(request, 'restaurant/login.html', {
+		taken = User.objects.alias(username_lower=Lower('username')).filter(username_lower=username.lower())
+		if await taken.aexists():
+			return await _render(request, 'restaurant/login.html', {
 				'page_title': 'สมัครสมาชิก',
 				'register_error': 'Username นี้ถูกใช้แล้ว',
 			})
 
-		user = User.objects.create_user(username=username, email=email, password=password, first_name=first_name, last_name=last_name)
-		profile = Profile.objects.create(user=user, role=role, phone=phone or None)
-		login(request, user)
-		if profile.role == 'admin':
-			return redirect('admin_panel')
-		return redirect(f'/{profile.role}/')
+		try:
+			encoded = await hashing.pool.run(hashing.hash_password, password)
+		except hashing.Overloaded:
+			return await _busy(request, 'สมัครสมาชิก', 'register_error')
+		user, profile = await sync_to_async(_create_account)(username, email, encoded, first_name, last_name, role, phone)
+		await alogin(request, user, backend=backends.BACKEND)
+		return redirect(role_home(profile.role))
 	# GET fallback to login page
 	return redirect('login')
 
 
-@login_required(login_url='/login/')
+@role_required('customer')
 def customer(request):
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role != 'customer':
-		return redirect(f'/{profile.role}/')
 	return render(request, 'restaurant/home.html', {
 		'initial_role': 'customer',
 		'page_title': 'ลูกค้า - ระบบจัดการร้านอาหาร',
@@ -166,11 +195,8 @@ def customer(request):
 	})
 
 
-@login_required(login_url='/login/')
+@role_required('staff')
 def staff(request):
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role != 'staff':
-		return redirect(f'/{profile.role}/')
 	return render(request, 'restaurant/home.html', {
 		'initial_role': 'staff',
 		'page_title': 'พนักงาน - ระบบจัดการร้านอาหาร',
@@ -179,11 +205,8 @@ def staff(request):
 	})
 
 
-@login_required(login_url='/login/')
+@role_required('chef')
 def chef(request):
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role != 'chef':
-		return redirect(f'/{profile.role}/')
 	return render(request, 'restaurant/home.html', {
 		'initial_role': 'chef',
 		'page_title': 'เชฟ - ระบบจัดการร้านอาหาร',
@@ -192,11 +215,8 @@ def chef(request):
 	})
 
 
-@login_required(login_url='/login/')
+@role_required('rider')
 def rider(request):
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role != 'rider':
-		return redirect(f'/{profile.role}/')
 	return render(request, 'restaurant/home.html', {
 		'initial_role': 'rider',
 		'page_title': 'ไรเดอร์ - ระบบจัดการร้านอาหาร',
@@ -205,11 +225,8 @@ def rider(request):
 	})
 
 
-@login_required(login_url='/login/')
+@role_required('admin')
 def admin_panel(request):
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role != 'admin':
-		return redirect(f'/{profile.role}/')
 	return render(request, 'restaurant/home.html', {
 		'initial_role': 'admin',
 		'page_title': 'แอดมิน - ระบบจัดการร้านอาหาร',
@@ -239,41 +256,11 @@ def _parse_json(request):
 		return {}
 
 
-def _apply_voucher(voucher: Voucher | None, subtotal: Decimal, delivery_fee: Decimal):
-	discount = Decimal('0.00')
-	free_ship = False
-	if not voucher:
-		return discount, delivery_fee, free_ship
-	now = timezone.now()
-	if not voucher.active:
-		return discount, delivery_fee, free_ship
-	if voucher.start_at and voucher.start_at > now:
-		return discount, delivery_fee, free_ship
-	if voucher.end_at and voucher.end_at < now:
-		return discount, delivery_fee, free_ship
-	if subtotal < (voucher.min_spend or Decimal('0.00')):
-		return discount, delivery_fee, free_ship
-	if voucher.discount_type == Voucher.DISCOUNT_PERCENT:
-		discount = (subtotal * (voucher.amount or Decimal('0.00')) / Decimal('100')).quantize(Decimal('0.01'))
-	elif voucher.discount_type == Voucher.DISCOUNT_FIXED:
-		discount = (voucher.amount or Decimal('0.00'))
-	elif voucher.discount_type == Voucher.DISCOUNT_FREE_SHIP:
-		free_ship = True
-	if voucher.max_discount and discount > voucher.max_discount:
-		discount = voucher.max_discount
-	if free_ship:
-		delivery_fee = Decimal('0.00')
-	if discount < 0:
-		discount = Decimal('0.00')
-	return discount, delivery_fee, free_ship
-
-
-@csrf_exempt
-@require_POST
-def api_orders_create(request):
-	if not request.user.is_authenticated:
-		return HttpResponseForbidden('Authentication required')
-	payload = _parse_json(request)
+def _extract_order_data(payload):
+	"""Unwrap the order object from the payload shapes the clients send."""
+	if not isinstance(payload, dict):
+		# build_order rejects it as an invalid payload
+		return payload
 	# Allow both adapters: raw order or wrapper with data JSON
 	order_data = payload.get('order')
 	if not order_data and 'data' in payload:
@@ -285,93 +272,323 @@ def api_orders_create(request):
 	if not order_data:
 		# Some callers post the order object directly (no wrapper)
 		order_data = payload
-	if not isinstance(order_data, dict):
-		return HttpResponseBadRequest('Invalid order payload')
-
-	# Extract fields with safe defaults
-	order_type = order_data.get('type') or order_data.get('order_type') or 'delivery'
-	address_text = order_data.get('address') or order_data.get('address_text') or ''
-	table_number = order_data.get('tableNumber') or ''
-	lat = order_data.get('lat')
-	lng = order_data.get('lng')
-	voucher_code = order_data.get('voucherCode')
-	items = order_data.get('items') or []
-	subtotal = Decimal(str(order_data.get('subtotal') or '0'))
-	delivery_fee = Decimal(str(order_data.get('deliveryFee') or '0'))
-
-	voucher = None
-	if voucher_code:
-		try:
-			voucher = Voucher.objects.get(code__iexact=voucher_code)
-		except Voucher.DoesNotExist:
-			voucher = None
-
-	discount, eff_delivery_fee, _ = _apply_voucher(voucher, subtotal, delivery_fee)
-	total = (subtotal - discount + eff_delivery_fee).quantize(Decimal('0.01'))
-
-	order = Order.objects.create(
-		user=request.user,
-		order_type=order_type,
-		table_number=table_number or '',
-		address_text=address_text or '',
-		lat=lat if isinstance(lat, (int, float)) else None,
-		lng=lng if isinstance(lng, (int, float)) else None,
-		subtotal=subtotal,
-		delivery_fee=eff_delivery_fee,
-		discount_amount=discount,
-		total=total,
-		status=Order.STATUS_PENDING,
-		voucher=voucher,
-	)
-
-	for it in items:
-		name = it.get('name') or ''
-		qty = int(it.get('quantity') or 1)
-		unit_price = Decimal(str(it.get('price') or '0'))
-		total_price = (unit_price * qty).quantize(Decimal('0.01'))
-		OrderItem.objects.create(
-			order=order,
-			menu_item=None,
-			food_set=None,
-			quantity=qty,
-			unit_price=unit_price,
-			total_price=total_price,
-			note=(it.get('note') or '')[:255],
-		)
-
-	# Create basic payment record
-	method_raw = (order_data.get('paymentMethod') or '').lower()
-	method = Payment.METHOD_QR if method_raw == 'qr' else Payment.METHOD_CASH
-	Payment.objects.create(order=order, method=method, amount=total, status='unpaid')
+	return order_data
 
-	# Create rider assignment for delivery/takeaway
-	if order_type in (Order.TYPE_DELIVERY, Order.TYPE_TAKEAWAY):
-		RiderAssignment.objects.create(order=order, status='available')
 
-	return JsonResponse({
+def _order_result(order):
+	return {
 		'id': order.pk,
 		'status': order.status,
 		'total': str(order.total),
+	}
+
+
+@csrf_exempt
+@require_POST
+def api_orders_create(request):
+	if not request.user.is_authenticated:
+		return HttpResponseForbidden('Authentication required')
+	payload = _parse_json(request)
+	order_data = _extract_order_data(payload)
+	try:
+		draft = build_order(request.user, order_data)
+	except OrderPayloadError as exc:
+		return HttpResponseBadRequest(str(exc))
+	try:
+		order = persist_order(draft)
+	except VoucherUnavailable as exc:
+		return JsonResponse({'error': str(exc)}, status=409)
+	return JsonResponse(_order_result(order))
+
+
+@csrf_exempt
+@require_POST
+def api_orders_batch(request):
+	"""Create many orders at once (e.g. a POS replaying its offline queue)."""
+	if not request.user.is_authenticated:
+		return HttpResponseForbidden('Authentication required')
+	payload = _parse_json(request)
+	entries = payload.get('orders') if isinstance(payload, dict) else None
+	if not isinstance(entries, list) or not entries:
+		return HttpResponseBadRequest('orders must be a non-empty list')
+	if len(entries) > ORDER_BATCH_MAX:
+		return HttpResponseBadRequest(f'At most {ORDER_BATCH_MAX} orders per batch')
+
+	results = [None] * len(entries)
+	drafts, positions = [], []
+	for idx, entry in enumerate(entries):
+		order_data = _extract_order_data(entry) if isinstance(entry, dict) else entry
+		try:
+			drafts.append(build_order(request.user, order_data))
+			positions.append(idx)
+		except OrderPayloadError as exc:
+			results[idx] = {'index': idx, 'ok': False, 'error': str(exc)}
+
+	for idx, (draft, error) in zip(positions, persist_orders(drafts)):
+		res = {'index': idx, 'ok': error is None}
+		if draft.client_ref:
+			res['client_ref'] = draft.client_ref
+		if error is None:
+			res.update(_order_result(draft.order))
+		else:
+			res['error'] = error
+		results[idx] = res
+	return JsonResponse({
+		'results': results,
+		'created': sum(1 for r in results if r['ok']),
+		'failed': sum(1 for r in results if not r['ok']),
 	})
 
 
+@csrf_exempt
+@require_POST
+def api_cart_quote(request):
+	"""Price a cart server-side without creating an order."""
+	if not request.user.is_authenticated:
+		return HttpResponseForbidden('Authentication required')
+	payload = _parse_json(request)
+	if not isinstance(payload, dict):
+		return HttpResponseBadRequest('Expected a JSON object')
+	order_type = payload.get('type') or payload.get('order_type') or 'delivery'
+	voucher = find_voucher(payload.get('voucherCode'))
+	try:
+		quote = quote_cart(payload.get('items') or [], order_type, voucher)
+	except PricingError as exc:
+		return JsonResponse({'ok': False, 'errors': exc.errors}, status=400)
+	return JsonResponse({'ok': True, **quote.as_dict()})
+
+
+@require_GET
+def api_menu_availability(request):
+	"""
+	Sellable menu item and set ids; clients revalidate with If-None-Match.
+
+	The ETag hashes the id lists themselves rather than the menu version: the
+	version lives in a per-process cache, so a snapshot rebuilt after another
+	worker's change can carry new availability under the same version.
+	"""
+	menu = sellable_menu()
+	ids = f"{menu['items']}|{menu['sets']}".encode('ascii')
+	tag = f'"{hashlib.sha256(ids).hexdigest()[:32]}"'
+	response = get_conditional_response(request, etag=tag)
+	if response is None:
+		response = JsonResponse(menu)
+	response.headers['ETag'] = tag
+	return response
+
+
+@require_GET
+def api_catalog(request):
+	"""
+	Categories, sellable items, active sets and public vouchers.
+
+	Served from pre-serialized bytes (gzipped when the client accepts it) with
+	a strong ETag, so a client holding the current catalog gets a 304.
+	"""
+	current = catalog.get_catalog()
+	gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+	# Each encoding is its own representation and gets its own strong tag
+	tag = f'"{current.etag}-gz"' if gzipped else f'"{current.etag}"'
+	response = get_conditional_response(request, etag=tag)
+	if response is None:
+		response = HttpResponse(current.gzipped if gzipped else current.body, content_type='application/json')
+		if gzipped:
+			response.headers['Content-Encoding'] = 'gzip'
+	response.headers['ETag'] = tag
+	response.headers['Cache-Control'] = 'no-cache'
+	patch_vary_headers(response, ('Accept-Encoding',))
+	return response
+
+
+def _encode_cursor(stamp, pk):
+	raw = f'{stamp.isoformat()}|{pk}'.encode('ascii')
+	return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+	"""``(datetime, id)`` from a cursor token; ``ValueError`` if it is malformed."""
+	try:
+		raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('ascii')
+		stamp, pk = raw.split('|')
+		stamp = parse_datetime(stamp)
+		pk = int(pk)
+	except (ValueError, UnicodeDecodeError, binascii.Error):
+		raise ValueError('Invalid cursor')
+	if stamp is None:
+		raise ValueError('Invalid cursor')
+	return stamp, pk
+
+
+def _my_orders_etag(request):
+	"""Fingerprint of the caller's orders plus the query, from one aggregate."""
+	if not request.user.is_authenticated:
+		return None
+	state = Order.objects.filter(user=request.user).aggregate(n=Count('id'), last=Max('updated_at'))
+	last = state['last'].isoformat() if state['last'] else ''
+	raw = f"{request.user.pk}|{state['n']}|{last}|{request.GET.urlencode()}"
+	return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
 @login_required(login_url='/login/')
 @require_GET
+@etag(_my_orders_etag)
 def api_orders_my(request):
-	qs = Order.objects.filter(user=request.user).order_by('-created_at')[:100]
-	data = []
-	for o in qs:
-		data.append({
+	"""
+	The caller's orders, newest first, ``limit`` per page.
+
+	Pages continue from ``cursor`` (the previous ``next_cursor``) by keyset on
+	``(created_at, id)``. With ``updated_since`` only orders changed after that
+	instant are returned, oldest change first, keyed on ``(updated_at, id)``;
+	clients store ``sync_token`` and send it back as the next ``updated_since``.
+	"""
+	try:
+		limit = int(request.GET.get('limit') or ORDERS_PAGE_DEFAULT)
+	except ValueError:
+		return HttpResponseBadRequest('Invalid limit')
+	limit = max(1, min(limit, ORDERS_PAGE_MAX))
+	cursor = request.GET.get('cursor')
+	try:
+		after = _decode_cursor(cursor) if cursor else None
+	except ValueError:
+		return HttpResponseBadRequest('Invalid cursor')
+	since = request.GET.get('updated_since')
+
+	qs = Order.objects.filter(user=request.user)
+	if since:
+		since = parse_datetime(since)
+		if since is None:
+			return HttpResponseBadRequest('Invalid updated_since')
+		if timezone.is_naive(since):
+			since = timezone.make_aware(since)
+		key = 'updated_at'
+		qs = qs.filter(updated_at__gt=since).order_by('updated_at', 'id')
+		if after:
+			qs = qs.filter(Q(updated_at__gt=after[0]) | Q(updated_at=after[0], id__gt=after[1]))
+	else:
+		key = 'created_at'
+		qs = qs.order_by('-created_at', '-id')
+		if after:
+			qs = qs.filter(Q(created_at__lt=after[0]) | Q(created_at=after[0], id__lt=after[1]))
+
+	# One extra row tells whether another page exists
+	rows = list(qs[:limit + 1])
+	page = rows[:limit]
+	data = [order_summary(o) for o in page]
+	body = {
+		'orders': data,
+		'next_cursor': _encode_cursor(getattr(page[-1], key), page[-1].pk) if len(rows) > limit else None,
+	}
+	if since:
+		body['sync_token'] = (page[-1].updated_at if page else since).isoformat()
+	return JsonResponse(body)
+
+
+@login_required(login_url='/login/')
+@require_GET
+def api_sync(request):
+	"""
+	Changes after ``?since=<seq>`` (``0`` for everything), oldest first.
+
+	Clients apply ``changes`` and send ``next`` back as ``since``; while
+	``more`` is true another page is waiting.
+	"""
+	try:
+		since = max(0, int(request.GET.get('since') or 0))
+		limit = int(request.GET.get('limit') or sync.SYNC_PAGE_DEFAULT)
+	except ValueError:
+		return HttpResponseBadRequest('Invalid since or limit')
+	limit = max(1, min(limit, sync.SYNC_PAGE_MAX))
+	return JsonResponse(sync.changes_since(request.user, request.role or 'customer', since, limit))
+
+
+KITCHEN_ROLES = ('chef', 'staff', 'admin')
+
+
+def _kitchen_etag(request):
+	if request.role not in KITCHEN_ROLES:
+		return None
+	return f'{kitchen.queue_fingerprint()}|{request.GET.urlencode()}'
+
+
+@role_required(*KITCHEN_ROLES, message='Kitchen only')
+@require_GET
+@etag(_kitchen_etag)
+def api_kitchen_queue(request):
+	"""
+	Pending/preparing orders plus the aggregated cook list for the kitchen display.
+
+	``?since=<iso>`` limits ``orders`` to those changed after that instant;
+	``queue`` always lists every queued order id so the display can drop the
+	ones that left.
+	"""
+	since = request.GET.get('since')
+	if since:
+		since = parse_datetime(since)
+		if since is None:
+			return HttpResponseBadRequest('Invalid since')
+		if timezone.is_naive(since):
+			since = timezone.make_aware(since)
+	orders = []
+	for o in kitchen.queue_orders(since or None):
+		orders.append({
 			'id': o.pk,
 			'order_type': o.order_type,
 			'status': o.status,
-			'subtotal': str(o.subtotal),
-			'delivery_fee': str(o.delivery_fee),
-			'discount_amount': str(o.discount_amount),
-			'total': str(o.total),
+			'table_number': o.table_number,
 			'created_at': o.created_at.isoformat(),
+			'updated_at': o.updated_at.isoformat(),
+			'items': [
+				{
+					'name': it.menu_item.name if it.menu_item else (it.food_set.name if it.food_set else ''),
+					'quantity': it.quantity,
+					'note': it.note,
+				}
+				for it in o.items.all()
+			],
 		})
-	return JsonResponse({'orders': data})
+	return JsonResponse({
+		'orders': orders,
+		'queue': kitchen.queue_ids(),
+		'cook_list': kitchen.cook_list(),
+		'server_time': timezone.now().isoformat(),
+	})
+
+
+@csrf_exempt
+@require_POST
+def api_orders_transition(request):
+	"""
+	Move many orders to one status: ``{"orders": [ids], "status": "ready"}``.
+
+	Each order gets an outcome (ok, unchanged, not_found, not_allowed,
+	conflict); see ``restaurant.transitions`` for who may make which move.
+	"""
+	if not request.user.is_authenticated:
+		return HttpResponseForbidden('Authentication required')
+	payload = _parse_json(request)
+	if not isinstance(payload, dict):
+		return HttpResponseBadRequest('Expected a JSON object')
+	order_ids = payload.get('orders')
+	target = payload.get('status')
+	if not isinstance(order_ids, list) or not order_ids or not all(isinstance(pk, int) for pk in order_ids):
+		return HttpResponseBadRequest('orders must be a non-empty list of ids')
+	if len(order_ids) > ORDER_BATCH_MAX:
+		return HttpResponseBadRequest(f'At most {ORDER_BATCH_MAX} orders per request')
+	if target not in transitions.TRANSITIONS:
+		return HttpResponseBadRequest('Invalid status')
+	results = transitions.transition_orders(request.user, request.role or 'customer', order_ids, target)
+	return JsonResponse({
+		'results': [r.as_dict() for r in results],
+		'changed': sum(1 for r in results if r.outcome == transitions.OK),
+	})
+
+
+def _amount(value):
+	"""A finite ``Decimal`` from a JSON amount; raises ``InvalidOperation`` otherwise."""
+	amount = Decimal(str(value or '0'))
+	if not amount.is_finite():
+		raise InvalidOperation(value)
+	return amount
 
 
 @csrf_exempt
@@ -380,16 +597,16 @@ def api_vouchers_validate(request):
 	if not request.user.is_authenticated:
 		return HttpResponseForbidden('Authentication required')
 	payload = _parse_json(request)
+	if not isinstance(payload, dict):
+		return HttpResponseBadRequest('Expected a JSON object')
 	code = (payload.get('code') or '').strip()
-	subtotal = Decimal(str(payload.get('subtotal') or '0'))
-	delivery_fee = Decimal(str(payload.get('delivery_fee') or '0'))
-	voucher = None
-	if code:
-		try:
-			voucher = Voucher.objects.get(code__iexact=code)
-		except Voucher.DoesNotExist:
-			voucher = None
-	discount, eff_delivery_fee, free_ship = _apply_voucher(voucher, subtotal, delivery_fee)
+	try:
+		subtotal = _amount(payload.get('subtotal'))
+		delivery_fee = _amount(payload.get('delivery_fee'))
+	except InvalidOperation:
+		return HttpResponseBadRequest('Invalid amounts')
+	voucher = find_voucher(code)
+	discount, eff_delivery_fee, free_ship = apply_voucher(voucher, subtotal, delivery_fee)
 	return JsonResponse({
 		'valid': voucher is not None,
 		'discount': str(discount),
@@ -398,7 +615,32 @@ def api_vouchers_validate(request):
 	})
 
 
-@login_required(login_url='/login/')
+@csrf_exempt
+@require_POST
+def api_vouchers_best(request):
+	"""Return the public voucher that gives this cart the biggest saving."""
+	if not request.user.is_authenticated:
+		return HttpResponseForbidden('Authentication required')
+	payload = _parse_json(request)
+	if not isinstance(payload, dict):
+		return HttpResponseBadRequest('Expected a JSON object')
+	try:
+		subtotal = _amount(payload.get('subtotal'))
+		delivery_fee = _amount(payload.get('delivery_fee'))
+	except InvalidOperation:
+		return HttpResponseBadRequest('Invalid amounts')
+	voucher, discount, eff_delivery_fee, free_ship, eligible = best_voucher(subtotal, delivery_fee)
+	return JsonResponse({
+		'code': voucher.code if voucher else None,
+		'discount': str(discount),
+		'delivery_fee': str(eff_delivery_fee),
+		'free_ship': free_ship,
+		'saving': str(discount + (delivery_fee - eff_delivery_fee)),
+		'eligible': eligible,
+	})
+
+
+@role_required('rider', message='Riders only')
 @require_GET
 def api_rider_jobs_available(request):
 	# rider sees both delivery and takeaway orders that are ready
@@ -409,91 +651,224 @@ def api_rider_jobs_available(request):
 	return JsonResponse({'jobs': jobs})
 
 
+@role_required('rider', message='Riders only')
+@require_GET
+def api_rider_jobs_nearby(request):
+	"""Open jobs nearest to the rider, ``?lat=&lng=`` with optional ``radius`` (km) and ``limit``."""
+	try:
+		lat = float(request.GET['lat'])
+		lng = float(request.GET['lng'])
+		radius = float(request.GET.get('radius') or NEARBY_RADIUS_DEFAULT)
+		limit = int(request.GET.get('limit') or NEARBY_LIMIT_DEFAULT)
+	except (KeyError, ValueError):
+		return HttpResponseBadRequest('lat and lng are required numbers')
+	if not geo.valid_point(lat, lng) or radius <= 0:
+		return HttpResponseBadRequest('Invalid location')
+	radius = min(radius, NEARBY_RADIUS_MAX)
+	limit = max(1, min(limit, NEARBY_LIMIT_MAX))
+	jobs = []
+	for distance, o in dispatch.nearby_jobs(lat, lng, radius, limit):
+		jobs.append({
+			'id': o['id'],
+			'order_type': o['order_type'],
+			'total': str(o['total']),
+			'address': o['address_text'],
+			'lat': o['lat'],
+			'lng': o['lng'],
+			'distance_km': round(distance, 3),
+		})
+	return JsonResponse({'jobs': jobs})
+
+
+@role_required('rider', message='Riders only')
+@require_GET
+def api_rider_batches(request):
+	"""Open delivery orders grouped into multi-drop runs, stops in route order."""
+	data = []
+	for batch in batching.build_batches(batching.open_stops()):
+		data.append({
+			'key': batch.key,
+			'orders': batch.order_ids,
+			'stops': [{'id': s.order_id, 'lat': s.lat, 'lng': s.lng} for s in batch.stops],
+			'distance_km': round(batch.distance_km, 3),
+		})
+	return JsonResponse({'batches': data})
+
+
 @csrf_exempt
 @require_POST
-def api_rider_accept(request, order_id: int):
-	if not request.user.is_authenticated:
-		return HttpResponseForbidden('Authentication required')
+@role_required('rider', message='Riders only')
+def api_rider_batch_accept(request):
+	"""Claim every order of a batch (``{"orders": [ids]}``) or none of them."""
+	order_ids = _parse_json(request).get('orders')
+	if not isinstance(order_ids, list) or not order_ids or not all(isinstance(pk, int) for pk in order_ids):
+		return HttpResponseBadRequest('orders must be a non-empty list of ids')
+	return _dispatch_response(dispatch.claim_batch(order_ids, request.user))
+
+
+def _parse_ping(raw, now):
+	"""``(ts, lat, lng, accuracy)`` from a client ping; ``ValueError`` if unusable."""
+	lat, lng = raw.get('lat'), raw.get('lng')
+	if not geo.valid_point(lat, lng):
+		raise ValueError('Invalid location')
+	accuracy = raw.get('accuracy')
+	if not isinstance(accuracy, (int, float)) or accuracy < 0:
+		accuracy = None
+	ts = raw.get('ts')
+	# Client clocks drift: trust them only within the skew window
+	if not isinstance(ts, (int, float)) or abs(ts - now) > LOCATION_MAX_SKEW:
+		ts = now
+	return float(ts), float(lat), float(lng), accuracy
+
+
+@csrf_exempt
+@require_POST
+@role_required('rider', message='Riders only')
+def api_rider_location(request):
+	"""
+	GPS ping(s) from a rider: ``{lat, lng, accuracy?, ts?}`` or ``{"points": [...]}``.
+
+	Pings are kept in memory for the rider's active orders; see ``restaurant.tracking``.
+	"""
+	payload = _parse_json(request)
+	if not isinstance(payload, dict):
+		return HttpResponseBadRequest('Expected a JSON object')
+	raw_points = payload.get('points') if 'points' in payload else [payload]
+	if not isinstance(raw_points, list) or not raw_points or len(raw_points) > LOCATION_POINTS_MAX:
+		return HttpResponseBadRequest('Invalid points')
+	now = time.time()
 	try:
-		order = Order.objects.get(pk=order_id)
-	except Order.DoesNotExist:
+		points = sorted((_parse_ping(p, now) for p in raw_points if isinstance(p, dict)), key=lambda p: p[0])
+	except ValueError as exc:
+		return HttpResponseBadRequest(str(exc))
+	if not points:
+		return HttpResponseBadRequest('Invalid points')
+	order_ids = tracking.store.record(request.user.pk, points)
+	return JsonResponse({'ok': True, 'accepted': len(points), 'orders': order_ids})
+
+
+def _eta_payload(order_id):
+	estimate = eta.model.eta(order_id)
+	if estimate is None:
+		return None
+	seconds, status = estimate
+	return {'seconds': round(seconds), 'status': status, 'at': (timezone.now() + timedelta(seconds=seconds)).isoformat()}
+
+
+@login_required(login_url='/login/')
+@require_GET
+def api_order_tracking(request, order_id: int):
+	"""
+	Latest rider position for an order (``?trail=N`` adds the last N pings) and
+	its ETA, both served from memory.
+	"""
+	try:
+		trail = max(0, min(int(request.GET.get('trail') or 0), tracking.RING_CAPACITY))
+	except ValueError:
+		return HttpResponseBadRequest('Invalid trail')
+	ring = tracking.store.ring(order_id)
+	if ring is not None:
+		if request.user.pk not in (ring.customer_id, ring.rider_id) and request.role not in ('staff', 'admin'):
+			return HttpResponseForbidden('Not your order')
+		return JsonResponse({
+			'order_id': order_id,
+			'position': ring.latest(),
+			'trail': ring.recent(trail) if trail else [],
+			'eta': _eta_payload(order_id),
+			'source': 'memory',
+		})
+	# No live pings in this process: fall back to the persisted trail
+	owner = Order.objects.filter(pk=order_id).values_list('user_id', 'rider_assignment__rider_id').first()
+	if owner is None:
 		return HttpResponseBadRequest('Order not found')
-	ra, _ = RiderAssignment.objects.get_or_create(order=order)
-	if ra.rider and ra.rider != request.user:
-		return HttpResponseForbidden('Already accepted by another rider')
-	ra.rider = request.user
-	ra.accepted_at = timezone.now()
-	ra.status = 'accepted'
-	ra.save()
-	return JsonResponse({'ok': True})
+	if request.user.pk not in owner and request.role not in ('staff', 'admin'):
+		return HttpResponseForbidden('Not your order')
+	return JsonResponse({
+		'order_id': order_id,
+		'position': tracking.last_persisted(order_id),
+		'trail': [],
+		'eta': _eta_payload(order_id),
+		'source': 'db',
+	})
+
+
+# Dispatch outcome -> (HTTP status, message) for the rider endpoints
+_DISPATCH_ERRORS = {
+	dispatch.NOT_FOUND: (400, 'Order not found'),
+	dispatch.TAKEN: (409, 'Already accepted by another rider'),
+	dispatch.NOT_CLAIMABLE: (409, 'Job is not available'),
+	dispatch.NOT_YOURS: (403, 'Not your assignment'),
+	dispatch.OUT_OF_ORDER: (409, 'Assignment is not at that step'),
+}
+
+
+def _dispatch_response(outcome):
+	if outcome in _DISPATCH_ERRORS:
+		status, message = _DISPATCH_ERRORS[outcome]
+		return JsonResponse({'ok': False, 'error': message, 'outcome': outcome}, status=status)
+	return JsonResponse({'ok': True, 'outcome': outcome})
+
+
+@csrf_exempt
+@require_POST
+@role_required('rider', message='Riders only')
+def api_rider_accept(request, order_id: int):
+	return _dispatch_response(dispatch.claim_job(order_id, request.user))
 
 
 @csrf_exempt
 @require_POST
+@role_required('rider', message='Riders only')
 def api_rider_picked(request, order_id: int):
-	if not request.user.is_authenticated:
-		return HttpResponseForbidden('Authentication required')
-	try:
-		order = Order.objects.get(pk=order_id)
-	except Order.DoesNotExist:
-		return HttpResponseBadRequest('Order not found')
-	ra, _ = RiderAssignment.objects.get_or_create(order=order)
-	if ra.rider != request.user:
-		return HttpResponseForbidden('Not your assignment')
-	ra.picked_at = timezone.now()
-	ra.status = 'delivering'
-	ra.save()
-	order.status = Order.STATUS_DELIVERING
-	order.save(update_fields=['status'])
-	return JsonResponse({'ok': True})
+	return _dispatch_response(dispatch.pick_up(order_id, request.user))
 
 
 @csrf_exempt
 @require_POST
+@role_required('rider', message='Riders only')
 def api_rider_complete(request, order_id: int):
-	if not request.user.is_authenticated:
-		return HttpResponseForbidden('Authentication required')
-	try:
-		order = Order.objects.get(pk=order_id)
-	except Order.DoesNotExist:
-		return HttpResponseBadRequest('Order not found')
-	ra, _ = RiderAssignment.objects.get_or_create(order=order)
-	if ra.rider != request.user:
-		return HttpResponseForbidden('Not your assignment')
-	ra.delivered_at = timezone.now()
-	ra.status = 'completed'
-	ra.save()
-	order.status = Order.STATUS_COMPLETED
-	order.save(update_fields=['status'])
-	return JsonResponse({'ok': True})
+	return _dispatch_response(dispatch.complete(order_id, request.user))
 
 
-@login_required(login_url='/login/')
+@require_GET
+async def api_events(request):
+	"""
+	Server-Sent Events stream of order, job and rider-assignment changes.
+
+	Needs an ASGI server (``rest.asgi``); each connection holds no thread.
+	``?orders=1,2`` narrows the stream to those orders (e.g. a tracking page);
+	``Last-Event-ID`` (or ``?lastEventId=``) resumes after a reconnect.
+	"""
+	user = await request.auser()
+	if not user.is_authenticated:
+		return HttpResponseForbidden('Authentication required')
+	role = await Profile.objects.filter(user=user).values_list('role', flat=True).afirst()
+	order_ids = None
+	if request.GET.get('orders'):
+		try:
+			order_ids = {int(x) for x in request.GET['orders'].split(',') if x.strip()}
+		except ValueError:
+			return HttpResponseBadRequest('Invalid orders')
+	last_id = request.headers.get('Last-Event-ID') or request.GET.get('lastEventId')
+	try:
+		last_id = int(last_id) if last_id else None
+	except ValueError:
+		last_id = None
+	topics = events.topics_for(user.pk, role or 'customer')
+	response = StreamingHttpResponse(events.stream(topics, order_ids, last_id), content_type='text/event-stream')
+	response['Cache-Control'] = 'no-cache'
+	# Stop reverse proxies from buffering the stream
+	response['X-Accel-Buffering'] = 'no'
+	return response
+
+
+@role_required('admin', message='Admin only')
 @require_GET
 def api_admin_health(request):
 	"""Return high-level data health info for the admin dashboard."""
-	# Only admin role
-	prof = getattr(request.user, 'profile', None)
-	if not prof or prof.role != 'admin':
-		return HttpResponseForbidden('Admin only')
-	# Counts
-	counts = {
-		'users': User.objects.count(),
-		'profiles': Profile.objects.count(),
-		'profiles_by_role': dict(Profile.objects.values('role').annotate(c=Count('id')).values_list('role', 'c')),
-		'categories': MenuCategory.objects.count(),
-		'menu_items': MenuItem.objects.count(),
-		'ingredients': Ingredient.objects.count(),
-		'food_sets': FoodSet.objects.count(),
-		'set_items': SetItem.objects.count(),
-		'vouchers': Voucher.objects.count(),
-		'addresses': Address.objects.count(),
-		'orders': Order.objects.count(),
-		'order_items': OrderItem.objects.count(),
-		'payments': Payment.objects.count(),
-		'rider_assignments': RiderAssignment.objects.count(),
-		'inventory_transactions': InventoryTransaction.objects.count(),
-	}
+	# Maintained counters instead of one COUNT(*) per table
+	counts, by_role, meta = counters.cached_read()
+	counts['profiles_by_role'] = by_role
 	# Simple recommendations when core data are empty
 	warnings = []
 	if counts['categories'] == 0:
@@ -506,4 +881,4 @@ def api_admin_health(request):
 		warnings.append('ยังไม่มีคูปองส่วนลด (Voucher)')
 	if counts['orders'] == 0:
 		warnings.append('ยังไม่มีออเดอร์ (Order) ในระบบ')
-	return JsonResponse({'counts': counts, 'warnings': warnings})
+	return JsonResponse({'counts': counts, 'warnings': warnings, 'meta': meta, 'hash_pool': hashing.pool.stats()})
@@ -0,0 +1,349 @@
+"""
+Voucher rules, lookups and redemption.
+
+Lookups go through ``VoucherCache``: a process-local map of normalized code to
+``Voucher`` with a TTL, dropped whenever the ``voucher_version`` counter moves
+(bumped by signals and by bulk writers such as ``generate_vouchers``). A Bloom
+filter over every known code answers "this code does not exist" without a
+query, which keeps brute-force typing off the database.
+"""
+import bisect
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import changelog
+from .bloom import BloomFilter
+from .catalog import bump_catalog_version
+from .models import SyncChange, Voucher, VoucherRedemption
+from .versioning import bump_version, get_version
+
+VOUCHER_VERSION_KEY = 'restaurant:voucher_version'
+# Seconds a cached voucher is trusted when no invalidation reached this process
+VOUCHER_CACHE_TTL = 60
+# Rebuild the code filter at least this often (seconds), even without a bump,
+# so codes created in another worker are found even with a per-process cache
+VOUCHER_FILTER_MAX_AGE = 60
+
+
+class VoucherUnavailable(Exception):
+	"""Raised when a voucher has no redemptions left (or was switched off)."""
+
+
+def apply_voucher(voucher: Voucher | None, subtotal: Decimal, delivery_fee: Decimal):
+	"""Return ``(discount, effective_delivery_fee, free_ship)`` for a voucher on a cart."""
+	discount = Decimal('0.00')
+	free_ship = False
+	if not voucher:
+		return discount, delivery_fee, free_ship
+	now = timezone.now()
+	if not voucher.active:
+		return discount, delivery_fee, free_ship
+	if voucher.start_at and voucher.start_at > now:
+		return discount, delivery_fee, free_ship
+	if voucher.end_at and voucher.end_at < now:
+		return discount, delivery_fee, free_ship
+	if voucher.usage_limit and voucher.used_count >= voucher.usage_limit:
+		return discount, delivery_fee, free_ship
+	if subtotal < (voucher.min_spend or Decimal('0.00')):
+		return discount, delivery_fee, free_ship
+	if voucher.discount_type == Voucher.DISCOUNT_PERCENT:
+		discount = (subtotal * (voucher.amount or Decimal('0.00')) / Decimal('100')).quantize(Decimal('0.01'))
+	elif voucher.discount_type == Voucher.DISCOUNT_FIXED:
+		discount = (voucher.amount or Decimal('0.00'))
+	elif voucher.discount_type == Voucher.DISCOUNT_FREE_SHIP:
+		free_ship = True
+	if voucher.max_discount and discount > voucher.max_discount:
+		discount = voucher.max_discount
+	if free_ship:
+		delivery_fee = Decimal('0.00')
+	if discount < 0:
+		discount = Decimal('0.00')
+	return discount, delivery_fee, free_ship
+
+
+class VoucherCache:
+	def __init__(self, ttl: float = VOUCHER_CACHE_TTL, filter_max_age: float = VOUCHER_FILTER_MAX_AGE):
+		self.ttl = ttl
+		self.filter_max_age = filter_max_age
+		self._lock = threading.Lock()
+		self._entries = {}
+		self._version = None
+		self._filter = None
+		self._filter_built_at = 0.0
+
+	def _sync_version(self):
+		version = get_version(VOUCHER_VERSION_KEY)
+		if version != self._version:
+			with self._lock:
+				if version != self._version:
+					self._entries = {}
+					self._filter = None
+					self._version = version
+
+	def _code_filter(self):
+		bloom = self._filter
+		if bloom is not None and time.monotonic() - self._filter_built_at < self.filter_max_age:
+			return bloom
+		with self._lock:
+			if self._filter is None or time.monotonic() - self._filter_built_at >= self.filter_max_age:
+				codes = Voucher.objects.values_list('normalized_code', flat=True)
+				bloom = BloomFilter(capacity=int(codes.count() * 1.2) + 1024)
+				for key in codes.iterator(chunk_size=5000):
+					bloom.add(key)
+				self._filter = bloom
+				self._filter_built_at = time.monotonic()
+			return self._filter
+
+	def get(self, code):
+		key = Voucher.normalize_code(code)
+		if not key:
+			return None
+		self._sync_version()
+		entry = self._entries.get(key)
+		if entry is not None and entry[1] > time.monotonic():
+			return entry[0]
+		if key not in self._code_filter():
+			return None
+		voucher = Voucher.objects.filter(normalized_code=key).first()
+		if voucher is not None:
+			self._entries[key] = (voucher, time.monotonic() + self.ttl)
+		return voucher
+
+	def evict(self, voucher_id: int):
+		for key, (voucher, _) in list(self._entries.items()):
+			if voucher.pk == voucher_id:
+				self._entries.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._entries = {}
+			self._filter = None
+			self._version = None
+
+
+voucher_cache = VoucherCache()
+
+
+def find_voucher(code: str | None):
+	"""Look up a voucher by code (case-insensitive); ``None`` when missing."""
+	return voucher_cache.get(code)
+
+
+def bump_voucher_version():
+	"""Drop cached vouchers and the code filter in every process."""
+	bump_version(VOUCHER_VERSION_KEY)
+
+
+def redeem_voucher(voucher_id: int, count: int = 1) -> bool:
+	"""
+	Consume ``count`` uses of a voucher with one conditional UPDATE.
+
+	The limit check and the increment happen in the same statement, so
+	concurrent checkouts can never push ``used_count`` past ``usage_limit``
+	(0 means unlimited). Returns ``False`` when not enough uses are left.
+	"""
+	updated = (
+		Voucher.objects
+		.filter(pk=voucher_id, active=True)
+		.filter(Q(usage_limit=0) | Q(used_count__lte=F('usage_limit') - count))
+		.update(used_count=F('used_count') + count)
+	)
+	if updated != 1:
+		# Let the next lookup see the exhausted counter
+		voucher_cache.evict(voucher_id)
+		return False
+	publish_usage(voucher_id, count)
+	return True
+
+
+def release_redemptions(order_ids) -> int:
+	"""
+	Give back the voucher uses of ``order_ids`` and delete their redemptions;
+	run inside the cancelling transaction. Returns the number of uses released.
+	"""
+	redemptions = VoucherRedemption.objects.filter(order_id__in=order_ids)
+	counts = Counter(redemptions.values_list('voucher_id', flat=True))
+	if not counts:
+		return 0
+	redemptions.delete()
+	released = 0
+	for voucher_id, count in counts.items():
+		# Never below zero, e.g. after the counter was reset by hand
+		if Voucher.objects.filter(pk=voucher_id, used_count__gte=count).update(used_count=F('used_count') - count):
+			released += count
+			publish_usage(voucher_id, -count)
+		voucher_cache.evict(voucher_id)
+	return released
+
+
+def publish_usage(voucher_id: int, delta: int):
+	"""
+	Tell sync clients and the catalog when moving ``used_count`` by ``delta``
+	used up a public voucher or made it usable again.
+
+	``used_count`` is updated with ``QuerySet.update``, which fires no
+	signals. This check costs one primary-key read.
+	"""
+	row = (
+		Voucher.objects
+		.filter(pk=voucher_id, is_public=True, active=True, usage_limit__gt=0)
+		.values_list('used_count', 'usage_limit')
+		.first()
+	)
+	if row is None:
+		return
+	used, limit = row
+	if (used - delta >= limit) == (used >= limit):
+		return
+	op = SyncChange.OP_DELETE if used >= limit else SyncChange.OP_UPSERT
+	changelog.record(changelog.ENTITY_VOUCHER, [voucher_id], op)
+	bump_catalog_version()
+
+
+class _Candidate:
+	__slots__ = ('voucher', 'min_spend', 'rate', 'saving_cap')
+
+	def __init__(self, voucher):
+		self.voucher = voucher
+		self.min_spend = voucher.min_spend or Decimal('0.00')
+		amount = float(voucher.amount or 0)
+		cap = float(voucher.max_discount or 0) or float('inf')
+		# Plain floats keep the search cheap; the winner is re-priced exactly
+		self.rate = amount / 100.0
+		self.saving_cap = min(amount, cap) if voucher.discount_type == Voucher.DISCOUNT_FIXED else cap
+
+
+class BestVoucherIndex:
+	"""
+	Currently valid public vouchers, arranged for a fast best-saving search.
+
+	A cart may only use vouchers whose ``min_spend`` is at or below its
+	subtotal. Per discount type that is answered without a full scan:
+
+	* fixed: sorted by ``min_spend`` with a running best saving, so the answer
+	  is one bisection;
+	* free shipping: only the lowest ``min_spend`` matters;
+	* percent: sorted by rate, scanned from the top and stopped as soon as
+	  ``subtotal * rate`` cannot beat the best saving found so far.
+
+	The index drops itself when the voucher version moves, when the next
+	``start_at``/``end_at`` boundary passes, or after ``VOUCHER_CACHE_TTL`` so
+	counters bumped by redemptions are picked up.
+	"""
+
+	def __init__(self, ttl: float = VOUCHER_CACHE_TTL):
+		self.ttl = ttl
+		self._lock = threading.Lock()
+		self._state = None
+
+	def _build(self, version):
+		now = timezone.now()
+		qs = (
+			Voucher.objects
+			.filter(is_public=True, active=True)
+			.filter(Q(end_at__isnull=True) | Q(end_at__gt=now))
+			.filter(Q(usage_limit=0) | Q(used_count__lt=F('usage_limit')))
+			.order_by('min_spend', 'id')
+		)
+		fixed, percent, free_ship = [], [], None
+		min_spends, next_boundary = [], None
+		for voucher in qs:
+			if voucher.start_at and voucher.start_at > now:
+				boundary = voucher.start_at
+			else:
+				boundary = voucher.end_at
+				cand = _Candidate(voucher)
+				min_spends.append(cand.min_spend)
+				if voucher.discount_type == Voucher.DISCOUNT_FIXED:
+					fixed.append(cand)
+				elif voucher.discount_type == Voucher.DISCOUNT_PERCENT:
+					percent.append(cand)
+				elif voucher.discount_type == Voucher.DISCOUNT_FREE_SHIP and free_ship is None:
+					free_ship = cand
+			if boundary and (next_boundary is None or boundary < next_boundary):
+				next_boundary = boundary
+
+		# Running best fixed saving along increasing min_spend
+		fixed_best, best = [], None
+		for cand in fixed:
+			if best is None or cand.saving_cap > best.saving_cap:
+				best = cand
+			fixed_best.append(best)
+		percent.sort(key=lambda c: -c.rate)
+		return {
+			'version': version,
+			'expires': time.monotonic() + self.ttl,
+			'boundary': next_boundary,
+			'min_spends': min_spends,
+			'fixed_min_spends': [c.min_spend for c in fixed],
+			'fixed_best': fixed_best,
+			'percent': percent,
+			'free_ship': free_ship,
+		}
+
+	def _fresh(self, state, version):
+		return (
+			state is not None
+			and state['version'] == version
+			and state['expires'] > time.monotonic()
+			and (state['boundary'] is None or state['boundary'] > timezone.now())
+		)
+
+	def _current(self):
+		version = get_version(VOUCHER_VERSION_KEY)
+		state = self._state
+		if self._fresh(state, version):
+			return state
+		with self._lock:
+			state = self._state
+			if not self._fresh(state, version):
+				state = self._build(version)
+				self._state = state
+		return state
+
+	def best(self, subtotal: Decimal, delivery_fee: Decimal):
+		"""Return ``(voucher, eligible_count)``; ``voucher`` is ``None`` if none saves anything."""
+		state = self._current()
+		best, best_saving = None, 0.0
+
+		pos = bisect.bisect_right(state['fixed_min_spends'], subtotal)
+		if pos:
+			cand = state['fixed_best'][pos - 1]
+			best, best_saving = cand.voucher, cand.saving_cap
+
+		cand = state['free_ship']
+		if cand is not None and cand.min_spend <= subtotal and float(delivery_fee) > best_saving:
+			best, best_saving = cand.voucher, float(delivery_fee)
+
+		sub = float(subtotal)
+		for cand in state['percent']:
+			if sub * cand.rate <= best_saving:
+				break
+			if cand.saving_cap <= best_saving or cand.min_spend > subtotal:
+				continue
+			best, best_saving = cand.voucher, min(sub * cand.rate, cand.saving_cap)
+
+		return best, bisect.bisect_right(state['min_spends'], subtotal)
+
+	def clear(self):
+		self._state = None
+
+
+best_voucher_index = BestVoucherIndex()
+
+
+def best_voucher(subtotal: Decimal, delivery_fee: Decimal):
+	"""
+	Pick the public voucher that saves the most on this cart.
+
+	Returns ``(voucher, discount, effective_delivery_fee, free_ship, eligible)``
+	priced by ``apply_voucher``; ``voucher`` is ``None`` when nothing applies.
+	"""
+	voucher, eligible = best_voucher_index.best(subtotal, delivery_fee)
+	discount, eff_delivery_fee, free_ship = apply_voucher(voucher, subtotal, delivery_fee)
+	return voucher, discount, eff_delivery_fee, free_ship, eligible